@@ -16,3 +16,4 @@ def test_all_successful_solvers(solver_class):
         src_model, tgt_model = data_files.full_problem(name)
         r = solve(solver, name, src_model, tgt_model)
         assert r.status in ('DONE', 'PASS'), f'{solver_class.__name__} failed'
+        r.discard_trace()
@@ -12,8 +12,8 @@ class Region:
     pos_max: Pos
 
     def __init__(self, pos1: Pos, pos2: Pos):
-        self.pos_min = pos1.min(pos2)
-        self.pos_max = pos1.max(pos2)
+        self.pos_min = _pos_min(pos1, pos2)
+        self.pos_max = _pos_max(pos1, pos2)
 
     def dimension(self):
         return (self.pos_min.x != self.pos_max.x) + \
@@ -28,7 +28,15 @@ class Region:
 
     def expand(self, pos: Pos):
         '''Expand region to include the specified position.'''
-        self.pos_min = self.pos_min.min(pos)
-        self.pos_max = self.pos_max.max(pos)
+        self.pos_min = _pos_min(self.pos_min, pos)
+        self.pos_max = _pos_max(self.pos_max, pos)
+
+
+def _pos_min(a: Pos, b: Pos) -> Pos:
+    return Pos(min(a.x, b.x), min(a.y, b.y), min(a.z, b.z))
+
+
+def _pos_max(a: Pos, b: Pos) -> Pos:
+    return Pos(max(a.x, b.x), max(a.y, b.y), max(a.z, b.z))
 
 
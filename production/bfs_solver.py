@@ -1,17 +1,16 @@
 import production.model as M
 import production.commands as Cmd
 import sys
+import traceback
 from io import StringIO
-from itertools import chain
 
 from production.emulator import State, process_command
 from production.model import Model
 from production.basics import (Diff, Pos)
 from production import data_files
-from production.solver_interface import ProblemType, Solver, SolverResult, Fail
+from production.solver_interface import ProblemType, Solver, SolverResult, Fail, TraceSink
 from production.solver_utils import *
-from production.model_helpers import floor_contact, filled_neighbors
-from production.search import breadth_first_search
+from production.search import grounded_fill_order
 from production.navigation import navigate_near_voxel, navigate
 
 
@@ -32,7 +31,8 @@ class BFSSolver(Solver):
         assert src_model is None
         m = Model.parse(tgt_model)
         try:
-            trace_data = compose_commands(self.solve_gen(m))
+            with TraceSink() as trace_data:
+                trace_data.extend(self.solve_gen(m))
 
             return SolverResult(trace_data, extra={})
         except KeyboardInterrupt:
@@ -43,31 +43,29 @@ class BFSSolver(Solver):
             return SolverResult(Fail(), extra=dict(tb=exc.getvalue()))
 
     def add_commands(self, new_commands):
+        '''Checks and applies the commands, passing them on.'''
         for command in new_commands:
-            self.commands = chain(self.commands, [command])
             volatile_set, effect = process_command(self.state, self.state.bots[0], command)
             effect()
+            yield command
 
     def finish(self):
         for x in navigate(self.state.bots[0].pos, Pos(0, 0, 0)): yield x
         yield Cmd.Halt()
 
-        
     def solve_gen(self, model: 'Model'):
-        self.commands = iter([])
+        '''Commands of the trace, produced as they are needed.'''
         self.state = State(model.R)
 
-        voxels_to_fill = breadth_first_search(floor_contact(model), filled_neighbors(model))
-
-        for voxel in voxels_to_fill:
+        for voxel in grounded_fill_order(model):
             current_position = self.state.bots[0].pos
-            self.add_commands(navigate_near_voxel(current_position, voxel))
+            yield from self.add_commands(navigate_near_voxel(current_position, voxel))
             current_position = self.state.bots[0].pos
-            self.add_commands([Cmd.Fill(voxel - current_position)])
+            yield from self.add_commands([Cmd.Fill(voxel - current_position)])
+
+        yield from self.add_commands(self.finish())
+
 
-        self.add_commands(self.finish())
-        return self.commands
-        
 if __name__ == '__main__':
     task_number = int(sys.argv[1]) if len(sys.argv) > 1 else 1
 
@@ -78,7 +78,7 @@ class BottomUpSolver(Solver):
         assert src_model is None
         m = Model.parse(tgt_model)
         trace = up_pass(m, high=self.high)
-        trace_data = compose_commands(trace)
+        trace_data = trace.compose()
         return SolverResult(trace_data, extra={})
 
 
@@ -88,7 +88,7 @@ def write_solution(bytetrace, number): # -> IO ()
 
 def solve(strategy, model, number): # -> IO ()
     commands = strategy(model, high=True)
-    trace = compose_commands(commands)
+    trace = commands.compose()
     logger.info(run(lightning_problem_by_id(number), trace))
     write_solution(trace, number)
 
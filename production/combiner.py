@@ -4,7 +4,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from production.solver_interface import ProblemType, Solver, SolverResult, Fail, Pass
-from production.cpp_emulator.emulator import Matrix
+from production.cpp_emulator.run import estimate_energy
 from production import db
 
 _conn = None
@@ -34,11 +34,10 @@ class Combiner(Solver):
         assert name.startswith('FR')
 
         traces = {}
-        energies = {}
         for part in ['ZD', 'ZA']:
             cur.execute('''
                 SELECT
-                    traces.data, energy
+                    traces.data
                 FROM problems
                 JOIN traces
                 ON traces.problem_id = problems.id
@@ -49,12 +48,11 @@ class Combiner(Solver):
             rows = cur.fetchall()
             if not rows:
                 return SolverResult(Pass())
-            [[trace, energy]] = rows
+            [[trace]] = rows
             traces[part] = zlib.decompress(trace)
-            energies[part] = energy
 
-        R = Matrix.parse(src_model).R
         assert traces['ZD'][-1] == 255
+        trace_data = traces['ZD'][:-1] + traces['ZA']
         return SolverResult(
-            traces['ZD'][:-1] + traces['ZA'],
-            dict(expected_energy=energies['ZD'] - 3 * R**3 - 20 + energies['ZA']))
+            trace_data,
+            dict(expected_energy=estimate_energy(src_model, tgt_model, trace_data)))
@@ -1,9 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from functools import update_wrapper
 from typing import Tuple, ClassVar, Dict, Union, Set
 import itertools
 
-from production.basics import Diff, Pos
+from production.basics import Diff, Pos, Region
 
 __all__ = ['parse_command', 'parse_1command', 'parse_commands', 'compose_commands',
         'Halt', 'Wait', 'Flip', 'SMove', 'LMove', 'FusionP', 'FusionS', 'Fission', 'Fill',
@@ -103,8 +103,52 @@ assert len(nd_table) == 18
 
 
 commands_by_id = {}
-def command(cls):
+def command(cls=None, *, interned=True):
+    '''Make cls a frozen dataclass whose instances are interned.
+
+    Calls with all fields passed positionally return one shared instance
+    per distinct value (and argument types, so Fission(d, True) is not
+    Fission(d, 1)), so Wait() or Fill(Diff(0, -1, 0)) don't allocate after
+    the first time. Shared instances are initialized once, in __new__.
+    GFill and GVoid have too many distinct values and are not interned.
+    '''
+    if cls is None:
+        return lambda cls: command(cls, interned=interned)
     res = dataclass(frozen=True)(cls)
+
+    def encoded(self) -> bytes:
+        'Cached bytes(self.compose()).'
+        try:
+            return self.__dict__['_encoded']
+        except KeyError:
+            data = bytes(self.compose())
+            object.__setattr__(self, '_encoded', data)
+            return data
+
+    if interned:
+        num_fields = len(fields(res))
+        init = res.__init__
+        instances = {}
+
+        def __new__(klass, *args, **kwargs):
+            if klass is not res or kwargs or len(args) != num_fields:
+                return object.__new__(klass)
+            key = args + tuple(map(type, args))
+            inst = instances.get(key)
+            if inst is None:
+                inst = object.__new__(klass)
+                init(inst, *args)
+                object.__setattr__(inst, '_interned', True)
+                instances[key] = inst
+            return inst
+
+        def __init__(self, *args, **kwargs):
+            if '_interned' not in self.__dict__:
+                init(self, *args, **kwargs)
+
+        res.__new__ = __new__
+        res.__init__ = __init__
+    res.encoded = encoded
     commands_by_id[cls.bid] = res
     return res
 
@@ -176,7 +220,7 @@ class SMove:
         return [self.bid | ((lld & 0b0110_0000) >> 1), lld & 0b11111]
 
     def volatile(self, source: Pos) -> Set[Pos]:
-        return {pos for pos in Region(source, source + lld)}
+        return {pos for pos in Region(source, source + self.lld)}
 
 
 @command
@@ -300,7 +344,7 @@ class FusionS:
         return {source, source + self.nd}
 
 
-@command
+@command(interned=False)
 class GFill:
     bid : ClassVar = 0b001
     bsize : ClassVar = 4
@@ -318,10 +362,10 @@ class GFill:
         return [self.bid | nd << 3, fd.dx + 30, fd.dy + 30, fd.dz + 30]
 
     def volatile(self, source: Pos) -> Set[Pos]:
-        return {source} | {pos for pos in Region(source + nd, source + nd + fd)}
+        return {source} | {pos for pos in Region(source + self.nd, source + self.nd + self.fd)}
 
 
-@command
+@command(interned=False)
 class GVoid:
     bid : ClassVar = 0b000
     bsize : ClassVar = 4
@@ -339,7 +383,7 @@ class GVoid:
         return [self.bid | nd << 3, fd.dx + 30, fd.dy + 30, fd.dz + 30]
 
     def volatile(self, source: Pos) -> Set[Pos]:
-        return {source} | {pos for pos in Region(source + nd, source + nd + fd)}
+        return {source} | {pos for pos in Region(source + self.nd, source + self.nd + self.fd)}
 
 
 Command = Union[Halt, Wait, Flip, SMove, LMove, FusionP, FusionS, Fission, Fill,
@@ -414,7 +458,7 @@ def compose_commands(commands, res: bytearray = None) -> bytearray:
     if res is None:
         res = bytearray()
     for cmd in commands:
-        res.extend(cmd.compose())
+        res += cmd.encoded()
     return res
 
 #endregion
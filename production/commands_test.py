@@ -1,5 +1,6 @@
 from pathlib import Path
 import pytest
+import numpy as np
 import production.commands as commands
 from production.commands import parse_command, parse_commands, compose_commands, ParserState, Diff, \
     Halt, Wait, Flip, SMove, LMove, FusionP, FusionS, Fission, Fill, Void, GFill, GVoid
@@ -66,6 +67,30 @@ def test_commands_roundtrip():
         assert a == b, f'{a} != {b} at {i}'
 
 
+def test_interning():
+    assert Wait() is Wait()
+    assert Fill(Diff(0, -1, 0)) is Fill(Diff(0, -1, 0))
+    assert Fill(Diff(0, -1, 0)) is not Fill(Diff(0, 1, 0))
+    assert Fill(Diff(0, -1, 0)) is not Void(Diff(0, -1, 0))
+    assert LMove(Diff(1, 0, 0), Diff(0, 2, 0)) is not LMove(Diff(0, 2, 0), Diff(1, 0, 0))
+    assert p(0b11111110) is Wait()
+    assert p(0b00010100, 0b00011011) is SMove(Diff(12, 0, 0))
+    assert Fission(Diff(0, 0, 1), m=5) == Fission(Diff(0, 0, 1), 5)
+    assert GFill(Diff(0, -1, 0), Diff(3, 0, 3)) is not GFill(Diff(0, -1, 0), Diff(3, 0, 3))
+
+    # equal arguments of other types don't touch the shared instance
+    f = Fission(Diff(1, 0, 0), 1)
+    assert Fission(Diff(1, 0, 0), True) is not f
+    assert Fission(Diff(1, 0, 0), np.int64(1)) is not f
+    assert type(f.m) is int
+    assert Fission(Diff(1, 0, 0), 1) is f
+
+    cmd = SMove(Diff(0, 0, -4))
+    assert cmd.encoded() == bytes(cmd.compose()) == bytes([0b00110100, 0b00001011])
+    assert cmd.encoded() is cmd.encoded()
+    assert repr(cmd) == 'SMove(lld=Diff(0, 0, -4))'
+
+
 if __name__ == '__main__':
     import pytest, sys
     sys.exit(pytest.main([__file__, '-v']))
@@ -0,0 +1,235 @@
+'''Re-timing traces to get rid of idle steps.
+
+Solvers synchronize bots conservatively, so traces have long stretches
+where most bots Wait, and every step costs 3 R^3 (30 R^3 with high
+harmonics). compact_trace() moves every command as early as it can go
+without changing what the trace does:
+
+- a bot's commands keep their order, and a new bot starts after its Fission;
+- commands touching the same cell (their volatile sets overlap) keep their
+  order, so every cell sees the same sequence of fills, voids and bots;
+- fusion pairs and GFill/GVoid groups stay together;
+- with low harmonics, a Fill next to a voxel that is already full (or on
+  the floor) only has to come after that voxel and after the last Void;
+  other Fills, Voids and group commands stay together by step and in order
+  with each other, so groundedness holds after every step;
+- steps with a Flip or a Halt stay as they are, and nothing crosses them.
+
+The result is checked with the emulator and only used if it is better.
+'''
+
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from production.basics import Pos, Diff, Region
+from production.commands import *
+from production.trace_decoder import decode_trace
+from production.cpp_emulator.run import run_full
+
+logger = logging.getLogger(__name__)
+
+MAX_BID = 40
+
+MATRIX_COMMANDS = (Fill, Void, GFill, GVoid)
+
+ADJACENT = [Diff(1, 0, 0), Diff(-1, 0, 0), Diff(0, 1, 0), Diff(0, -1, 0), Diff(0, 0, 1), Diff(0, 0, -1)]
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def replay(trace_data: bytes) -> Iterator[Tuple[List[int], Dict[int, Pos], List[Command], Dict[int, int]]]:
+    '''
+    Bids of the bots, where they are, and what they do in every step, plus
+    the bids of the bots made by the step's Fissions (by parent).
+
+    The positions are those before the step; the dict is updated in place
+    once the step is done.
+    '''
+    # bots as the emulator sees them
+    positions = {1: Pos(0, 0, 0)}
+    seeds = {1: list(range(2, MAX_BID + 1))}
+    active = [1]
+
+    for step in decode_trace(trace_data).steps():
+        assert len(step) == len(active), 'incomplete trace'
+        children = {bid: seeds[bid][0] for bid, cmd in zip(active, step) if isinstance(cmd, Fission)}
+        yield active, positions, step, children
+
+        fused = []
+        for bid, cmd in zip(active, step):
+            c = positions[bid]
+            if isinstance(cmd, SMove):
+                positions[bid] = c + cmd.lld
+            elif isinstance(cmd, LMove):
+                positions[bid] = c + cmd.sld1 + cmd.sld2
+            elif isinstance(cmd, Fission):
+                child = children[bid]
+                positions[child] = c + cmd.nd
+                seeds[child] = seeds[bid][1 : cmd.m + 1]
+                seeds[bid] = seeds[bid][cmd.m + 1:]
+            elif isinstance(cmd, (FusionS, Halt)):
+                fused.append(bid)
+        for bid, cmd in zip(active, step):
+            if isinstance(cmd, FusionP):
+                other = [b for b in fused if positions[b] == positions[bid] + cmd.nd]
+                assert len(other) == 1
+                seeds[bid] = sorted(seeds[bid] + [other[0]] + seeds[other[0]])
+        active = sorted(b for b in active + list(children.values()) if b not in fused)
+
+
+def reschedule(trace_data: bytes) -> bytes:
+    '''
+    The same commands, re-timed. Expects a valid trace; see compact_trace()
+    for the checked version.
+    '''
+    high = False
+
+    # new time of the latest command of each bot, or of its Fission
+    bot_time: Dict[int, int] = {1: -1}
+    cell_time: Dict[Pos, int] = {}
+    matrix_time = -1
+    void_time = -1
+    # voxels filled by the trace (and not voided since), with new times
+    filled_at: Dict[Pos, int] = {}
+    floor = 0   # nothing can go before this
+    latest = -1
+
+    # (new time, bid, command), plus when bots appear and disappear
+    scheduled: List[Tuple[int, int, Command]] = []
+    births: Dict[int, List[int]] = {0: [1]}
+    deaths: Dict[int, List[int]] = {}
+
+    for active, positions, step, children in replay(trace_data):
+        barrier = any(isinstance(cmd, (Flip, Halt)) for cmd in step)
+
+        # commands of this step that must go in the same new step
+        members = [(bid, cmd) for bid, cmd in zip(active, step) if not isinstance(cmd, Wait)]
+        parent = list(range(len(members)))
+        cells = []
+        grounding = {}  # i -> the earliest time its Fill is grounded
+        group_keys = {}
+        for i, (bid, cmd) in enumerate(members):
+            c = positions[bid]
+            cells.append(cmd.volatile(c))
+            if not high and not barrier and isinstance(cmd, Fill):
+                p = c + cmd.nd
+                if p.y == 0:
+                    grounding[i] = 0
+                else:
+                    times = [filled_at[p + d] for d in ADJACENT if p + d in filled_at]
+                    if times:
+                        grounding[i] = min(times)
+            keys = []
+            if barrier:
+                keys.append('barrier')
+            if isinstance(cmd, (FusionP, FusionS)):
+                p = c + cmd.nd
+                keys.append(('fusion', min(c, p), max(c, p)))
+            if isinstance(cmd, (GFill, GVoid)):
+                region = Region(c + cmd.nd, c + cmd.nd + cmd.fd)
+                keys.append(('region', type(cmd), region.pos_min, region.pos_max))
+            if not high and isinstance(cmd, MATRIX_COMMANDS) and i not in grounding:
+                keys.append('matrix')
+            for key in keys:
+                j = group_keys.setdefault(key, i)
+                parent[_find(parent, i)] = _find(parent, j)
+
+        groups: Dict[int, List[int]] = {}
+        for i in range(len(members)):
+            groups.setdefault(_find(parent, i), []).append(i)
+
+        for group in groups.values():
+            t = floor
+            if barrier:
+                t = max(t, latest + 1)
+            for i in group:
+                bid, cmd = members[i]
+                t = max(t, bot_time[bid] + 1)
+                for p in cells[i]:
+                    t = max(t, cell_time.get(p, -1) + 1)
+                if i in grounding:
+                    t = max(t, grounding[i], void_time + 1)
+                elif not high and isinstance(cmd, MATRIX_COMMANDS):
+                    t = max(t, matrix_time + 1)
+
+            for i in group:
+                bid, cmd = members[i]
+                scheduled.append((t, bid, cmd))
+                bot_time[bid] = t
+                for p in cells[i]:
+                    cell_time[p] = t
+                c = positions[bid]
+                if isinstance(cmd, Fill):
+                    filled_at.setdefault(c + cmd.nd, t)
+                elif isinstance(cmd, GFill):
+                    for p in Region(c + cmd.nd, c + cmd.nd + cmd.fd):
+                        filled_at.setdefault(p, t)
+                elif isinstance(cmd, Void):
+                    filled_at.pop(c + cmd.nd, None)
+                elif isinstance(cmd, GVoid):
+                    for p in Region(c + cmd.nd, c + cmd.nd + cmd.fd):
+                        filled_at.pop(p, None)
+                if not high and isinstance(cmd, MATRIX_COMMANDS):
+                    matrix_time = max(matrix_time, t)
+                    if isinstance(cmd, (Void, GVoid)):
+                        void_time = t
+            latest = max(latest, t)
+            if barrier:
+                floor = t + 1
+
+        for bid, cmd in zip(active, step):
+            if isinstance(cmd, Flip):
+                high = not high
+            elif isinstance(cmd, Fission):
+                child = children[bid]
+                bot_time[child] = bot_time[bid]
+                births.setdefault(bot_time[bid] + 1, []).append(child)
+            elif isinstance(cmd, (FusionS, Halt)):
+                deaths.setdefault(bot_time[bid], []).append(bid)
+
+    by_step: Dict[int, Dict[int, Command]] = {}
+    for t, bid, cmd in scheduled:
+        by_step.setdefault(t, {})[bid] = cmd
+
+    res = bytearray()
+    wait = Wait().encoded()
+    bots = []
+    for t in range(latest + 1):
+        bots = sorted(bots + births.get(t, []))
+        cmds = by_step.get(t, {})
+        for bid in bots:
+            cmd = cmds.get(bid)
+            res += wait if cmd is None else cmd.encoded()
+        gone = deaths.get(t, [])
+        bots = [b for b in bots if b not in gone]
+    return bytes(res)
+
+
+def compact_trace(
+        src_model: Optional[bytes],
+        tgt_model: Optional[bytes],
+        trace_data: bytes) -> bytes:
+    '''reschedule() if the emulator agrees the result is cheaper.'''
+    before = run_full(src_model, tgt_model, trace_data)
+    if before.energy is None:
+        return trace_data
+    try:
+        compacted = reschedule(trace_data)
+    except Exception:
+        logger.exception('rescheduling failed')
+        return trace_data
+    after = run_full(src_model, tgt_model, compacted)
+    logger.info(
+        f'{before.extra["steps"]} steps, energy {before.energy} -> '
+        f'{after.extra.get("steps")} steps, energy {after.energy}')
+    if after.energy is None:
+        logger.warning(f'compacted trace is broken: {after.extra}')
+        return trace_data
+    if after.energy >= before.energy:
+        return trace_data
+    return compacted
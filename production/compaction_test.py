@@ -0,0 +1,129 @@
+from production.basics import Pos, Diff, Region
+from production.commands import *
+from production.model import Model
+from production.trace_builder import TraceBuilder
+from production.trace_decoder import decode_trace
+from production.compaction import reschedule, compact_trace
+from production.cpp_emulator.run import run_full
+from production.default_solver2 import solve_gen
+from production import data_files
+
+
+def test_idle_steps_removed():
+    tb = TraceBuilder(5)
+    tb.fission(1, Diff(1, 0, 0), 0)
+    tb.add(1, SMove(Diff(0, 0, 3)), SMove(Diff(0, 0, -3)))
+    tb.sync()  # bot 2 needlessly waits for bot 1
+    tb.add(2, SMove(Diff(0, 1, 0)), SMove(Diff(0, -1, 0)))
+    tb.fuse(1, 2)
+    tb.add(1, Halt())
+
+    steps = list(decode_trace(reschedule(bytes(tb.compose()))).steps())
+    assert len(list(tb.steps())) == 7
+    assert steps == [
+        [Fission(Diff(1, 0, 0), 0)],
+        [SMove(Diff(0, 0, 3)), SMove(Diff(0, 1, 0))],
+        [SMove(Diff(0, 0, -3)), SMove(Diff(0, -1, 0))],
+        [FusionP(Diff(1, 0, 0)), FusionS(Diff(-1, 0, 0))],
+        [Halt()],
+    ]
+
+
+def test_grounding_fill_not_moved_before_support():
+    tb = TraceBuilder(5)
+    tb.fission(1, Diff(1, 0, 0), 0)
+    tb.add(2, SMove(Diff(0, 1, 0)), SMove(Diff(0, 1, 0)))
+    tb.add(1, SMove(Diff(0, 0, 2)), Fill(Diff(0, 0, -1)))
+    tb.add(1, SMove(Diff(0, 1, 0)), Fill(Diff(0, 0, -1)))
+    tb.sync()
+    # (1, 1, 1) is only grounded through (0, 1, 1) and (0, 0, 1)
+    tb.add(2, Fill(Diff(0, -1, 1)))
+    tb.add(1, Wait(), SMove(Diff(0, 1, 0)), SMove(Diff(0, 0, -2)))
+    tb.fuse(1, 2)
+    tb.add(1, SMove(Diff(0, -2, 0)), Halt())
+
+    tgt = Model(5)
+    for p in Pos(0, 0, 1), Pos(0, 1, 1), Pos(1, 1, 1):
+        tgt[p] = True
+    tgt_data = tgt.compose()
+    trace_data = bytes(tb.compose())
+    assert run_full(None, tgt_data, trace_data).energy is not None
+
+    compacted = reschedule(trace_data)
+    steps = list(decode_trace(compacted).steps())
+    assert len(steps) < len(list(tb.steps()))
+    # in the same step as its support at the earliest
+    assert steps[4] == [Fill(Diff(0, 0, -1)), Fill(Diff(0, -1, 1))]
+    assert run_full(None, tgt_data, compacted).energy is not None
+
+
+def test_group_commands_stay_together():
+    x = Diff(1, 0, 0)
+    y = Diff(0, 1, 0)
+    z = Diff(0, 0, 1)
+    tb = TraceBuilder(5)
+    tb.add(1, Flip(), SMove(y))
+    b2 = tb.fission(1, x, 2)
+    tb.add(b2, SMove(z))
+    b3 = tb.fission(b2, x, 1)
+    tb.add(b3, SMove(x))
+    b4 = tb.fission(b3, z, 0)
+    tb.add(b4, SMove(z))
+    tb.add(1, SMove(z * 3), SMove(x))
+    tb.sync()
+
+    # every bot names a different corner of (1, 0, 1)-(3, 0, 3)
+    corners = {1: Diff(2, 0, -2), b2: Diff(2, 0, 2), b3: Diff(-2, 0, 2), b4: Diff(-2, 0, -2)}
+    for cls in GFill, GVoid, GFill:
+        for bid, fd in corners.items():
+            tb.add(bid, cls(y * -1, fd))
+
+    tb.add(b4, SMove(z * -1))
+    tb.fuse(b3, b4)
+    tb.add(b3, SMove(x * -1))
+    tb.fuse(b2, b3)
+    tb.add(b2, SMove(z * -1))
+    tb.add(1, SMove(x * -1), SMove(z * -3))
+    tb.fuse(1, b2)
+    tb.add(1, Flip(), SMove(y * -1), Halt())
+
+    tgt = Model(5)
+    for p in Region(Pos(1, 0, 1), Pos(3, 0, 3)):
+        tgt[p] = True
+    tgt_data = tgt.compose()
+    trace_data = bytes(tb.compose())
+    assert run_full(None, tgt_data, trace_data).energy is not None
+
+    compacted = reschedule(trace_data)
+    groups = [
+        [type(cmd) for cmd in step if isinstance(cmd, (GFill, GVoid))]
+        for step in decode_trace(compacted).steps()]
+    assert [g for g in groups if g] == [[GFill] * 4, [GVoid] * 4, [GFill] * 4]
+    assert run_full(None, tgt_data, compacted).energy is not None
+    assert compact_trace(None, tgt_data, trace_data) == compacted
+
+
+def test_default2():
+    src, tgt = data_files.full_problem('FA011')
+    m = Model.parse(tgt)
+    trace_data = bytearray()
+    for cmd in solve_gen(m, 3, 3, low=False):
+        trace_data.extend(cmd.compose())
+    trace_data = bytes(trace_data)
+
+    before = run_full(src, tgt, trace_data)
+    compacted = compact_trace(src, tgt, trace_data)
+    after = run_full(src, tgt, compacted)
+    assert after.energy < before.energy
+    assert after.extra['steps'] < before.extra['steps']
+
+
+def test_keeps_original_when_not_better():
+    # one bot, nothing to move around
+    tgt = Model(3)
+    tgt[Pos(0, 0, 0)] = True
+    trace_data = b''.join(cmd.encoded() for cmd in [
+        SMove(Diff(0, 1, 0)), Fill(Diff(0, -1, 0)), SMove(Diff(0, 0, 1)),
+        SMove(Diff(0, -1, 0)), SMove(Diff(0, 0, -1)), Halt()])
+    assert reschedule(trace_data) == trace_data
+    assert compact_trace(None, tgt.compose(), trace_data) is trace_data
@@ -4,23 +4,35 @@ magic_extension(
     name='emulator',
     sources=[
         'algo.cpp',
+        'batch.cpp',
+        'connectivity.cpp',
         'binding.cpp',
         'binding2.cpp',
         'emulator.cpp',
+        'estimate.cpp',
         'coordinates.cpp',
         'commands.cpp',
         'logger.cpp',
-        'tests.cpp'
+        'planner.cpp',
+        'tests.cpp',
+        'trace_io.cpp',
+        'work_index.cpp'
     ],
     headers=[
         'algo.h',
+        'batch.h',
+        'connectivity.h',
         'emulator.h',
+        'estimate.h',
         'coordinates.h',
         'commands.h',
         'logger.h',
         'matrix.h',
         'debug.h',
+        'planner.h',
         'pretty_printing.h',
-        'tests.h'
+        'tests.h',
+        'trace_io.h',
+        'work_index.h'
     ],
 )
@@ -9,9 +9,9 @@
 #include <vector>
 #include <memory>
 #include <map>
-#include <deque>
 #include <functional>
 #include <algorithm>
+#include <atomic>
 
 using namespace std;
 
@@ -58,18 +58,89 @@ vector<Diff> enum_linear_diffs(const Matrix& m, Pos start, int max_dist) {
     return result;
 }
 
-vector<Diff> enum_move_diffs(const Matrix& m, Pos start) {
-    vector<Diff> result = enum_linear_diffs(m, start, LONG_DISTANCE);
-    for (Diff sld1 : enum_linear_diffs(m, start, SHORT_DISTANCE)) {
-        for (Diff sld2 : enum_linear_diffs(m, start + sld1, SHORT_DISTANCE)) {
-            Diff d = sld1 + sld2;
-            if (d != Diff(0, 0, 0)) {
-                result.push_back(d);
+namespace {
+
+// Scratch space of the BFS, kept between calls (one per thread) so that
+// a search costs O(cells reached) no matter how large R is. A cell is
+// visited (or a target) iff its stamp equals the current generation.
+struct BfsScratch {
+    vector<uint32_t> visited;
+    vector<uint32_t> target;
+    vector<int> parent;  // packed index, for visited cells
+    vector<int> queue;
+    vector<Diff> moves;
+    vector<Diff> moves_buffer;
+    uint32_t gen = 0;
+
+    void start(int R) {
+        size_t n = (size_t)R * R * R;
+        if (visited.size() < n) {
+            visited.assign(n, 0);
+            target.assign(n, 0);
+            parent.resize(n);
+            gen = 0;
+        }
+        if (++gen == 0) {
+            fill(begin(visited), end(visited), 0);
+            fill(begin(target), end(target), 0);
+            gen = 1;
+        }
+        queue.clear();
+    }
+};
+
+BfsScratch& bfs_scratch() {
+    thread_local BfsScratch scratch;
+    return scratch;
+}
+
+}
+
+// All SMove and LMove destinations for which keep(destination) holds.
+template<typename F>
+static void enum_move_diffs(const Matrix& m, Pos start, vector<Diff> &result, F keep) {
+    result.clear();
+    for (Diff dir : DIRS) {
+        Pos p = start + dir;
+        for (int dist = 1; dist <= LONG_DISTANCE && p.is_inside(m.R) && !m.get(p); dist++) {
+            if (keep(p)) {
+                result.push_back(p - start);
             }
+            p += dir;
+        }
+    }
+    for (Diff dir1 : DIRS) {
+        Pos p1 = start + dir1;
+        for (int dist1 = 1; dist1 <= SHORT_DISTANCE && p1.is_inside(m.R) && !m.get(p1); dist1++) {
+            for (Diff dir2 : DIRS) {
+                Pos p2 = p1 + dir2;
+                for (int dist2 = 1; dist2 <= SHORT_DISTANCE && p2.is_inside(m.R) && !m.get(p2); dist2++) {
+                    if (p2 != start && keep(p2)) {
+                        result.push_back(p2 - start);
+                    }
+                    p2 += dir2;
+                }
+            }
+            p1 += dir1;
         }
     }
-    sort(begin(result), end(result), [](Diff d1, Diff d2) { return d1.dy > d2.dy; });
-    return result;
+}
+
+// Upward moves first. A stable counting sort on dy: cheaper than
+// std::sort on ~1000 moves per cell, and ties keep a well-defined order.
+static void sort_moves_upward_first(vector<Diff> &moves, vector<Diff> &buffer) {
+    int count[2 * LONG_DISTANCE + 2] = {};
+    for (Diff d : moves) {
+        count[LONG_DISTANCE - d.dy + 1]++;
+    }
+    for (int i = 1; i < 2 * LONG_DISTANCE + 2; i++) {
+        count[i] += count[i - 1];
+    }
+    buffer.assign(moves.size(), Diff(0, 0, 0));
+    for (Diff d : moves) {
+        buffer[count[LONG_DISTANCE - d.dy]++] = d;
+    }
+    swap(moves, buffer);
 }
 
 shared_ptr<Command> recover_move_command(const Matrix &m, Pos src, Pos dst) {
@@ -88,67 +159,81 @@ shared_ptr<Command> recover_move_command(const Matrix &m, Pos src, Pos dst) {
     return nullptr;
 }
 
-void bfs(const Matrix &m, Pos start, function<bool (Pos, const map<Pos, Pos>&)> visit) {
+// Breadth-first search over the cells reachable by moves, in the scratch
+// prepared by s.start(). Returns the packed index of the first cell
+// (start included) for which found() holds, or -1.
+template<typename F>
+static int bfs(const Matrix &m, Pos start, BfsScratch &s, F found) {
     assert(!m.get(start));
-    map<Pos, Pos> prev;
-    if (!visit(start, prev)) {
-        return;
+    int R = m.R;
+    int start_idx = start.pack(R);
+    if (found(start)) {
+        return start_idx;
     }
-    Matrix visited(m.R);
-    deque<Pos> work = {{start, start}};
-    visited.set(start, true);
+    s.visited[start_idx] = s.gen;
+    s.parent[start_idx] = start_idx;
+    s.queue.push_back(start_idx);
 
-    while (!work.empty()) {
-        Pos p = work.front();
-        work.pop_front();
-
-        for (Diff d : enum_move_diffs(m, p)) {
+    for (size_t head = 0; head < s.queue.size(); head++) {
+        int idx = s.queue[head];
+        Pos p = Pos::unpack(R, idx);
+        // already visited cells would be skipped anyway
+        enum_move_diffs(m, p, s.moves, [&](Pos p2) { return s.visited[p2.pack(R)] != s.gen; });
+        sort_moves_upward_first(s.moves, s.moves_buffer);
+        for (Diff d : s.moves) {
             Pos p2 = p + d;
-            if (!visited.get(p2)) {
-                visited.set(p2, true);
-                prev[p2] = p;
-                work.push_back(p2);
-                if (!visit(p2, prev)) {
-                    return;
+            int idx2 = p2.pack(R);
+            if (s.visited[idx2] != s.gen) {
+                s.visited[idx2] = s.gen;
+                s.parent[idx2] = idx;
+                s.queue.push_back(idx2);
+                if (found(p2)) {
+                    return idx2;
                 }
             }
         }
     }
+    return -1;
 }
 
-vector<shared_ptr<Command>> recover_path(
-        const map<Pos, Pos>& prev, const Matrix &m, Pos start, Pos finish) {
-    Pos p = finish;
+static vector<shared_ptr<Command>> recover_path(
+        const BfsScratch &s, const Matrix &m, Pos start, Pos finish) {
+    int start_idx = start.pack(m.R);
+    int idx = finish.pack(m.R);
     vector<shared_ptr<Command>> result;
-    while (p != start) {
-        Pos p1 = prev.at(p);
-        result.push_back(recover_move_command(m, p1, p));
-        p = p1;
+    while (idx != start_idx) {
+        int prev = s.parent[idx];
+        result.push_back(recover_move_command(m, Pos::unpack(m.R, prev), Pos::unpack(m.R, idx)));
+        idx = prev;
     }
     reverse(begin(result), end(result));
     return result;
 }
 
 
-std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nearest_pred(
-    const Matrix &obstacles, Pos src, std::function<bool(Pos)> pred) {
-    optional<pair<Pos, vector<shared_ptr<Command>>>> result;
-    bfs(obstacles, src, [&](Pos p, const map<Pos, Pos> &prev) {
-        if (pred(p)) {
-            result = make_pair(p, recover_path(prev, obstacles, src, p));
-            return false;
-        }
-        return true;
-    });
-    return result;
+// s.start() must have been called.
+template<typename F>
+static optional<pair<Pos, vector<shared_ptr<Command>>>> path_to_nearest_pred(
+        BfsScratch &s, const Matrix &obstacles, Pos src, F pred) {
+    int found = bfs(obstacles, src, s, pred);
+    if (found < 0) {
+        return nullopt;
+    }
+    Pos dst = Pos::unpack(obstacles.R, found);
+    return make_pair(dst, recover_path(s, obstacles, src, dst));
 }
 
 optional<pair<Pos, vector<shared_ptr<Command>>>> path_to_nearest_of(
     const Matrix &obstacles, Pos src, vector<Pos> dsts) {
-    optional<pair<Pos, vector<shared_ptr<Command>>>> result;
-    sort(begin(dsts), end(dsts));
-    return path_to_nearest_pred(obstacles, src, [&](Pos pos) {
-        return binary_search(begin(dsts), end(dsts), pos);
+    BfsScratch &s = bfs_scratch();
+    s.start(obstacles.R);
+    for (Pos p : dsts) {
+        if (p.is_inside(obstacles.R)) {
+            s.target[p.pack(obstacles.R)] = s.gen;
+        }
+    }
+    return path_to_nearest_pred(s, obstacles, src, [&](Pos pos) {
+        return s.target[pos.pack(obstacles.R)] == s.gen;
     });
 }
 
@@ -169,16 +254,7 @@ bool safe_to_change(const Matrix &mat, Pos pos) {
         return false;
     }
 
-    bool hz[27];
-    for (int dx = -1; dx <= 1; dx++) {
-        for (int dy = -1; dy <= 1; dy++) {
-            for (int dz = -1; dz <= 1; dz++) {
-                Pos p = pos + Diff(dx, dy, dz);
-                hz[9 * (dx + 1) + 3 * (dy + 1) + (dz + 1)] = p.y < 0 || p.is_inside(m.R) && m.get(p);
-            }
-        }
-    }
-    if (can_safely_remove_center(hz)) {
+    if (can_safely_remove_center(neighbourhood_mask(m, pos))) {
         return true;
     }
 
@@ -192,19 +268,22 @@ bool safe_to_change(const Matrix &mat, Pos pos) {
     }
 }
 
-std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nearest_safe_change_point(
-        const Matrix &obstacles, Pos start, const Matrix &src, const Matrix &dst) {
+static std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nearest_safe_change_point(
+        const Matrix &obstacles, Pos start, const ConnectivityIndex &src, const Matrix &dst) {
     auto nds = enum_near_diffs();
-    return path_to_nearest_pred(obstacles, start, [&](Pos pos) {
+    const Matrix &cur = src.matrix();
+    BfsScratch &s = bfs_scratch();
+    s.start(obstacles.R);
+    return path_to_nearest_pred(s, obstacles, start, [&](Pos pos) {
         for (Diff nd : nds) {
             Pos p = pos + nd;
-            if (!p.is_inside(src.R)) {
+            if (!p.is_inside(cur.R)) {
                 continue;
             }
-            if (src.get(p) == dst.get(p)) {
+            if (cur.get(p) == dst.get(p)) {
                 continue;
             }
-            if (!safe_to_change(src, p)) {
+            if (!src.safe_to_change(p)) {
                 continue;
             }
             return true;
@@ -213,6 +292,27 @@ std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nea
     });
 }
 
+std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nearest_safe_change_point(
+        const Matrix &obstacles, Pos start, const Matrix &src, const Matrix &dst) {
+    ConnectivityIndex index(src);
+    return path_to_nearest_safe_change_point(obstacles, start, index, dst);
+}
+
+std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nearest_safe_change_point(
+        const ConnectivityIndex &src, Pos start, const Matrix &dst) {
+    return path_to_nearest_safe_change_point(src.matrix(), start, src, dst);
+}
+
+optional<pair<Pos, vector<shared_ptr<Command>>>> path_to_nearest_work(
+        const WorkIndex &index, Pos start) {
+    const Matrix &obstacles = index.matrix();
+    BfsScratch &s = bfs_scratch();
+    s.start(obstacles.R);
+    return path_to_nearest_pred(s, obstacles, start, [&](Pos pos) {
+        return index.has_work_near(pos);
+    });
+}
+
 
 void _join_roots(uint8_t * pools, uint8_t a, uint8_t b) {
     while (pools[a] != a) a = pools[a];
@@ -274,9 +374,85 @@ int cubic_num_components2(bool q[27]) {
     return result;
 }
 
+// Neighbourhood cells are numbered 9 * (dx + 1) + 3 * (dy + 1) + (dz + 1),
+// the same way as in the bool[27] arrays.
+static uint32_t grow_cubic(uint32_t s) {
+    const uint32_t ALL = (1u << 27) - 1;
+    // cells that have a neighbour in the given direction
+    const uint32_t Z_LO = 0333333333 & ALL;        // dz < 1
+    const uint32_t Z_HI = Z_LO << 1;               // dz > -1
+    const uint32_t Y_LO = 0b000111111000111111000111111;
+    const uint32_t Y_HI = Y_LO << 3;
+    const uint32_t X_LO = (1u << 18) - 1;
+    const uint32_t X_HI = X_LO << 9;
+    return s
+        | (s & Z_LO) << 1 | (s & Z_HI) >> 1
+        | (s & Y_LO) << 3 | (s & Y_HI) >> 3
+        | (s & X_LO) << 9 | (s & X_HI) >> 9;
+}
+
+int cubic_num_components(uint32_t mask) {
+    int result = 0;
+    while (mask) {
+        uint32_t comp = mask & -mask;
+        while (true) {
+            uint32_t next = grow_cubic(comp) & mask;
+            if (next == comp) break;
+            comp = next;
+        }
+        mask &= ~comp;
+        result++;
+    }
+    return result;
+}
+
+static bool compute_can_safely_remove_center(uint32_t mask) {
+    return cubic_num_components(mask) == cubic_num_components(mask & ~(1u << 13));
+}
+
+// Two bits per neighbourhood of 26 cells (center excluded):
+// 0 - not computed yet, 1 - safe, 2 - unsafe.
+// Filled lazily; racing threads would just store the same answer.
+static std::atomic<uint8_t>* removal_cache() {
+    static std::unique_ptr<std::atomic<uint8_t>[]> cache(
+        new std::atomic<uint8_t>[(1 << 26) / 4]());
+    return cache.get();
+}
+
+bool can_safely_remove_center(uint32_t mask) {
+    if (!(mask & (1u << 13))) return true;
+    uint32_t key = (mask & ((1u << 13) - 1)) | (mask >> 14 << 13);
+    std::atomic<uint8_t> &cell = removal_cache()[key / 4];
+    int shift = 2 * (key % 4);
+    uint8_t v = (cell.load(std::memory_order_relaxed) >> shift) & 3;
+    if (v == 0) {
+        v = compute_can_safely_remove_center(mask) ? 1 : 2;
+        cell.fetch_or(v << shift, std::memory_order_relaxed);
+    }
+    return v == 1;
+}
+
+uint32_t neighbourhood_mask(const Matrix &m, Pos pos) {
+    uint32_t mask = 0;
+    int i = 0;
+    for (int dx = -1; dx <= 1; dx++) {
+        for (int dy = -1; dy <= 1; dy++) {
+            for (int dz = -1; dz <= 1; dz++, i++) {
+                Pos p = pos + Diff(dx, dy, dz);
+                // below the floor counts as full
+                if (p.y < 0 || (p.is_inside(m.R) && m.get(p))) {
+                    mask |= 1u << i;
+                }
+            }
+        }
+    }
+    return mask;
+}
+
 bool can_safely_remove_center(bool bytes[27]) {
-    if (!bytes[13]) return true;
-    int components = cubic_num_components2(bytes);
-    bytes[13] = false;
-    return cubic_num_components2(bytes) == components;
+    uint32_t mask = 0;
+    for (int i = 0; i < 27; i++) {
+        if (bytes[i]) mask |= 1u << i;
+    }
+    return can_safely_remove_center(mask);
 }
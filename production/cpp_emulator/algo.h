@@ -3,6 +3,8 @@
 #include "commands.h"
 #include "matrix.h"
 #include "coordinates.h"
+#include "connectivity.h"
+#include "work_index.h"
 
 #include <memory>
 #include <vector>
@@ -21,7 +23,22 @@ std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nea
 std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nearest_safe_change_point(
         const Matrix &obstacles, Pos start, const Matrix &src, const Matrix &dst);
 
+// Obstacles and the current state of the model both come from the index.
+std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nearest_safe_change_point(
+        const ConnectivityIndex &src, Pos start, const Matrix &dst);
+
+// Nearest cell from which the bot can work on something.
+std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> path_to_nearest_work(
+        const WorkIndex &index, Pos start);
+
 bool safe_to_change(const Matrix &matrix, Pos pos);
 
 int cubic_num_components(bool bytes[27]);
+int cubic_num_components2(bool q[27]);
+int cubic_num_components(uint32_t mask);
+
+// Masks have bit 9 * (dx + 1) + 3 * (dy + 1) + (dz + 1) set for full cells.
+uint32_t neighbourhood_mask(const Matrix &m, Pos pos);
+// Answers come from a lazily filled table over all 2^26 neighbourhoods.
+bool can_safely_remove_center(uint32_t mask);
 bool can_safely_remove_center(bool[27]);
\ No newline at end of file
@@ -0,0 +1,66 @@
+#include "batch.h"
+#include "emulator.h"
+#include "logger.h"
+#include "trace_io.h"
+
+#include <atomic>
+#include <thread>
+
+using std::optional;
+using std::vector;
+
+
+static optional<Matrix> parse_model(const optional<vector<uint8_t>> &data) {
+    if (!data) return std::nullopt;
+    // Matrix only asserts on malformed data
+    const vector<uint8_t> &raw = data.value();
+    if (raw.empty() || raw[0] > 250 ||
+        raw.size() != 1 + ((size_t)raw[0] * raw[0] * raw[0] + 7) / 8)
+        throw parser_error("malformed model");
+    return Matrix::parse(raw);
+}
+
+
+static BatchResult run_job(const BatchJob &job) {
+    BatchResult result;
+    try {
+        optional<Matrix> src = parse_model(job.src);
+        optional<Matrix> tgt = parse_model(job.tgt);
+        if (src && tgt && src->R != tgt->R)
+            throw parser_error("source and target have different resolutions");
+        Emulator em(src, tgt);
+        em.set_trace(decode_trace(job.trace.data(), job.trace.size()));
+        try {
+            em.run_full();
+        } catch (...) {
+            result.steps = em.time_step;
+            throw;
+        }
+        result.energy = em.energy();
+        result.steps = em.time_step;
+    } catch (const std::exception &e) {
+        result.error = e.what();
+    }
+    return result;
+}
+
+
+vector<BatchResult> run_batch(const vector<BatchJob> &jobs, int num_threads) {
+    vector<BatchResult> results(jobs.size());
+    if (num_threads <= 0)
+        num_threads = std::max(1u, std::thread::hardware_concurrency());
+    num_threads = std::min<size_t>(num_threads, jobs.size());
+
+    std::atomic<size_t> next(0);
+    auto worker = [&]() {
+        for (size_t i = next++; i < jobs.size(); i = next++)
+            results[i] = run_job(jobs[i]);
+    };
+    vector<std::thread> threads;
+    for (int i = 1; i < num_threads; i++)
+        threads.emplace_back(worker);
+    worker();
+    for (auto &t : threads)
+        t.join();
+    return results;
+}
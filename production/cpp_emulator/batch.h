@@ -0,0 +1,23 @@
+#pragma once
+
+#include <optional>
+#include <string>
+#include <vector>
+#include <stdint.h>
+
+struct BatchJob {
+    std::optional<std::vector<uint8_t>> src;  // .mdl data
+    std::optional<std::vector<uint8_t>> tgt;
+    std::vector<uint8_t> trace;                // .nbt data
+};
+
+struct BatchResult {
+    std::optional<int64_t> energy;  // none on failures
+    std::string error;
+    int steps = 0;
+};
+
+// Runs every job like Emulator::run_full, on num_threads threads
+// (0 means one per core). Doesn't touch Python objects, so the caller
+// can release the GIL.
+std::vector<BatchResult> run_batch(const std::vector<BatchJob> &jobs, int num_threads);
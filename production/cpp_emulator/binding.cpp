@@ -1,5 +1,6 @@
 #include <pybind11/stl.h>
 #include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
 #include <iostream>
 #include <fstream>
 #include <vector>
@@ -11,6 +12,10 @@
 #include "logger.h"
 #include "algo.h"
 #include "tests.h"
+#include "batch.h"
+#include "trace_io.h"
+#include "estimate.h"
+#include "planner.h"
 
 using std::vector;
 using std::string;
@@ -21,11 +26,20 @@ namespace py = pybind11;
 
 void init_ex2(py::module &);
 
+static vector<std::shared_ptr<Command>> decode_buffer(py::buffer data) {
+	py::buffer_info info = data.request();
+	return decode_trace(static_cast<const uint8_t*>(info.ptr), info.size * info.itemsize);
+}
+
 PYBIND11_MODULE(emulator, m) {
 	m.doc() = "C++ Emulator";
 
 	init_ex2(m);
 
+	PYBIND11_NUMPY_DTYPE(TimelineRow, step, active, waiting, high,
+		energy_harmonics, energy_bots, energy_move, energy_fill, energy_void,
+		energy_fission_fusion);
+
 	py::class_<Bot> BotClass(m, "Bot");
 	BotClass
 		.def(py::init<uint8_t>())
@@ -56,10 +70,44 @@ PYBIND11_MODULE(emulator, m) {
 		.def("assert_well_formed", &State::assert_well_formed)
 	;
 
+	py::class_<ConnectivityIndex>(m, "ConnectivityIndex")
+		.def(py::init<const Matrix&>())
+		.def_property_readonly("matrix", &ConnectivityIndex::matrix, py::return_value_policy::reference_internal)
+		.def("__getitem__", [](const ConnectivityIndex &c, Pos p) { return c.matrix().get(p); })
+		.def("__setitem__", &ConnectivityIndex::set)
+		.def("is_grounded", &ConnectivityIndex::is_grounded)
+		.def("num_grounded", &ConnectivityIndex::num_grounded)
+		.def("all_grounded", &ConnectivityIndex::all_grounded)
+		.def("can_remove", &ConnectivityIndex::can_remove)
+		.def("safe_to_change", &ConnectivityIndex::safe_to_change)
+	;
+
+	py::class_<WorkIndex>(m, "WorkIndex")
+		.def(py::init<const Matrix&, const Matrix&>(), py::arg("src"), py::arg("tgt"))
+		.def_property_readonly("matrix", &WorkIndex::matrix, py::return_value_policy::reference_internal)
+		.def_property_readonly("target", &WorkIndex::target, py::return_value_policy::reference_internal)
+		.def("__getitem__", [](const WorkIndex &w, Pos p) { return w.matrix().get(p); })
+		.def("__setitem__", &WorkIndex::set)
+		.def("num_diff", &WorkIndex::num_diff)
+		.def("done", &WorkIndex::done)
+		.def("is_workable", &WorkIndex::is_workable)
+		.def("work_near", &WorkIndex::work_near)
+	;
+
+	// opaque, only good for passing back to Emulator.restore()
+	py::class_<Snapshot, std::shared_ptr<Snapshot>>(m, "Snapshot")
+		.def_property_readonly("time_step", [](const Snapshot &s) { return s.time_step; })
+		.def_property_readonly("energy", [](const Snapshot &s) { return s.state.energy; })
+	;
+
 	py::class_<Emulator> EmClass(m, "Emulator");
 	EmClass
 		.def(py::init<std::optional<Matrix>, std::optional<Matrix>>())
 		.def(py::init<const State&>())
+		// .nbt data, decoded natively
+		.def("set_trace", [](Emulator &em, py::buffer data) {
+			em.set_trace(decode_buffer(data));
+		})
 		.def("set_trace", &Emulator::set_trace)
 
 		.def("set_state", &Emulator::set_state)
@@ -67,10 +115,24 @@ PYBIND11_MODULE(emulator, m) {
 
 		.def("run_step", &Emulator::run_one_step)
 		.def("run", &Emulator::run_full)
+		.def("run_commands", [](Emulator &em, py::buffer data) {
+			em.run_commands(decode_buffer(data));
+		})
 		.def("run_commands", &Emulator::run_commands)
 
+		.def("snapshot", &Emulator::snapshot)
+		.def("restore", &Emulator::restore)
+		.def("fork", &Emulator::fork)
+
 		.def("energy", &Emulator::energy)
+		.def_readwrite("record_timeline", &Emulator::record_timeline)
+		// structured numpy array, one row per step (a copy)
+		.def("timeline", [](const Emulator &em) {
+			return py::array_t<TimelineRow>(em.timeline.size(), em.timeline.data());
+		})
 		.def_readonly("aborted", &Emulator::aborted)
+		.def_readonly("time_step", &Emulator::time_step)
+		.def_readonly("tracepointer", &Emulator::tracepointer)
 		.def("src_matches_tgt", &Emulator::src_matches_tgt)
 
 		.def("steptrace_is_complete", &Emulator::steptrace_is_complete)
@@ -88,11 +150,76 @@ PYBIND11_MODULE(emulator, m) {
 	m.def("enum_near_diffs", &enum_near_diffs);
 	m.def("near_neighbors", &near_neighbors);
 	m.def("path_to_nearest_of", &path_to_nearest_of);
-	m.def("path_to_nearest_safe_change_point", &path_to_nearest_safe_change_point);
+	m.def("path_to_nearest_safe_change_point",
+		(std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> (*)(
+			const Matrix&, Pos, const Matrix&, const Matrix&))
+		&path_to_nearest_safe_change_point);
+	m.def("path_to_nearest_safe_change_point",
+		(std::optional<std::pair<Pos, std::vector<std::shared_ptr<Command>>>> (*)(
+			const ConnectivityIndex&, Pos, const Matrix&))
+		&path_to_nearest_safe_change_point);
+	m.def("path_to_nearest_work", &path_to_nearest_work);
 	m.def("safe_to_change", &safe_to_change);
+	m.def("plan_routes", &plan_routes,
+		py::arg("obstacles"), py::arg("starts"), py::arg("goals"), py::arg("max_steps"),
+		py::arg("max_expansions") = 1000000);
 
 	m.def("run_tests", &run_tests);
 
+	m.def("decode_trace", &decode_buffer);
+	m.def("encode_trace", [](const vector<std::shared_ptr<Command>> &trace) {
+		vector<uint8_t> data = encode_trace(trace);
+		return py::bytes((const char*)data.data(), data.size());
+	});
+
+	// [(src, tgt, trace)] -> [(energy or None, error or None, steps)],
+	// src and tgt are None or buffers with .mdl data, trace has .nbt data
+	m.def("run_batch", [](py::iterable jobs, int num_threads) {
+		auto to_vector = [](py::handle obj) {
+			py::buffer_info info = py::reinterpret_borrow<py::buffer>(obj).request();
+			const uint8_t *p = static_cast<const uint8_t*>(info.ptr);
+			return vector<uint8_t>(p, p + info.size * info.itemsize);
+		};
+		vector<BatchJob> cjobs;
+		for (py::handle job : jobs) {
+			auto t = job.cast<py::tuple>();
+			if (t.size() != 3)
+				throw py::value_error("expected (src, tgt, trace) tuples");
+			BatchJob cj;
+			if (!t[0].is_none()) cj.src = to_vector(t[0]);
+			if (!t[1].is_none()) cj.tgt = to_vector(t[1]);
+			cj.trace = to_vector(t[2]);
+			cjobs.push_back(std::move(cj));
+		}
+
+		vector<BatchResult> results;
+		{
+			py::gil_scoped_release release;
+			results = run_batch(cjobs, num_threads);
+		}
+
+		py::list out;
+		for (const BatchResult &r : results) {
+			out.append(py::make_tuple(
+				r.energy ? py::cast(*r.energy) : py::none(),
+				r.error.empty() ? py::none() : py::cast(r.error),
+				r.steps));
+		}
+		return out;
+	}, py::arg("jobs"), py::arg("num_threads") = 0);
+
+	// (src, tgt, trace); only one of the matrices is needed, for R
+	m.def("estimate_energy", [](
+			std::optional<Matrix> src, std::optional<Matrix> tgt, py::buffer trace) {
+		if (!src && !tgt)
+			throw parser_error("Source and target matrices cannot both be None");
+		Matrix matrix = src ? *src : Matrix(tgt->R);
+		py::buffer_info info = trace.request();
+		py::gil_scoped_release release;
+		return estimate_energy(
+			std::move(matrix), static_cast<const uint8_t*>(info.ptr), info.size * info.itemsize);
+	});
+
 	static py::exception<base_error> base_exc(m, "SimulatorException");
 	py::register_exception_translator([](std::exception_ptr p) {
 	    try {
@@ -25,6 +25,7 @@ void init_ex2(py::module &m) {
 		.def(py::self == py::self)
 		.def(py::self != py::self)
 		.def(py::self < py::self)
+		.def("__hash__", &Diff::__hash__)
 		.def("__repr__", &Diff::__repr__)
 		.def("__add__", &Diff::operator+, py::is_operator())
 		.def_readonly("dx", &Diff::dx)
@@ -59,7 +60,11 @@ void init_ex2(py::module &m) {
 	py::class_<Matrix>(m, "Matrix")
 		.def(py::init<int>())
 		.def(py::init<const Matrix&>())
-		.def("parse", &Matrix::parse)
+		.def_static("parse", [](py::bytes data) {
+			std::string s = data;
+			return Matrix::parse(std::vector<uint8_t>(s.begin(), s.end()));
+		})
+		.def_static("parse", &Matrix::parse)
 		.def_readonly("num_full", &Matrix::num_full)
 		.def_readonly("R", &Matrix::R)
 		.def("__getitem__", &Matrix::get)
@@ -68,10 +73,22 @@ void init_ex2(py::module &m) {
 		.def("num_grounded_voxels", &Matrix::num_grounded_voxels)
 		.def("grounded_voxels", &Matrix::grounded_voxels)
 		.def("count_inside_region", &Matrix::count_inside_region)
+		.def("is_void_region", &Matrix::is_void_region)
+		.def("set_region", &Matrix::set_region)
+		.def("count_diff", &Matrix::count_diff)
+		.def(py::self ^ py::self)
+		.def("compose", [](const Matrix &m) {
+			auto data = m.compose();
+			return py::bytes((const char*)data.data(), data.size());
+		})
 	;
 
-	// TODO
 	py::class_<Command, std::shared_ptr<Command>>(m, "Command")
+		.def("encode", [](const Command &c) {
+			std::vector<uint8_t> data;
+			c.encode(data);
+			return py::bytes((const char*)data.data(), data.size());
+		})
 	;
 	py::class_<Halt, std::shared_ptr<Halt>, Command>(m, "Halt")
 		.def(py::init<>())
@@ -2,6 +2,7 @@
 #include <memory>
 #include <vector>
 #include <algorithm>
+#include <cstdlib>
 #include "commands.h"
 #include "emulator.h"
 #include "logger.h"
@@ -29,19 +30,18 @@ vector<Pos> get_region(const Pos& a, const Pos& b, vector<Pos> exclude) {
 }
 
 
+int region_volume(const Pos& a, const Pos& b) {
+	return (abs(a.x - b.x) + 1) * (abs(a.y - b.y) + 1) * (abs(a.z - b.z) + 1);
+}
+
+
 bool is_void_voxel(State* S, const Pos& p) {
 	return !S->matrix.get(p);
 }
 
 
 bool is_void_region(State* S, const Pos& a, const Pos& b) {
-	Pos p (0, 0, 0);
-	for (p.x = min(a.x, b.x); p.x <= max(a.x, b.x); p.x++)
-		for (p.y = min(a.y, b.y); p.y <= max(a.y, b.y); p.y++)
-			for (p.z = min(a.z, b.z); p.z <= max(a.z, b.z); p.z++){
-				if (S->matrix.get(p)) return false;
-			}
-	return true;
+	return S->matrix.is_void_region(a, b);
 }
 
 /*======================= COMMAND =======================*/
@@ -62,8 +62,6 @@ Diff Command::get_lld(uint8_t a, uint8_t i) {
 	if (a == 1) return Diff(d, 0, 0);
 	if (a == 2) return Diff(0, d, 0);
 	if (a == 3) return Diff(0, 0, d);
-	// TODO : log
-	assert (false);
 	throw parser_error("Unable to decode trace");
 }
 
@@ -73,8 +71,6 @@ Diff Command::get_sld(uint8_t a, uint8_t i) {
 	if (a == 1) return Diff(d, 0, 0);
 	if (a == 2) return Diff(0, d, 0);
 	if (a == 3) return Diff(0, 0, d);
-	// TODO : log
-	assert (false);
 	throw parser_error("Unable to decode trace");
 }
 
@@ -99,6 +95,7 @@ vector<Pos> Halt::get_volatiles(Bot* b, State* S) { return {}; }
 
 
 void Halt::execute(Bot* b, State* S) {
+	S->save_bot(*b);
 	b->active = false;
 	S->halted = true;
 }
@@ -141,8 +138,6 @@ SMove::SMove(Diff d)
 : lld(d)
 {
 	if (!lld.is_long()) {
-		// TODO: log
-		assert (false);
 		throw emulation_error("SMove parameter is not long");
 	}
 }
@@ -163,6 +158,7 @@ vector<Pos> SMove::get_volatiles(Bot* b, State* S) {
 
 
 void SMove::execute(Bot* b, State* S) {
+	S->save_bot(*b);
 	b->position += lld;
 	S->energy += 2 * lld.mlen();
 }
@@ -177,8 +173,6 @@ LMove::LMove(Diff d1, Diff d2)
 , sld2(d2)
 {
 	if (!sld1.is_short() || !sld2.is_short()) {
-		// TODO: log
-		assert (false);
 		throw emulation_error("LMove parameter is not short");
 	}
 }
@@ -209,6 +203,7 @@ vector<Pos> LMove::get_volatiles(Bot* b, State* S) {
 
 
 void LMove::execute(Bot* b, State* S) {
+	S->save_bot(*b);
 	b->position = (b->position + sld1) + sld2;
 	S->energy += 2 * (sld1.mlen() + 2 + sld2.mlen());
 }
@@ -225,8 +220,6 @@ FusionP::FusionP(Diff nd)
 : nd(nd)
 {
 	if (!nd.is_near()) {
-		// TODO: log
-		assert (false);
 		throw emulation_error("FusionP parameter is not near");
 	}
 }
@@ -235,9 +228,8 @@ FusionP::FusionP(Diff nd)
 string FusionP::check_preconditions(Bot* b, State* S) {
 	if (!(b->position + nd).is_inside(S->R))
 		return "FusionP is out of bounds";
+	// pairing with a FusionS is checked by Emulator::validate_groups
 	return "";
-	// TODO: move pair search
-	// assert b2 has corresponding FusionP command
 }
 
 
@@ -246,18 +238,18 @@ vector<Pos> FusionP::get_volatiles(Bot* b, State* S) { return {}; }
 
 void FusionP::execute(Bot* b, State* S) {
 	Pos p = b->position + nd;
-	unsigned index;
-	for (index = 0; index < S->bots.size(); index++) {
-		if (!(S->bots[index].active)) continue;
-		if (!(S->bots[index].position == p)) continue;
+	Bot* b2 = nullptr;
+	for (Bot& other : S->bots) {
+		if (other.active && other.position == p) {
+			b2 = &other;
+			break;
+		}
 	}
-	if (index == S->bots.size()) 
-		// TODO: move to preconditions
-		// TODO : log
-		assert (false);
+	if (b2 == nullptr)
 		throw emulation_error("FusionP without a pair");
 
-	Bot* b2 = &(S->bots[index]);
+	S->save_bot(*b);
+	S->save_bot(*b2);
 	b2->active = false;
 	b->seeds.push_back(b2->bid);
 	b->seeds.insert(b->seeds.end(), b2->seeds.begin(), b2->seeds.end());
@@ -275,8 +267,6 @@ FusionS::FusionS(Diff nd)
 : nd(nd)
 {
 	if (!nd.is_near()) {
-		// TODO: log
-		assert (false);
 		throw emulation_error("FusionS parameter is not near");
 	}
 }
@@ -306,8 +296,6 @@ Fission::Fission(Diff nd, unsigned m)
 , m(m)
 {
 	if (!nd.is_near()) {
-		// TODO: log
-		assert (false);
 		throw emulation_error("Fission parameter is not near");
 	}
 	// TODO : report m
@@ -334,8 +322,10 @@ vector<Pos> Fission::get_volatiles(Bot* b, State* S) {
 void Fission::execute(Bot* b, State* S) {
 	Bot* b2 = &(S->bots[b->seeds[0]]);
 	assert (!(b2->active));
+	S->save_bot(*b);
+	S->save_bot(*b2);
 	b2->position = (b->position + nd);
-	b2->seeds = std::move(vector<uint8_t>(b->seeds.begin(),
+	b2->seeds = std::move(vector<uint8_t>(b->seeds.begin() + 1,
 												b->seeds.begin() + m + 1));
 	b->seeds = std::move(vector<uint8_t>(b->seeds.begin() + m + 1,
 											   b->seeds.end()));
@@ -354,8 +344,6 @@ Fill::Fill(Diff nd)
 : nd(nd)
 {
 	if (!nd.is_near()) {
-		// TODO: log
-		assert (false);
 		throw emulation_error("Fill parameter is not near");
 	}
 }
@@ -377,7 +365,7 @@ void Fill::execute(Bot* b, State* S) {
 	Pos dest = b->position + nd;
 	if (!S->matrix.get(dest)) {
 		S->energy += 12;
-		S->matrix.set(dest, true);
+		S->setbit(dest, true);
 	} else {
 		S->energy += 6;
 	}
@@ -392,8 +380,6 @@ Void::Void(Diff nd)
 : nd(nd)
 {
 	if (!nd.is_near()) {
-		// TODO: log
-		assert (false);
 		throw emulation_error("Void parameter is not near");
 	}
 }
@@ -415,7 +401,7 @@ void Void::execute(Bot* b, State* S) {
 	Pos dest = b->position + nd;
 	if (S->matrix.get(dest)) {
 		S->energy -= 12;
-		S->matrix.set(dest, false);
+		S->setbit(dest, false);
 	} else {
 		S->energy += 3;
 	}
@@ -431,35 +417,38 @@ GFill::GFill(Diff nd, Diff fd)
 , fd(fd)
 {
 	if (!nd.is_near()) {
-		// TODO: log
-		assert (false);
 		throw emulation_error("GFill first parameter is not near");
 	}
 	if (!fd.is_far()) {
-		// TODO: log
-		assert (false);
-		throw emulation_error("Gfill second parameter is not near");
+		throw emulation_error("GFill second parameter is not far");
 	}
 }
 
 
 string GFill::check_preconditions(Bot* b, State* S) {
+	if (!(b->position + nd).is_inside(S->R) ||
+		!(b->position + nd + fd).is_inside(S->R))
+		return "GFill is out of bounds";
 	return "";
 }
 
 
-vector<Pos> GFill::get_volatiles(Bot* b, State* S) {
-	return get_region(b->position + nd, b->position + nd + fd, {});
-}
+// The region is shared by the whole group, so it's made volatile
+// once per group by Emulator::validate_groups.
+vector<Pos> GFill::get_volatiles(Bot* b, State* S) { return {}; }
 
 
 void GFill::execute(Bot* b, State* S) {
-	// TODO
-	assert (false);
+	Pos p1 = b->position + nd;
+	Pos p2 = p1 + fd;
+	if (!S->claim_region(p1, p2)) return;  // done by another bot of the group
+	int volume = region_volume(p1, p2);
+	int changed = S->set_region(p1, p2, true);
+	S->energy += 12 * changed + 6 * (volume - changed);
 }
 
 
-std::string GFill::__repr__() { return "gfill"; }
+std::string GFill::__repr__() { return "gfill " + nd.__repr__() + " " + fd.__repr__(); }
 
 /*-------------------------------------------------------*/
 
@@ -468,34 +457,104 @@ GVoid::GVoid(Diff nd, Diff fd)
 , fd(fd)
 {
 	if (!nd.is_near()) {
-		// TODO: log
-		assert (false);
 		throw emulation_error("GVoid first parameter is not near");
 	}
 	if (!fd.is_far()) {
-		// TODO: log
-		assert (false);
-		throw emulation_error("GVoid second parameter is not near");
+		throw emulation_error("GVoid second parameter is not far");
 	}
 }
 
 
 string GVoid::check_preconditions(Bot* b, State* S) {
+	if (!(b->position + nd).is_inside(S->R) ||
+		!(b->position + nd + fd).is_inside(S->R))
+		return "GVoid is out of bounds";
 	return "";
 }
 
 
-vector<Pos> GVoid::get_volatiles(Bot* b, State* S) {
-	vector<Pos> result = get_region(b->position + nd, b->position + nd + fd, {});
-	result.push_back(b->position);
-	return result;
-}
+// See GFill::get_volatiles.
+vector<Pos> GVoid::get_volatiles(Bot* b, State* S) { return {}; }
 
 
 void GVoid::execute(Bot* b, State* S) {
-	// TODO
-	assert (false);
+	Pos p1 = b->position + nd;
+	Pos p2 = p1 + fd;
+	if (!S->claim_region(p1, p2)) return;
+	int volume = region_volume(p1, p2);
+	int changed = S->set_region(p1, p2, false);
+	S->energy += -12 * changed + 3 * (volume - changed);
+}
+
+
+std::string GVoid::__repr__() { return "gvoid " + nd.__repr__() + " " + fd.__repr__(); }
+
+
+/*====================== ENCODING =======================*/
+
+uint8_t Command::encode_nd(Diff d) {
+	assert (d.is_near());
+	return (d.dx + 1) * 9 + (d.dy + 1) * 3 + (d.dz + 1);
+}
+
+static uint8_t linear_axis(Diff d) {
+	if (d.dx) return 1;
+	if (d.dy) return 2;
+	return 3;
+}
+
+uint8_t Command::encode_lld(Diff d) {
+	assert (d.is_long());
+	return linear_axis(d) << 5 | (d.dx + d.dy + d.dz + 15);
+}
+
+uint8_t Command::encode_sld(Diff d) {
+	assert (d.is_short());
+	return linear_axis(d) << 4 | (d.dx + d.dy + d.dz + 5);
+}
+
+void Halt::encode(vector<uint8_t> &out) const { out.push_back(0b11111111); }
+
+void Wait::encode(vector<uint8_t> &out) const { out.push_back(0b11111110); }
+
+void Flip::encode(vector<uint8_t> &out) const { out.push_back(0b11111101); }
+
+void SMove::encode(vector<uint8_t> &out) const {
+	uint8_t l = encode_lld(lld);
+	out.push_back(0b0100 | (l & 0b0110'0000) >> 1);
+	out.push_back(l & 0b11111);
+}
+
+void LMove::encode(vector<uint8_t> &out) const {
+	uint8_t s1 = encode_sld(sld1);
+	uint8_t s2 = encode_sld(sld2);
+	out.push_back(0b1100 | (s1 & 0b0011'0000) | (s2 & 0b0011'0000) << 2);
+	out.push_back((s1 & 0b1111) | (s2 & 0b1111) << 4);
+}
+
+void FusionP::encode(vector<uint8_t> &out) const { out.push_back(0b111 | encode_nd(nd) << 3); }
+
+void FusionS::encode(vector<uint8_t> &out) const { out.push_back(0b110 | encode_nd(nd) << 3); }
+
+void Fission::encode(vector<uint8_t> &out) const {
+	out.push_back(0b101 | encode_nd(nd) << 3);
+	out.push_back(m);
 }
 
+void Fill::encode(vector<uint8_t> &out) const { out.push_back(0b011 | encode_nd(nd) << 3); }
 
-std::string GVoid::__repr__() { return "gvoid"; }
+void Void::encode(vector<uint8_t> &out) const { out.push_back(0b010 | encode_nd(nd) << 3); }
+
+void GFill::encode(vector<uint8_t> &out) const {
+	out.push_back(0b001 | encode_nd(nd) << 3);
+	out.push_back(fd.dx + 30);
+	out.push_back(fd.dy + 30);
+	out.push_back(fd.dz + 30);
+}
+
+void GVoid::encode(vector<uint8_t> &out) const {
+	out.push_back(0b000 | encode_nd(nd) << 3);
+	out.push_back(fd.dx + 30);
+	out.push_back(fd.dy + 30);
+	out.push_back(fd.dz + 30);
+}
@@ -7,17 +7,24 @@
 #include <memory>
 #include <vector>
 #include <assert.h>
+#include <stdint.h>
 
 class Bot;
 class State;
 class Emulator;
 
+// Coarse grouping of commands, for statistics.
+enum class CommandKind : uint8_t { Halt, Wait, Flip, Move, Fission, Fusion, Fill, Void };
+
 struct Command {
 	virtual ~Command() = default;
 	virtual std::string check_preconditions(Bot* b, State* S) = 0;
 	virtual std::vector<Pos> get_volatiles(Bot* b, State* S) = 0;
 	virtual void execute(Bot* b, State* S) = 0;
 	virtual std::string __repr__() = 0;
+	// appends the .nbt encoding
+	virtual void encode(std::vector<uint8_t> &out) const = 0;
+	virtual CommandKind kind() const = 0;
 	virtual Diff move_offset() const {
 		// should only be called for SMove and LMove
 		assert(false);
@@ -28,6 +35,11 @@ struct Command {
 	static Diff get_lld(uint8_t a, uint8_t i);
 	static Diff get_sld(uint8_t a, uint8_t i);
 	static Diff get_fd(uint8_t a, uint8_t b, uint8_t c);
+
+	static uint8_t encode_nd(Diff d);
+	// axis in the high bits, length in the low 5 (lld) or 4 (sld) bits
+	static uint8_t encode_lld(Diff d);
+	static uint8_t encode_sld(Diff d);
 };
 
 struct Halt : Command {
@@ -35,6 +47,8 @@ struct Halt : Command {
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Halt; }
 };
 
 struct Wait : Command {
@@ -42,6 +56,8 @@ struct Wait : Command {
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Wait; }
 };
 
 struct Flip : Command {
@@ -49,6 +65,8 @@ struct Flip : Command {
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Flip; }
 };
 
 struct SMove : Command {
@@ -58,6 +76,8 @@ struct SMove : Command {
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Move; }
 	virtual Diff move_offset() const {
 		return lld;
 	}
@@ -71,6 +91,8 @@ struct LMove : Command {
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Move; }
 
 	virtual Diff move_offset() const {
 		return sld1 + sld2;
@@ -85,6 +107,8 @@ struct FusionP : Command {
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Fusion; }
 };
 
 struct FusionS : Command
@@ -95,6 +119,8 @@ struct FusionS : Command
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Fusion; }
 };
 
 struct Fission : Command
@@ -106,6 +132,8 @@ struct Fission : Command
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Fission; }
 };
 
 struct Fill : Command
@@ -116,6 +144,8 @@ struct Fill : Command
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Fill; }
 };
 
 struct Void : Command
@@ -126,6 +156,8 @@ struct Void : Command
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Void; }
 };
 
 
@@ -138,6 +170,8 @@ struct GFill : Command
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Fill; }
 };
 
 
@@ -150,6 +184,8 @@ struct GVoid : Command
 	std::string check_preconditions(Bot* b, State* S) override;
 	std::vector<Pos> get_volatiles(Bot* b, State* S) override;
 	std::string __repr__() override;
+	void encode(std::vector<uint8_t> &out) const override;
+	CommandKind kind() const override { return CommandKind::Void; }
 };
 
 
@@ -0,0 +1,241 @@
+#include "connectivity.h"
+
+#include "algo.h"
+
+#include <vector>
+#include <deque>
+#include <queue>
+#include <cstdint>
+#include <utility>
+#include <algorithm>
+
+using namespace std;
+
+ConnectivityIndex::ConnectivityIndex(const Matrix &m)
+    : m(m) {
+    int R = m.R;
+    parent.assign(R * R * R, NONE);
+    depth.assign(R * R * R, NONE);
+    mark.assign(R * R * R, 0);
+
+    vector<int> seeds;
+    for (int x = 0; x < R; x++) {
+        for (int z = 0; z < R; z++) {
+            Pos p(x, 0, z);
+            if (m.get(p)) {
+                int idx = p.pack(R);
+                depth[idx] = 0;
+                n_grounded++;
+                seeds.push_back(idx);
+            }
+        }
+    }
+    attach(seeds);
+}
+
+int ConnectivityIndex::neighbours(int idx, int out[6]) const {
+    int R = m.R;
+    int x = idx / (R * R);
+    int y = idx / R % R;
+    int z = idx % R;
+    int n = 0;
+    if (x > 0) out[n++] = idx - R * R;
+    if (x < R - 1) out[n++] = idx + R * R;
+    if (y > 0) out[n++] = idx - R;
+    if (y < R - 1) out[n++] = idx + R;
+    if (z > 0) out[n++] = idx - 1;
+    if (z < R - 1) out[n++] = idx + 1;
+    return n;
+}
+
+// Grows the forest from already grounded seeds over full ungrounded voxels.
+void ConnectivityIndex::attach(vector<int> &seeds) {
+    sort(seeds.begin(), seeds.end(), [this](int a, int b) { return depth[a] < depth[b]; });
+    deque<int> work(seeds.begin(), seeds.end());
+    int nb[6];
+    while (!work.empty()) {
+        int u = work.front();
+        work.pop_front();
+        int n = neighbours(u, nb);
+        for (int i = 0; i < n; i++) {
+            int v = nb[i];
+            if (depth[v] == NONE && m.get(Pos::unpack(m.R, v))) {
+                parent[v] = u;
+                depth[v] = depth[u] + 1;
+                n_grounded++;
+                work.push_back(v);
+            }
+        }
+    }
+}
+
+void ConnectivityIndex::detach_subtree(int idx, vector<int> &detached) {
+    vector<int> work = {idx};
+    int nb[6];
+    while (!work.empty()) {
+        int u = work.back();
+        work.pop_back();
+        int n = neighbours(u, nb);
+        for (int i = 0; i < n; i++) {
+            if (parent[nb[i]] == u) {
+                work.push_back(nb[i]);
+            }
+        }
+        parent[u] = NONE;
+        depth[u] = NONE;
+        n_grounded--;
+        detached.push_back(u);
+    }
+}
+
+void ConnectivityIndex::set(Pos p, bool value) {
+    if (m.get(p) == value) {
+        return;
+    }
+    m.set(p, value);
+    int idx = p.pack(m.R);
+    int nb[6];
+
+    if (value) {
+        int best = NONE;
+        if (p.y > 0) {
+            int n = neighbours(idx, nb);
+            for (int i = 0; i < n; i++) {
+                if (depth[nb[i]] != NONE && (best == NONE || depth[nb[i]] < depth[best])) {
+                    best = nb[i];
+                }
+            }
+            if (best == NONE) {
+                return;  // floating for now
+            }
+        }
+        parent[idx] = best;
+        depth[idx] = best == NONE ? 0 : depth[best] + 1;
+        n_grounded++;
+        vector<int> seeds = {idx};
+        attach(seeds);
+        return;
+    }
+
+    if (depth[idx] == NONE) {
+        return;
+    }
+    vector<int> detached;
+    detach_subtree(idx, detached);
+
+    // reconnect what still touches the rest of the forest
+    vector<int> seeds;
+    for (int u : detached) {
+        if (u == idx) {
+            continue;
+        }
+        int best = NONE;
+        bool on_floor = u / m.R % m.R == 0;
+        if (!on_floor) {
+            int n = neighbours(u, nb);
+            for (int i = 0; i < n; i++) {
+                if (depth[nb[i]] != NONE && (best == NONE || depth[nb[i]] < depth[best])) {
+                    best = nb[i];
+                }
+            }
+            if (best == NONE) {
+                continue;
+            }
+        }
+        parent[u] = best;
+        depth[u] = best == NONE ? 0 : depth[best] + 1;
+        n_grounded++;
+        seeds.push_back(u);
+    }
+    attach(seeds);
+}
+
+bool ConnectivityIndex::can_remove(Pos p) const {
+    assert(m.get(p));
+    int idx = p.pack(m.R);
+    if (depth[idx] == NONE) {
+        // ungrounded voxels don't touch grounded ones
+        return n_grounded == m.num_full - 1;
+    }
+    if (!all_grounded()) {
+        return false;
+    }
+
+    int nb[6];
+    int n = neighbours(idx, nb);
+    vector<int> children;
+    for (int i = 0; i < n; i++) {
+        if (parent[nb[i]] == idx) {
+            children.push_back(nb[i]);
+        }
+    }
+    if (children.empty()) {
+        return true;
+    }
+
+    if (stamp > UINT32_MAX - 16) {
+        fill(mark.begin(), mark.end(), 0);
+        stamp = 0;
+    }
+    // marks in (base, stamp) belong to earlier searches that succeeded
+    uint32_t base = ++stamp;
+    mark[idx] = base;
+
+    for (int c : children) {
+        if (mark[c] > base) {
+            continue;
+        }
+        uint32_t cur = ++stamp;
+        // every voxel outside the subtree of idx is still grounded,
+        // and those with depth <= depth[idx] are certainly outside it
+        priority_queue<pair<int, int>> work;
+        work.push({-depth[c], c});
+        mark[c] = cur;
+        bool found = false;
+        while (!work.empty() && !found) {
+            int u = work.top().second;
+            work.pop();
+            if (depth[u] <= depth[idx]) {
+                found = true;
+                break;
+            }
+            int k = neighbours(u, nb);
+            for (int i = 0; i < k; i++) {
+                int v = nb[i];
+                if (depth[v] == NONE || mark[v] == cur || v == idx) {
+                    continue;
+                }
+                if (mark[v] > base) {
+                    found = true;
+                    break;
+                }
+                mark[v] = cur;
+                work.push({-depth[v], v});
+            }
+        }
+        if (!found) {
+            return false;
+        }
+    }
+    return true;
+}
+
+bool ConnectivityIndex::safe_to_change(Pos pos) const {
+    if (!m.get(pos)) {
+        if (pos.y == 0) {
+            return true;
+        }
+        for (Diff d : DIRS) {
+            Pos p = pos + d;
+            if (p.is_inside(m.R) && m.get(p)) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    if (can_safely_remove_center(neighbourhood_mask(m, pos))) {
+        return true;
+    }
+    return can_remove(pos);
+}
@@ -0,0 +1,48 @@
+#pragma once
+
+#include "coordinates.h"
+#include "matrix.h"
+
+#include <vector>
+#include <stdint.h>
+
+// Keeps a spanning forest of the full voxels of a matrix, rooted at the
+// floor, and keeps it up to date as voxels are set.
+//
+// Every grounded voxel has a parent (a neighbour one step closer to the
+// floor in the forest) and a depth (0 for voxels at y = 0). Voxels with
+// depth <= depth(p) can't be in the subtree of p, so they are known to
+// stay grounded when p is removed; that's what makes removal queries cheap.
+class ConnectivityIndex {
+public:
+    explicit ConnectivityIndex(const Matrix &m);
+
+    const Matrix& matrix() const { return m; }
+    int num_grounded() const { return n_grounded; }
+    bool all_grounded() const { return n_grounded == m.num_full; }
+    bool is_grounded(Pos p) const { return depth[p.pack(m.R)] >= 0; }
+
+    void set(Pos p, bool value);
+
+    // Would removing this full voxel leave everything grounded?
+    bool can_remove(Pos p) const;
+
+    // Same contract as the free safe_to_change(matrix, pos).
+    bool safe_to_change(Pos p) const;
+
+private:
+    static constexpr int NONE = -1;
+
+    Matrix m;
+    int n_grounded = 0;
+    std::vector<int> parent;  // packed index, or NONE for roots/ungrounded
+    std::vector<int> depth;   // NONE for empty or ungrounded voxels
+
+    // scratch for searches, stamped to avoid clearing
+    mutable std::vector<uint32_t> mark;
+    mutable uint32_t stamp = 0;
+
+    int neighbours(int idx, int out[6]) const;
+    void attach(std::vector<int> &seeds);
+    void detach_subtree(int idx, std::vector<int> &detached);
+};
@@ -174,6 +174,11 @@ string Pos::__repr__() const {
 	return "Pos(" + std::to_string(x) + ", " + std::to_string(y) + ", " + std::to_string(z) + ")";
 }
 
+int Diff::__hash__() const {
+	// injective for the components that fit in a command
+	return (dx + 128) ^ ((dy + 128) << 8) ^ ((dz + 128) << 16);
+}
+
 int Pos::__hash__() const {
 	return x ^ (y << 8) ^ (z << 16);
 }
@@ -29,6 +29,7 @@ public:
 	bool operator<(const Diff& other) const;
 	int operator[](int axis) const;
 	static Diff byaxis(int axis, int value);
+	int __hash__() const;
 
 	Diff operator+(Diff other) const {
 		return Diff(dx + other.dx, dy + other.dy, dz + other.dz);
@@ -3,6 +3,8 @@ import production.cpp_mediator as cppm
 import production.commands as commands
 from production import utils
 
+import pytest
+
 # from production.emulator import Bot, State, LOW, HIGH
 # from production.basics import Pos, Diff
 # from production.model import Model
@@ -37,6 +39,139 @@ def test_run_from_file():
 
     assert em.energy() == 501700108
 
+def test_run_batch():
+    from production import data_files
+    from production.cpp_emulator.run import run_full, run_batch
+    tgt = data_files.lightning_problem('LA001_tgt.mdl')
+    trace = data_files.lightning_default_trace('LA001.nbt')
+    jobs = [
+        (None, tgt, trace),
+        (tgt, None, trace),  # fails
+        (None, tgt, trace[:-1]),  # no Halt
+        (None, tgt, b'\x04\x00'),  # invalid SMove
+        (None, b'\x03', b'\xff'),  # malformed model
+    ] * 3
+    results = run_batch(jobs, num_threads=3)
+    assert len(results) == len(jobs)
+    for job, r in zip(jobs, results):
+        if job[1] != b'\x03':
+            assert r.energy == run_full(*job).energy
+        assert (r.energy is None) == ('error' in r.extra)
+    assert results[0].energy == 335123860
+    assert 'Parser error' in results[4].extra['error']
+
+
+def test_native_trace_io():
+    from production import data_files
+    from production.trace_decoder import decode_trace
+    tgt = Cpp.Matrix.parse(data_files.lightning_problem('LA004_tgt.mdl'))
+    trace = data_files.lightning_default_trace('LA004.nbt')
+
+    assert Cpp.encode_trace(Cpp.decode_trace(trace)) == trace
+    for cmd in set(decode_trace(trace)):
+        assert cppm.cmd_to_cpp(cmd).encode() == cmd.encoded()
+
+    em1 = Cpp.Emulator(None, tgt)
+    em1.set_trace(bytearray(trace))
+    em1.run()
+    em2 = Cpp.Emulator(None, tgt)
+    em2.set_trace(list(map(cppm.cmd_to_cpp, decode_trace(trace))))
+    em2.run()
+    assert em1.energy() == em2.energy()
+
+    with pytest.raises(Cpp.SimulatorException):
+        Cpp.decode_trace(b'\x04\x00')
+
+
+def test_snapshot_restore_fork():
+    from production import data_files
+    tgt_data = data_files.lightning_problem('LA004_tgt.mdl')
+    tgt = Cpp.Matrix.parse(tgt_data)
+    trace = data_files.lightning_default_trace('LA004.nbt')
+
+    ref = Cpp.Emulator(None, tgt)
+    ref.set_trace(trace)
+    ref.run()
+
+    em = Cpp.Emulator(None, tgt)
+    em.set_trace(trace)
+    for _ in range(50):
+        em.run_step()
+    snap = em.snapshot()
+    matrix = em.get_state().matrix.compose()
+    bots = [(b.pos, b.seeds, b.active) for b in em.get_state().bots]
+    assert snap.time_step == 50 and snap.energy == em.energy()
+
+    for _ in range(200):
+        em.run_step()
+    inner = em.snapshot()
+    assert em.get_state().matrix.compose() != matrix
+    em.restore(snap)
+    assert em.time_step == 50 and em.energy() == snap.energy
+    assert em.get_state().matrix.compose() == matrix
+    assert [(b.pos, b.seeds, b.active) for b in em.get_state().bots] == bots
+    with pytest.raises(Cpp.SimulatorException):
+        em.restore(inner)
+
+    twin = em.fork()
+    em.run()
+    twin.run()
+    assert em.energy() == twin.energy() == ref.energy()
+
+    # and back again, after the trace is done
+    em.restore(snap)
+    em.run()
+    assert em.energy() == twin.energy()
+
+
+def test_timeline():
+    from production import data_files
+    from production.cpp_emulator.run import run_timeline, summarize_timeline
+    tgt = data_files.lightning_problem('LA004_tgt.mdl')
+    trace = data_files.lightning_default_trace('LA004.nbt')
+
+    er, timeline = run_timeline(None, tgt, trace)
+    assert len(timeline) == er.extra['steps']
+    assert (timeline['step'] == range(1, len(timeline) + 1)).all()
+    summary = summarize_timeline(timeline)
+    assert sum(summary['energy'].values()) == er.energy
+    assert summary['bot_steps'] == len(timeline)  # single bot
+    assert 0 < summary['high_steps'] < summary['steps']
+
+    em = Cpp.Emulator(None, Cpp.Matrix.parse(tgt))
+    em.record_timeline = True
+    em.set_trace(trace)
+    snap = em.snapshot()
+    for _ in range(10):
+        em.run_step()
+    em.restore(snap)
+    em.run()
+    assert (em.timeline() == timeline).all()
+
+
+def test_estimate_energy():
+    from production import data_files
+    from production.cpp_emulator.run import run_full, estimate_energy
+    from production.default_solver2 import DefaultSolver2
+    from production.deconstruct.cubical2 import CubicalDeconstructor
+    from production.trace_sink import trace_bytes
+    model = data_files.lightning_problem('LA004_tgt.mdl')
+    cases = [
+        (None, model, data_files.lightning_default_trace('LA004.nbt')),
+        # fissions and fusions
+        (None, model, trace_bytes(DefaultSolver2(['3', '3']).solve('LA004', None, model).trace_data)),
+        # GVoid
+        (model, None, CubicalDeconstructor(['20']).solve('LA004', model, None).trace_data),
+    ]
+    for src, tgt, trace in cases:
+        energy = run_full(src, tgt, trace).energy
+        assert energy is not None
+        assert estimate_energy(src, tgt, trace) == energy
+
+    assert estimate_energy(None, model, cases[0][2][:-1]) is None  # no Halt
+    assert estimate_energy(None, model, b'\x04\x00') is None
+
+
 if __name__ == '__main__':
     test_run_from_file()
     test_cpp_functions()
\ No newline at end of file
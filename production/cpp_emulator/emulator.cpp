@@ -3,6 +3,7 @@
 #include <cassert>
 #include <memory>
 #include <cstring>
+#include <algorithm>
 #include "emulator.h"
 #include "commands.h"
 #include "logger.h"
@@ -58,15 +59,13 @@ State::State(std::optional<Matrix> src, std::optional<Matrix> tgt)
 , halted(false)
 {
 	if (!src && !tgt) {
-		// TODO : log
-		assert (false);
 		throw parser_error("Source and target matrices cannot both be None");
 	}
 	R = src ? src.value().R : tgt.value().R;
 	matrix = src ? src.value() : Matrix(R);
 	target = tgt ? tgt.value() : Matrix(R);
 
-	volatiles = vector<Pos>();
+	volatiles = VolatileSet(R * R * R);
 	set_default_bots();
 }
 
@@ -83,15 +82,13 @@ State::State(std::optional<Matrix> src,
 , halted(false)
 {
 	if (!src && !tgt) {
-		// TODO : log
-		assert (false);
 		throw parser_error("Source and target matrices cannot both be None");
 	}
 	R = src ? src.value().R : tgt.value().R;
 	matrix = src ? src.value() : Matrix(R);
 	target = tgt ? tgt.value() : Matrix(R);
 
-	volatiles = vector<Pos>();
+	volatiles = VolatileSet(R * R * R);
 	this->bots = bots;
 }
 
@@ -143,11 +140,10 @@ string State::validate_command(Bot* b, shared_ptr<Command> cmd, bool save) {
 	if (!msg.empty()) return msg;
 
 	vector<Pos> v = cmd->get_volatiles(b, this);
-	for (Pos& p1 : v)
-		for (Pos& p2 : volatiles) {
-			if (p1 == p2) return "Bot actions interfere";
-		}
-	if (save) volatiles.insert(volatiles.end(), v.begin(), v.end());
+	for (Pos& p : v)
+		if (volatiles.contains(p.pack(R))) return "Bot actions interfere";
+	if (save)
+		for (Pos& p : v) volatiles.insert(p.pack(R));
 	return "";
 }
 
@@ -171,13 +167,102 @@ void State::add_passive_energy() {
 // }
 
 
-bool State::__getitem__(const Pos& p) const {
+bool State::getbit(const Pos& p) const {
 	return matrix.get(p);
 }
 
 
-void State::__setitem__(const Pos& p, bool value) {
+void State::setbit(const Pos& p, bool value) {
+	if (logging && matrix.get(p) != value) undo_log.push_back({p, !value, -1});
 	matrix.set(p, value);
+	if (connectivity) connectivity->set(p, value);
+}
+
+
+int State::set_region(const Pos& a, const Pos& b, bool value) {
+	if (logging) {
+		Pos p(0, 0, 0);
+		for (p.x = std::min(a.x, b.x); p.x <= std::max(a.x, b.x); p.x++)
+			for (p.y = std::min(a.y, b.y); p.y <= std::max(a.y, b.y); p.y++)
+				for (p.z = std::min(a.z, b.z); p.z <= std::max(a.z, b.z); p.z++)
+					if (matrix.get(p) != value) undo_log.push_back({p, !value, -1});
+	}
+	int changed = matrix.set_region(a, b, value);
+	if (connectivity && changed) {
+		Pos p(0, 0, 0);
+		for (p.x = std::min(a.x, b.x); p.x <= std::max(a.x, b.x); p.x++)
+			for (p.y = std::min(a.y, b.y); p.y <= std::max(a.y, b.y); p.y++)
+				for (p.z = std::min(a.z, b.z); p.z <= std::max(a.z, b.z); p.z++)
+					connectivity->set(p, value);
+	}
+	return changed;
+}
+
+
+bool State::claim_region(const Pos& a, const Pos& b) {
+	std::pair<Pos, Pos> r(
+		Pos(std::min(a.x, b.x), std::min(a.y, b.y), std::min(a.z, b.z)),
+		Pos(std::max(a.x, b.x), std::max(a.y, b.y), std::max(a.z, b.z)));
+	for (auto& other : group_regions)
+		if (other == r) return false;
+	group_regions.push_back(r);
+	return true;
+}
+
+
+bool State::all_grounded() {
+	if (!connectivity) connectivity.emplace(matrix);
+	return connectivity->all_grounded();
+}
+
+
+void State::save_bot(const Bot& b) {
+	if (!logging) return;
+	undo_log.push_back({Pos(0, 0, 0), false, b.bid});
+	bot_log.push_back(b);
+}
+
+
+StateMark State::mark() const {
+	return StateMark{undo_log.size(), energy, high_harmonics, halted};
+}
+
+
+void State::rollback(const StateMark& m) {
+	assert (m.log_size <= undo_log.size());
+	bool was_logging = logging;
+	logging = false;
+	while (undo_log.size() > m.log_size) {
+		const UndoEntry& e = undo_log.back();
+		if (e.bid < 0) {
+			setbit(e.p, e.value);
+		} else {
+			bots[e.bid] = bot_log.back();
+			bot_log.pop_back();
+		}
+		undo_log.pop_back();
+	}
+	logging = was_logging;
+	energy = m.energy;
+	high_harmonics = m.high_harmonics;
+	halted = m.halted;
+}
+
+
+void State::stop_logging() {
+	logging = false;
+	undo_log.clear();
+	bot_log.clear();
+}
+
+
+bool State::__getitem__(const Pos& p) const {
+	return getbit(p);
+}
+
+
+void State::__setitem__(const Pos& p, bool value) {
+	setbit(p, value);
 }
 
 /*====================== EMULATOR =======================*/
@@ -211,11 +296,15 @@ Emulator::Emulator(const State& S)
 void Emulator::set_trace(vector<shared_ptr<Command>> bytes) {
 	trace = bytes;
 	tracepointer = 0;
+	trace_generation++;
 }
 
 
 void Emulator::set_state(State S) {
 	this->S = S;
+	// snapshots can't be restored across a different state
+	snapshots.clear();
+	this->S.stop_logging();
 }
 
 
@@ -238,8 +327,6 @@ string Emulator::check_command_inner(std::shared_ptr<Command> cmd, bool save) {
 		string msg = S.validate_command(nextbot(), trace[unchecked], true);
 		if (!msg.empty()) {
 			debug(msg);
-			for (auto p : S.volatiles) debug(p.__repr__());
-				debug(' ');
 			for (auto b : S.bots) if (b.active) debug(b.position.__repr__());
 			return "Trace already contains invalid commands";
 		}
@@ -272,43 +359,161 @@ string Emulator::check_add_command(std::shared_ptr<Command> cmd) {
 }
 
 
+string Emulator::error_context(const Bot& b, shared_ptr<Command> cmd) {
+	return "step " + std::to_string(time_step) + ", bot " + std::to_string(b.bid) +
+		   " at " + b.position.__repr__() + " (" + cmd->__repr__() + "): ";
+}
+
+
 void Emulator::validate_one_step() {
 	reset_assumptions();
 	unsigned temppointer = tracepointer;
 	for (Bot& b : S.bots) {
 		if (!b.active) continue;
-       	if (temppointer == trace.size()) {
-            // TODO : log
-        	std::cout << "End of trace" << "\n";
-            assert (false);
-        }
-        shared_ptr<Command> cmd = trace[temppointer++];
-        // std::cout << (*(b.command)).__repr__() << "\n";
-
-        string msg = S.validate_command(&b, cmd, true);
-        if (!msg.empty()) {
-        	// TODO log
-        	std::cout << msg << "\n";
-        	assert (false);
-        }
+		if (temppointer == trace.size())
+			throw emulation_error("trace ended at step " + std::to_string(time_step));
+		shared_ptr<Command> cmd = trace[temppointer++];
+
+		string msg = S.validate_command(&b, cmd, true);
+		if (!msg.empty())
+			throw emulation_error(error_context(b, cmd) + msg);
+	}
+	validate_groups(tracepointer, temppointer);
+}
+
+
+// FusionP/FusionS pairs and GFill/GVoid groups, for the commands
+// trace[first, last) of the active bots of this step.
+void Emulator::validate_groups(unsigned first, unsigned last) {
+	vector<Bot*> bots;
+	for (Bot& b : S.bots)
+		if (b.active) bots.push_back(&b);
+	assert (bots.size() == last - first);
+
+	auto command_at = [&](const Pos& p) -> shared_ptr<Command> {
+		for (unsigned i = 0; i < bots.size(); i++)
+			if (bots[i]->position == p) return trace[first + i];
+		return nullptr;
+	};
+
+	struct Group {
+		bool fill = false;
+		Pos p1 = Pos(0, 0, 0);
+		Pos p2 = Pos(0, 0, 0);
+		vector<Pos> corners;
+	};
+	vector<Group> groups;
+
+	for (unsigned i = 0; i < bots.size(); i++) {
+		Bot& b = *bots[i];
+		shared_ptr<Command> cmd = trace[first + i];
+
+		if (auto f = std::dynamic_pointer_cast<FusionP>(cmd)) {
+			auto other = std::dynamic_pointer_cast<FusionS>(command_at(b.position + f->nd));
+			if (!other || b.position + f->nd + other->nd != b.position)
+				throw emulation_error(error_context(b, cmd) + "FusionP without a matching FusionS");
+		} else if (auto f = std::dynamic_pointer_cast<FusionS>(cmd)) {
+			auto other = std::dynamic_pointer_cast<FusionP>(command_at(b.position + f->nd));
+			if (!other || b.position + f->nd + other->nd != b.position)
+				throw emulation_error(error_context(b, cmd) + "FusionS without a matching FusionP");
+		} else {
+			Group g;
+			Diff nd(0, 0, 0), fd(0, 0, 0);
+			if (auto gf = std::dynamic_pointer_cast<GFill>(cmd)) {
+				g.fill = true; nd = gf->nd; fd = gf->fd;
+			} else if (auto gv = std::dynamic_pointer_cast<GVoid>(cmd)) {
+				g.fill = false; nd = gv->nd; fd = gv->fd;
+			} else {
+				continue;
+			}
+			Pos corner = b.position + nd;
+			Pos other = corner + fd;
+			g.p1 = Pos(std::min(corner.x, other.x), std::min(corner.y, other.y), std::min(corner.z, other.z));
+			g.p2 = Pos(std::max(corner.x, other.x), std::max(corner.y, other.y), std::max(corner.z, other.z));
+			auto it = std::find_if(groups.begin(), groups.end(), [&](const Group& h) {
+				return h.fill == g.fill && h.p1 == g.p1 && h.p2 == g.p2;
+			});
+			if (it == groups.end()) {
+				groups.push_back(g);
+				it = groups.end() - 1;
+			}
+			if (std::find(it->corners.begin(), it->corners.end(), corner) != it->corners.end())
+				throw emulation_error(error_context(b, cmd) + "two bots of a group at the same corner");
+			it->corners.push_back(corner);
+		}
+	}
+
+	if (groups.empty()) return;
+
+	for (const Group& g : groups) {
+		// corners are distinct and each of them is an end of fd, so they
+		// are corners of the region; only their number is left to check
+		if (g.corners.size() != (1u << region_dimension(g.p1, g.p2)))
+			throw emulation_error(
+				"step " + std::to_string(time_step) + ": incomplete group for region " +
+				g.p1.__repr__() + " " + g.p2.__repr__());
+		Pos p(0, 0, 0);
+		for (p.x = g.p1.x; p.x <= g.p2.x; p.x++)
+			for (p.y = g.p1.y; p.y <= g.p2.y; p.y++)
+				for (p.z = g.p1.z; p.z <= g.p2.z; p.z++) {
+					int idx = p.pack(S.R);
+					if (S.volatiles.contains(idx))
+						throw emulation_error(
+							"step " + std::to_string(time_step) + ": group region " +
+							g.p1.__repr__() + " " + g.p2.__repr__() + " interferes at " + p.__repr__());
+					S.volatiles.insert(idx);
+				}
 	}
-	// TODO: validate group operations
 }
 
 
 void Emulator::run_one_step() {
+	drop_dead_snapshots();
 	time_step++;
 	validate_one_step();
 
 	S.fissioned = vector<unsigned>();
+	S.group_regions.clear();
 
+	int64_t energy_before = S.energy;
 	S.add_passive_energy();
-	for (Bot& b : S.bots) {
-		if (!b.active) continue;
-		shared_ptr<Command> cmd = trace[tracepointer++];
-		cmd->execute(&b, &S);
+	// FusionP deactivates the secondary bot, which may come later in the
+	// order, so collect the bots that act in this step first
+	vector<Bot*> acting;
+	for (Bot& b : S.bots)
+		if (b.active) acting.push_back(&b);
+
+	if (!record_timeline) {
+		for (Bot* b : acting) {
+			shared_ptr<Command> cmd = trace[tracepointer++];
+			cmd->execute(b, &S);
+		}
+	} else {
+		TimelineRow row{};
+		row.step = time_step;
+		row.active = acting.size();
+		row.high = S.high_harmonics;
+		row.energy_bots = 20 * row.active;
+		row.energy_harmonics = S.energy - energy_before - row.energy_bots;
+		for (Bot* b : acting) {
+			shared_ptr<Command> cmd = trace[tracepointer++];
+			int64_t before = S.energy;
+			cmd->execute(b, &S);
+			int64_t delta = S.energy - before;
+			switch (cmd->kind()) {
+			case CommandKind::Wait: row.waiting++; break;
+			case CommandKind::Move: row.energy_move += delta; break;
+			case CommandKind::Fill: row.energy_fill += delta; break;
+			case CommandKind::Void: row.energy_void += delta; break;
+			case CommandKind::Fission:
+			case CommandKind::Fusion: row.energy_fission_fusion += delta; break;
+			default: assert (delta == 0);
+			}
+		}
+		timeline.push_back(row);
 	}
 
+	// Fission::execute() has saved these bots
 	for (unsigned bid : S.fissioned) {
 		S.bots[bid].active = true;
 	}
@@ -321,7 +526,22 @@ void Emulator::run_one_step() {
 void Emulator::run_full() {
 	logger->mode = "auto";
 	logger->start();
-	while (!S.halted) run_one_step();
+	try {
+		while (!S.halted) {
+			run_one_step();
+			if (!S.high_harmonics && !S.all_grounded())
+				throw emulation_error(
+					"ungrounded voxels in low harmonics after step " + std::to_string(time_step));
+		}
+		if (tracepointer != trace.size())
+			throw emulation_error("commands after Halt");
+		if (!src_matches_tgt())
+			throw emulation_error("final model doesn't match the target");
+	} catch (const base_error& e) {
+		aborted = true;
+		logger->logerror(e.what());
+		throw;
+	}
 	logger->logsuccess(S.energy);
 }
 
@@ -331,11 +551,74 @@ void Emulator::run_commands(vector<shared_ptr<Command>> newtrace) {
 	logger->start();
 	trace = newtrace;
 	tracepointer = 0;
+	trace_generation++;
 	while ((tracepointer < trace.size()) && !S.halted) run_one_step();
 	logger->logsuccess(S.energy);
 }
 
 
+shared_ptr<Snapshot> Emulator::snapshot() {
+	drop_dead_snapshots();
+	auto snap = std::make_shared<Snapshot>(Snapshot{
+		S.mark(), time_step, tracepointer, trace.size(), trace_generation, aborted});
+	snapshots.push_back(snap);
+	S.logging = true;
+	return snap;
+}
+
+
+void Emulator::restore(shared_ptr<Snapshot> snap) {
+	assert (snap != nullptr);
+	auto it = std::find_if(snapshots.begin(), snapshots.end(),
+		[&](const std::weak_ptr<Snapshot>& w) { return w.lock() == snap; });
+	if (it == snapshots.end())
+		throw emulation_error("snapshot is no longer valid");
+	// later snapshots refer to the log entries we are about to undo
+	snapshots.erase(it + 1, snapshots.end());
+
+	S.rollback(snap->state);
+	time_step = snap->time_step;
+	while (!timeline.empty() && timeline.back().step > time_step)
+		timeline.pop_back();
+	aborted = snap->aborted;
+	if (trace_generation == snap->trace_generation) {
+		// drop commands added by add_command() since
+		if (trace.size() > snap->trace_size) trace.resize(snap->trace_size);
+		tracepointer = snap->tracepointer;
+	} else {
+		// the trace was replaced, none of it belongs to the snapshot
+		trace.clear();
+		tracepointer = 0;
+	}
+	reset_assumptions();
+}
+
+
+void Emulator::drop_dead_snapshots() {
+	while (!snapshots.empty() && snapshots.back().expired())
+		snapshots.pop_back();
+	if (snapshots.empty() && S.logging)
+		S.stop_logging();
+}
+
+
+std::unique_ptr<Emulator> Emulator::fork() const {
+	// a new State with the matrices and bots, and without the undo log
+	auto em = std::make_unique<Emulator>(S);
+	em->S.halted = S.halted;
+	em->time_step = time_step;
+	em->trace = trace;
+	em->tracepointer = tracepointer;
+	em->aborted = aborted;
+	em->record_timeline = record_timeline;
+	em->timeline = timeline;
+	em->logger->problemname = logger->problemname;
+	em->logger->solutionname = logger->solutionname;
+	em->reset_assumptions();
+	return em;
+}
+
+
 bool Emulator::src_matches_tgt() {
 	return S.matrix == S.target;
 }
@@ -349,9 +632,9 @@ int64_t Emulator::energy() {
 void Emulator::reset_assumptions() {
 	unchecked = tracepointer;
 	botindex = 0;
-	S.volatiles = vector<Pos>();
+	S.volatiles.clear();
 	for (Bot& b : S.bots)
-		if (b.active) S.volatiles.push_back(b.position);
+		if (b.active) S.volatiles.insert(b.position.pack(S.R));
 }
 
 
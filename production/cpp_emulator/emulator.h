@@ -4,9 +4,12 @@
 #include <vector>
 #include <string>
 #include <optional>
+#include <memory>
+#include <algorithm>
 
 #include "coordinates.h"
 #include "matrix.h"
+#include "connectivity.h"
 
 struct Command;
 class State;
@@ -26,6 +29,61 @@ public:
 };
 
 
+// Voxels made volatile during the current time step, by packed index.
+// A voxel is in the set iff its stamp is the current generation, so
+// clear() is O(1). It's scratch rather than state: copies start empty.
+class VolatileSet {
+public:
+	explicit VolatileSet(int size = 0) : size(size) { }
+	VolatileSet(const VolatileSet& other) : size(other.size) { }
+	VolatileSet& operator=(const VolatileSet& other) {
+		size = other.size;
+		stamp.clear();
+		gen = 1;
+		return *this;
+	}
+
+	bool contains(int idx) const {
+		return !stamp.empty() && stamp[idx] == gen;
+	}
+
+	void insert(int idx) {
+		if (stamp.empty()) stamp.assign(size, 0);  // allocated on first use
+		stamp[idx] = gen;
+	}
+
+	void clear() {
+		if (++gen == 0) {
+			std::fill(stamp.begin(), stamp.end(), 0);
+			gen = 1;
+		}
+	}
+
+private:
+	int size;
+	uint16_t gen = 1;
+	std::vector<uint16_t> stamp;
+};
+
+
+// What State::rollback() needs besides the undo log.
+struct StateMark {
+	size_t log_size;
+	int64_t energy;
+	bool high_harmonics;
+	bool halted;
+};
+
+
+// A voxel change (position, old value), or with bid >= 0 a bot change,
+// whose old copy of the bot is the last one in State::bot_log.
+struct UndoEntry {
+	Pos p;
+	bool value;
+	int bid;
+};
+
+
 class State {
 public:
 	int R;
@@ -48,6 +106,12 @@ public:
 
 	bool getbit(const Pos& p) const;
 	void setbit(const Pos& p, bool value);
+	// returns the number of voxels that changed
+	int set_region(const Pos& a, const Pos& b, bool value);
+	// true for the first bot of a group to execute on this region this step
+	bool claim_region(const Pos& a, const Pos& b);
+
+	bool all_grounded();
 
 	bool assert_well_formed();
 
@@ -63,10 +127,54 @@ public:
 	void __setitem__(const Pos& p, bool value);
 
 	// auxiliaries for move validations
-	std::vector<Pos> volatiles;
+	VolatileSet volatiles;
 	std::vector<Pos> filled;
 	std::vector<unsigned> fissioned;
+	std::vector<std::pair<Pos, Pos>> group_regions;
+
+	// Undo log of voxel and bot changes, kept only while `logging` is on.
+	// Everything else is small and goes to the mark.
+	std::vector<UndoEntry> undo_log;
+	std::vector<Bot> bot_log;
+	bool logging = false;
+	// commands call it before changing a bot
+	void save_bot(const Bot& b);
+	StateMark mark() const;
+	void rollback(const StateMark& m);
+	void stop_logging();
 
+private:
+	// built on the first groundedness check, then kept in sync by
+	// setbit/set_region; commands must not write to matrix directly
+	std::optional<ConnectivityIndex> connectivity;
+
+};
+
+
+// One time step of Emulator::timeline. Energy is split by where it
+// went: passive (harmonics, per active bot) and by command kind.
+struct TimelineRow {
+	int32_t step;
+	int32_t active;		// bots at the start of the step
+	int32_t waiting;	// of them doing Wait
+	int32_t high;		// harmonics during the step
+	int64_t energy_harmonics;
+	int64_t energy_bots;
+	int64_t energy_move;
+	int64_t energy_fill;	// Fill and GFill
+	int64_t energy_void;	// Void and GVoid, negative
+	int64_t energy_fission_fusion;
+};
+
+
+class Snapshot {
+public:
+	StateMark state;
+	int time_step;
+	unsigned tracepointer;
+	size_t trace_size;
+	unsigned trace_generation;
+	bool aborted;
 };
 
 
@@ -79,6 +187,10 @@ public:
 	std::unique_ptr<Logger> logger;
 	bool aborted;
 
+	// when set, run_one_step() appends a row per step to timeline
+	bool record_timeline = false;
+	std::vector<TimelineRow> timeline;
+
 	Emulator(std::optional<Matrix> src, std::optional<Matrix> tgt);
 	Emulator(const State& S);
 
@@ -92,9 +204,20 @@ public:
     std::string check_add_command(std::shared_ptr<Command>);
 
 	void run_one_step();
+	// Runs the whole trace with all the checks of the official checker
+	// (groups, groundedness in low harmonics, final state); throws
+	// emulation_error on the first problem.
 	void run_full();
 	void run_commands(std::vector<std::shared_ptr<Command>> newtrace);
 
+	// Cheap backtracking: restore() undoes everything done since the
+	// snapshot, which stays valid until something older is restored.
+	// Cost is proportional to the voxels changed in between.
+	std::shared_ptr<Snapshot> snapshot();
+	void restore(std::shared_ptr<Snapshot> snap);
+	// Independent copy, sharing nothing but the (immutable) commands.
+	std::unique_ptr<Emulator> fork() const;
+
 	bool src_matches_tgt();
 
 	int64_t energy();
@@ -108,10 +231,16 @@ public:
 private:
 	unsigned unchecked;
 	unsigned botindex;		// bots starting from bots[botindex] have no checked trace
+	unsigned trace_generation = 0;	// bumped whenever the trace is replaced
+	std::vector<std::weak_ptr<Snapshot>> snapshots;	// oldest first
+
+	void drop_dead_snapshots();
 	Bot* nextbot();
 
 	void reset_assumptions();
 	void validate_one_step();
+	void validate_groups(unsigned first, unsigned last);
+	std::string error_context(const Bot& b, std::shared_ptr<Command> cmd);
 	std::string check_command_inner(std::shared_ptr<Command>, bool save);
 
 };
@@ -0,0 +1,182 @@
+#include "estimate.h"
+#include "commands.h"
+#include "logger.h"
+#include "trace_io.h"
+
+#include <algorithm>
+#include <string>
+#include <utility>
+#include <vector>
+
+using std::string;
+using std::vector;
+
+const int MAXBID = 40;
+
+
+namespace {
+
+struct EBot {
+	Pos position = Pos(0, 0, 0);
+	vector<uint8_t> seeds;
+};
+
+
+Diff nd(uint8_t b) {
+	if ((b >> 3) >= 27) throw parser_error("invalid nd");
+	return Command::get_nd(b);
+}
+
+
+std::pair<Pos, Pos> normalized(Pos a, Pos b) {
+	return {
+		Pos(std::min(a.x, b.x), std::min(a.y, b.y), std::min(a.z, b.z)),
+		Pos(std::max(a.x, b.x), std::max(a.y, b.y), std::max(a.z, b.z))};
+}
+
+}
+
+
+int64_t estimate_energy(Matrix matrix, const uint8_t *data, size_t size) {
+	const int R = matrix.R;
+	const int64_t volume = (int64_t)R * R * R;
+	auto inside = [&](const Pos &p, size_t at) {
+		if (!p.is_inside(R))
+			throw emulation_error("out of bounds at byte " + std::to_string(at));
+	};
+
+	vector<EBot> bots(MAXBID + 1);
+	for (int i = 2; i <= MAXBID; i++) bots[1].seeds.push_back(i);
+	vector<uint8_t> active = {1};	// sorted by bid
+
+	int64_t energy = 0;
+	bool high = false;
+	bool halted = false;
+	size_t pos = 0;
+	int step = 0;
+	vector<uint8_t> born, fused;
+	vector<std::pair<Pos, Pos>> regions;	// GFill/GVoid done this step
+
+	while (!halted) {
+		if (pos == size)
+			throw emulation_error("trace ended at step " + std::to_string(step));
+		step++;
+		energy += (high ? 30 : 3) * volume + 20 * (int64_t)active.size();
+		born.clear();
+		fused.clear();
+		regions.clear();
+
+		for (uint8_t bid : active) {
+			if (pos == size)
+				throw emulation_error("trace ended at step " + std::to_string(step));
+			const uint8_t *p = data + pos;
+			size_t at = pos;
+			int n = command_size(p[0]);
+			if (pos + n > size)
+				throw parser_error("unexpected end of trace at byte " + std::to_string(pos));
+			pos += n;
+			EBot &b = bots[bid];
+			uint8_t c = p[0];
+
+			if (c == 0b11111111) {
+				halted = true;
+				continue;
+			}
+			if (c == 0b11111110) continue;
+			if (c == 0b11111101) {
+				high = !high;
+				continue;
+			}
+			if ((c & 0b1111) == 0b0100) {
+				Diff d = Command::get_lld(c >> 4, p[1]);
+				b.position += d;
+				energy += 2 * d.mlen();
+				continue;
+			}
+			if ((c & 0b1111) == 0b1100) {
+				Diff d1 = Command::get_sld(c >> 4, p[1]);
+				Diff d2 = Command::get_sld(c >> 6, p[1] >> 4);
+				b.position += d1;
+				b.position += d2;
+				energy += 2 * (d1.mlen() + 2 + d2.mlen());
+				continue;
+			}
+
+			Pos q = b.position + nd(c);
+			switch (c & 0b111) {
+			case 0b101: {	// Fission
+				unsigned m = p[1];
+				if (m + 1 > b.seeds.size())
+					throw emulation_error("Fission without enough seeds at byte " + std::to_string(at));
+				EBot &child = bots[b.seeds[0]];
+				child.position = q;
+				child.seeds.assign(b.seeds.begin() + 1, b.seeds.begin() + m + 1);
+				born.push_back(b.seeds[0]);
+				b.seeds.erase(b.seeds.begin(), b.seeds.begin() + m + 1);
+				energy += 24;
+				break;
+			}
+			case 0b011:		// Fill
+				inside(q, at);
+				if (!matrix.get(q)) {
+					matrix.set(q, true);
+					energy += 12;
+				} else {
+					energy += 6;
+				}
+				break;
+			case 0b010:		// Void
+				inside(q, at);
+				if (matrix.get(q)) {
+					matrix.set(q, false);
+					energy -= 12;
+				} else {
+					energy += 3;
+				}
+				break;
+			case 0b111: {	// FusionP
+				auto other = std::find_if(active.begin(), active.end(),
+					[&](uint8_t i) { return i != bid && bots[i].position == q; });
+				if (other == active.end())
+					throw emulation_error("FusionP without a pair at byte " + std::to_string(at));
+				EBot &b2 = bots[*other];
+				b.seeds.push_back(*other);
+				b.seeds.insert(b.seeds.end(), b2.seeds.begin(), b2.seeds.end());
+				std::sort(b.seeds.begin(), b.seeds.end());
+				b2.seeds.clear();
+				fused.push_back(*other);
+				energy -= 24;
+				break;
+			}
+			case 0b110:		// FusionS, all done by FusionP
+				break;
+			default: {		// GFill, GVoid
+				Pos q2 = q + Command::get_fd(p[1], p[2], p[3]);
+				inside(q, at);
+				inside(q2, at);
+				auto r = normalized(q, q2);
+				if (std::find(regions.begin(), regions.end(), r) != regions.end())
+					break;
+				regions.push_back(r);
+				int64_t n = (int64_t)(r.second.x - r.first.x + 1) *
+					(r.second.y - r.first.y + 1) * (r.second.z - r.first.z + 1);
+				bool fill = (c & 0b111) == 0b001;
+				int64_t changed = matrix.set_region(q, q2, fill);
+				energy += fill ? 12 * changed + 6 * (n - changed)
+				               : -12 * changed + 3 * (n - changed);
+			}
+			}
+		}
+
+		if (!fused.empty() || !born.empty()) {
+			active.erase(std::remove_if(active.begin(), active.end(), [&](uint8_t i) {
+				return std::find(fused.begin(), fused.end(), i) != fused.end();
+			}), active.end());
+			active.insert(active.end(), born.begin(), born.end());
+			std::sort(active.begin(), active.end());
+		}
+	}
+	if (pos != size)
+		throw emulation_error("commands after Halt");
+	return energy;
+}
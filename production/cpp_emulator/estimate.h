@@ -0,0 +1,14 @@
+#pragma once
+
+#include "matrix.h"
+
+#include <stdint.h>
+
+// Energy of a .nbt trace, computed straight from the bytes without
+// building commands or checking legality: only the bots (positions and
+// seeds), the harmonics and the voxels are tracked, the latter for the
+// Fill/Void costs. On a valid trace the result equals Emulator's, on an
+// invalid one it's just a number. Throws parser_error on malformed data
+// and emulation_error on what can't even be costed (a trace without
+// Halt, a Fission without seeds, a Fill out of bounds).
+int64_t estimate_energy(Matrix matrix, const uint8_t *data, size_t size);
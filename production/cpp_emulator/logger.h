@@ -6,35 +6,27 @@
 #include <chrono>
 #include <memory>
 #include <exception>
+#include <stdexcept>
 
 
 class base_error : public std::runtime_error {
 public:
-	base_error(const char* m) : std::runtime_error(m) { }
+	base_error(const std::string& m) : std::runtime_error(m) { }
 };
 
 class emulation_error : public base_error {
 public:
-	emulation_error(const char* m) : base_error(m) { }
-	const char* what() const throw() override {
-		return (std::string("Emulation error: ") + runtime_error::what()).c_str();
-	};
+	emulation_error(const std::string& m) : base_error("Emulation error: " + m) { }
 };
 
 class parser_error : public base_error {
 public:
-	parser_error(const char* m) : base_error(m) { }
-	const char* what() const throw() override {
-		return (std::string("Parser erro: ") + runtime_error::what()).c_str();
-	};
+	parser_error(const std::string& m) : base_error("Parser error: " + m) { }
 };
 
 class malfunc_error :  public base_error {
 public:
-	malfunc_error(const char* m) : base_error(m) { }
-	const char* what() const throw() override {
-		return (std::string("Emulator malfunction: ") + runtime_error::what()).c_str();
-	};
+	malfunc_error(const std::string& m) : base_error("Emulator malfunction: " + m) { }
 };
 
 
@@ -7,61 +7,77 @@
 #include <assert.h>
 #include <algorithm>
 
+// Voxel w = x*R*R + y*R + z is bit w % 64 of words[w / 64], which is
+// the same bit order as the .mdl format (bytes are little-endian).
+// Bits past R*R*R are always zero, so whole words can be compared
+// and counted without masking.
 class Matrix {
 public:
     int num_full = 0;
     int R;
 private:
-    std::vector<uint8_t> data;
+    std::vector<uint64_t> words;
 public:
     Matrix(int R) : R(R) {
         assert(0 <= R && R <= 250);
-        data.assign((R * R * R + 7) / 8, 0);
+        words.assign((R * R * R + 63) / 64, 0);
     }
 
     static Matrix parse(const std::vector<uint8_t> &raw) {
         return Matrix(raw);
     }
 
+    // Inverse of parse().
+    std::vector<uint8_t> compose() const {
+        std::vector<uint8_t> result(1 + (R * R * R + 7) / 8);
+        result[0] = R;
+        for (size_t i = 1; i < result.size(); i++) {
+            result[i] = words[(i - 1) / 8] >> (8 * ((i - 1) % 8));
+        }
+        return result;
+    }
+
     bool get(const Pos& p) const {
         assert(p.is_inside(R));
-    	int w = p.x*R*R + p.y*R + p.z;
-	    return data[w / 8] & (1 << (w % 8));
+        int w = p.x*R*R + p.y*R + p.z;
+        return words[w / 64] >> (w % 64) & 1;
     }
 
     void set(const Pos& p, bool value) {
         assert(p.is_inside(R));
-    	int w = p.x*R*R + p.y*R + p.z;
-        if (data[w / 8] & (1 << (w % 8))) {
-            if (!value) {
-                num_full--;
-                data[w / 8] &= ~(1 << (w % 8));
-            }
-        } else {
-            if (value) {
-                num_full++;
-                data[w / 8] |= 1 << (w % 8);
-            }
+        int w = p.x*R*R + p.y*R + p.z;
+        uint64_t bit = uint64_t(1) << (w % 64);
+        uint64_t &word = words[w / 64];
+        if (bool(word & bit) != value) {
+            word ^= bit;
+            num_full += value ? 1 : -1;
         }
     }
 
     bool operator==(const Matrix &other) const {
         assert(R == other.R);
-        int q = R * R * R / 8;
-        for (int i = 0; i < q; i++) {
-            if (data[i] != other.data[i]) {
-                return false;
-            }
+        return words == other.words;
+    }
+
+    // Number of voxels that differ between the two matrices.
+    int count_diff(const Matrix &other) const {
+        assert(R == other.R);
+        int cnt = 0;
+        for (size_t i = 0; i < words.size(); i++) {
+            cnt += __builtin_popcountll(words[i] ^ other.words[i]);
         }
-        int garbage = (int)data.size() * 8 - R * R * R;
-        if (garbage) {
-            int tail = 8 - garbage;
-            uint8_t mask = (1 << tail) - 1;
-            if ((data.back() & mask) != (other.data.back() & mask)) {
-                return false;
-            }
+        return cnt;
+    }
+
+    // Matrix of the voxels that differ.
+    Matrix operator^(const Matrix &other) const {
+        assert(R == other.R);
+        Matrix result(R);
+        for (size_t i = 0; i < words.size(); i++) {
+            result.words[i] = words[i] ^ other.words[i];
+            result.num_full += __builtin_popcountll(result.words[i]);
         }
-        return true;
+        return result;
     }
 
     int num_grounded_voxels() const {
@@ -93,37 +109,91 @@ public:
     }
 
     int count_inside_region(Pos p1, Pos p2) const {
+        int cnt = 0;
+        for_each_run(p1, p2, [&](int w1, int w2) {
+            cnt += count_bits(w1, w2);
+            return true;
+        });
+        return cnt;
+    }
+
+    bool is_void_region(Pos p1, Pos p2) const {
+        bool empty = true;
+        for_each_run(p1, p2, [&](int w1, int w2) {
+            empty = count_bits(w1, w2) == 0;
+            return empty;
+        });
+        return empty;
+    }
+
+    // Returns the number of voxels that actually changed.
+    int set_region(Pos p1, Pos p2, bool value) {
+        int changed = 0;
+        for_each_run(p1, p2, [&](int w1, int w2) {
+            for (int i = w1 / 64; i <= (w2 - 1) / 64; i++) {
+                uint64_t mask = range_mask(i, w1, w2);
+                uint64_t before = words[i];
+                words[i] = value ? before | mask : before & ~mask;
+                changed += __builtin_popcountll(before ^ words[i]);
+            }
+            return true;
+        });
+        num_full += value ? changed : -changed;
+        return changed;
+    }
+
+private:
+    // Calls f(w1, w2) for the [w1, w2) bit range of every z-run of the box;
+    // stops early if f returns false.
+    template<typename F>
+    void for_each_run(Pos p1, Pos p2, F f) const {
+        assert(p1.is_inside(R) && p2.is_inside(R));
         int x1 = std::min(p1.x, p2.x);
         int x2 = std::max(p1.x, p2.x);
         int y1 = std::min(p1.y, p2.y);
         int y2 = std::max(p1.y, p2.y);
         int z1 = std::min(p1.z, p2.z);
         int z2 = std::max(p1.z, p2.z);
-        int cnt = 0;
         for (int x = x1; x <= x2; x++) {
             for (int y = y1; y <= y2; y++) {
-                for (int z = z1; z <= z2; z++) {
-                    if (get(Pos(x, y, z))) {
-                        cnt++;
-                    }
+                int base = x*R*R + y*R;
+                if (!f(base + z1, base + z2 + 1)) {
+                    return;
                 }
             }
         }
+    }
+
+    // Bits of word i that fall into [w1, w2).
+    static uint64_t range_mask(int i, int w1, int w2) {
+        int lo = std::max(w1 - i * 64, 0);
+        int hi = std::min(w2 - i * 64, 64);
+        uint64_t mask = hi == 64 ? ~uint64_t(0) : (uint64_t(1) << hi) - 1;
+        return mask & ~((uint64_t(1) << lo) - 1);
+    }
+
+    int count_bits(int w1, int w2) const {
+        int cnt = 0;
+        for (int i = w1 / 64; i <= (w2 - 1) / 64; i++) {
+            cnt += __builtin_popcountll(words[i] & range_mask(i, w1, w2));
+        }
         return cnt;
     }
 
-private:
-    Matrix(const std::vector<uint8_t> &raw)
-        : R(raw.at(0)), data(raw.begin() + 1, raw.end()) {
-        assert((int)data.size() == (R * R * R + 7) / 8);
-        for (int x = 0; x < R; x++) {
-            for (int y = 0; y < R; y++) {
-                for (int z = 0; z < R; z++) {
-                    if (get(Pos(x, y, z))) {
-                        num_full++;
-                    }
-                }
-            }
+    Matrix(const std::vector<uint8_t> &raw) : R(raw.at(0)) {
+        assert(0 <= R && R <= 250);
+        assert((int)raw.size() == 1 + (R * R * R + 7) / 8);
+        words.assign((R * R * R + 63) / 64, 0);
+        for (size_t i = 1; i < raw.size(); i++) {
+            words[(i - 1) / 8] |= uint64_t(raw[i]) << (8 * ((i - 1) % 8));
+        }
+        // padding bits of the last byte are not guaranteed to be zero
+        int tail = R * R * R % 64;
+        if (tail) {
+            words.back() &= (uint64_t(1) << tail) - 1;
+        }
+        for (uint64_t w : words) {
+            num_full += __builtin_popcountll(w);
         }
     }
 };
@@ -0,0 +1,266 @@
+#include "planner.h"
+#include "logger.h"
+
+#include <algorithm>
+#include <queue>
+#include <tuple>
+#include <unordered_map>
+#include <unordered_set>
+
+using std::vector;
+using std::shared_ptr;
+using std::make_shared;
+using std::optional;
+
+namespace {
+
+// Cells taken by the bots routed so far.
+class Reservations {
+public:
+    explicit Reservations(int n) : n(n) { }
+
+    bool taken(int t, int idx) const {
+        auto it = parked.find(idx);
+        if (it != parked.end() && t >= it->second) return true;
+        return cells.count(key(t, idx)) > 0;
+    }
+
+    // Nobody needs the cell at t or later, so a bot can stay there.
+    bool free_from(int t, int idx) const {
+        if (parked.count(idx)) return false;
+        auto it = last.find(idx);
+        return it == last.end() || it->second < t;
+    }
+
+    void reserve(int t, int idx) {
+        cells.insert(key(t, idx));
+        auto it = last.find(idx);
+        if (it == last.end()) last.emplace(idx, t);
+        else it->second = std::max(it->second, t);
+    }
+
+    void park(int t, int idx) {
+        parked[idx] = t;
+    }
+
+private:
+    uint64_t key(int t, int idx) const { return (uint64_t)t * n + idx; }
+
+    uint64_t n;
+    std::unordered_set<uint64_t> cells;
+    std::unordered_map<int, int> parked;  // cell -> since when
+    std::unordered_map<int, int> last;    // cell -> last step in `cells`
+};
+
+
+struct Node {
+    Pos pos;
+    int t;
+    int parent;
+    Diff d1, d2;  // zero for Wait, d2 zero for SMove
+};
+
+
+// Cells made volatile by moving from p by d1, then d2.
+vector<Pos> route_cells(Pos p, Diff d1, Diff d2) {
+    vector<Pos> result = {p};
+    for (Diff d : {d1, d2}) {
+        int len = d.mlen();
+        if (!len) continue;
+        Diff dir(d.dx / len, d.dy / len, d.dz / len);
+        for (int i = 0; i < len; i++) {
+            p += dir;
+            result.push_back(p);
+        }
+    }
+    return result;
+}
+
+
+int heuristic(Pos p, Pos goal) {
+    // nothing covers more than LONG_DISTANCE per step
+    int d = std::abs(p.x - goal.x) + std::abs(p.y - goal.y) + std::abs(p.z - goal.z);
+    return (d + LONG_DISTANCE - 1) / LONG_DISTANCE;
+}
+
+
+// Labels cells by the connected region of free cells they are in, as
+// far as they have been asked about. Bots only ever move between adjacent
+// free cells, so other regions can't be reached whatever the others do.
+class Regions {
+public:
+    explicit Regions(const Matrix &obstacles)
+    : obstacles(obstacles), label((size_t)obstacles.R * obstacles.R * obstacles.R, 0) { }
+
+    bool connected(const Pos &a, const Pos &b) {
+        return of(a) == of(b);
+    }
+
+private:
+    int of(const Pos &p) {
+        const int R = obstacles.R;
+        if (!label[p.pack(R)]) {
+            // BFS over the region, each cell is labeled only once
+            uint16_t l = ++count;
+            vector<Pos> queue = {p};
+            label[p.pack(R)] = l;
+            for (size_t i = 0; i < queue.size(); i++) {
+                for (Diff d : DIRS) {
+                    Pos q = queue[i] + d;
+                    if (!q.is_inside(R) || obstacles.get(q) || label[q.pack(R)]) continue;
+                    label[q.pack(R)] = l;
+                    queue.push_back(q);
+                }
+            }
+        }
+        return label[p.pack(R)];
+    }
+
+    const Matrix &obstacles;
+    // 0 if not labeled yet; only regions of starts get labels
+    vector<uint16_t> label;
+    int count = 0;
+};
+
+
+// Returns the nodes of the route, start first.
+optional<vector<Node>> plan_one(
+        const Matrix &obstacles, const Reservations &res,
+        Pos start, Pos goal, int max_steps, size_t max_expansions) {
+    const int R = obstacles.R;
+    const int start_idx = start.pack(R);
+    // every bot's start is reserved for step 0, its own doesn't count
+    auto taken = [&](int t, const Pos &p) {
+        int idx = p.pack(R);
+        return res.taken(t, idx) && !(t == 0 && idx == start_idx);
+    };
+    auto free = [&](const Pos &p) {
+        return p.is_inside(R) && !obstacles.get(p);
+    };
+
+    vector<Node> nodes;
+    std::unordered_set<uint64_t> closed;
+    auto state_key = [&](int t, const Pos &p) { return (uint64_t)t * R * R * R + p.pack(R); };
+    // (f, h, node), smallest first
+    using Item = std::tuple<int, int, int>;
+    std::priority_queue<Item, vector<Item>, std::greater<Item>> open;
+
+    auto push = [&](Pos p, int t, int parent, Diff d1, Diff d2) {
+        if (!closed.insert(state_key(t, p)).second) return;
+        nodes.push_back(Node{p, t, parent, d1, d2});
+        int h = heuristic(p, goal);
+        open.emplace(t + h, h, (int)nodes.size() - 1);
+    };
+    const Diff zero(0, 0, 0);
+    push(start, 0, -1, zero, zero);
+
+    size_t expansions = 0;
+    while (!open.empty()) {
+        int id = std::get<2>(open.top());
+        open.pop();
+        Pos p = nodes[id].pos;
+        int t = nodes[id].t;
+
+        // (staying at the start, the bot's own reservation doesn't count)
+        if (p == goal && res.free_from(t == 0 ? 1 : t, goal.pack(R))) {
+            vector<Node> route;
+            for (int i = id; i >= 0; i = nodes[i].parent)
+                route.push_back(nodes[i]);
+            std::reverse(route.begin(), route.end());
+            return route;
+        }
+        if (t >= max_steps || taken(t, p)) continue;
+        if (++expansions > max_expansions) break;
+
+        push(p, t + 1, id, zero, zero);
+
+        for (Diff dir : DIRS) {
+            // SMoves, cut short by the first blocked cell
+            Pos q = p;
+            for (int len = 1; len <= LONG_DISTANCE; len++) {
+                q += dir;
+                if (!free(q) || taken(t, q)) break;
+                push(q, t + 1, id, dir * len, zero);
+            }
+            // LMoves
+            Pos corner = p;
+            for (int len1 = 1; len1 <= SHORT_DISTANCE; len1++) {
+                corner += dir;
+                if (!free(corner) || taken(t, corner)) break;
+                for (Diff dir2 : DIRS) {
+                    if (dir2 == dir || dir2 == dir * -1) continue;
+                    Pos q2 = corner;
+                    for (int len2 = 1; len2 <= SHORT_DISTANCE; len2++) {
+                        q2 += dir2;
+                        if (!free(q2) || taken(t, q2)) break;
+                        push(q2, t + 1, id, dir * len1, dir2 * len2);
+                    }
+                }
+            }
+        }
+    }
+    return std::nullopt;
+}
+
+}
+
+
+optional<vector<vector<shared_ptr<Command>>>> plan_routes(
+        const Matrix &obstacles,
+        const vector<Pos> &starts,
+        const vector<Pos> &goals,
+        int max_steps,
+        size_t max_expansions) {
+    if (starts.size() != goals.size())
+        throw malfunc_error("plan_routes: starts and goals differ in length");
+    const int R = obstacles.R;
+    Reservations res(R * R * R);
+    for (const Pos &p : starts) {
+        if (!p.is_inside(R) || obstacles.get(p))
+            throw malfunc_error("plan_routes: bad start " + p.__repr__());
+        res.reserve(0, p.pack(R));
+    }
+    // bots stay at their goals, so two of them can't share one
+    vector<int> goal_cells;
+    for (const Pos &p : goals) {
+        if (!p.is_inside(R) || obstacles.get(p))
+            return std::nullopt;
+        goal_cells.push_back(p.pack(R));
+    }
+    std::sort(goal_cells.begin(), goal_cells.end());
+    if (std::adjacent_find(goal_cells.begin(), goal_cells.end()) != goal_cells.end())
+        return std::nullopt;
+    // otherwise A* would try every step up to max_steps
+    Regions regions(obstacles);
+    for (size_t i = 0; i < starts.size(); i++)
+        if (!regions.connected(starts[i], goals[i]))
+            return std::nullopt;
+
+    vector<vector<shared_ptr<Command>>> routes;
+    size_t steps = 0;
+    auto wait = make_shared<Wait>();
+    for (size_t i = 0; i < starts.size(); i++) {
+        auto route = plan_one(obstacles, res, starts[i], goals[i], max_steps, max_expansions);
+        if (!route) return std::nullopt;
+
+        vector<shared_ptr<Command>> cmds;
+        for (size_t k = 1; k < route->size(); k++) {
+            const Node &from = (*route)[k - 1];
+            const Node &to = (*route)[k];
+            for (const Pos &c : route_cells(from.pos, to.d1, to.d2))
+                res.reserve(from.t, c.pack(R));
+            if (to.d1 == Diff(0, 0, 0))
+                cmds.push_back(wait);
+            else if (to.d2 == Diff(0, 0, 0))
+                cmds.push_back(make_shared<SMove>(to.d1));
+            else
+                cmds.push_back(make_shared<LMove>(to.d1, to.d2));
+        }
+        res.park(route->back().t, goals[i].pack(R));
+        steps = std::max(steps, cmds.size());
+        routes.push_back(std::move(cmds));
+    }
+    for (auto &cmds : routes)
+        cmds.resize(steps, wait);
+    return routes;
+}
@@ -0,0 +1,27 @@
+#pragma once
+
+#include "commands.h"
+#include "coordinates.h"
+#include "matrix.h"
+
+#include <memory>
+#include <optional>
+#include <vector>
+
+// Cooperative pathfinding: space-time A* for one bot after another, with
+// a reservation table of the cells earlier bots make volatile at every
+// step (their position when waiting, the whole route of an SMove/LMove).
+//
+// Bot i goes from starts[i] to goals[i]; earlier bots have priority.
+// Returns a command list per bot, all of the same length (padded with
+// Wait), such that step t of all of them makes a valid time step.
+// Obstacles (full voxels, bots that don't move) must not be entered.
+// nullopt if some bot can't be routed in max_steps steps, if two goals
+// are the same, if a goal is cut off from its start by the obstacles, or
+// if the search for one bot expands more than max_expansions states.
+std::optional<std::vector<std::vector<std::shared_ptr<Command>>>> plan_routes(
+    const Matrix &obstacles,
+    const std::vector<Pos> &starts,
+    const std::vector<Pos> &goals,
+    int max_steps,
+    size_t max_expansions = 1000000);
@@ -1,17 +1,11 @@
-# Copied from pyjs_emulator
-
-import subprocess
-import os
-import os.path
 import sys
-
-import tempfile
-from tempfile import NamedTemporaryFile
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Union, List, Tuple
+
+import numpy as np
 
 import production.cpp_emulator.emulator as Cpp
-from production import utils
+from production.trace_sink import TraceSink, trace_bytes
 from production import data_files
 
 
@@ -24,40 +18,115 @@ class EmulatorResult:
 def run_full(
         src_model_data: Optional[bytes],
         tgt_model_data: Optional[bytes],
-        trace_data: bytes) -> EmulatorResult:
-    em = Cpp.Emulator()
-    if src_model_data:
-        em.set_model(src_model_data, 's')
-    if tgt_model_data:
-        em.set_model(tgt_model_data, 's')
-    em.set_trace(trace_data)
-    em.setlogfile(str(utils.project_root() / 'outputs' / 'cpp_emulator.log'))
+        trace_data: Union[bytes, TraceSink]) -> EmulatorResult:
+    '''Same contract as pyjs_emulator.run.run_full, but in-process.
+
+    On failure extra has 'error', 'step' and 'command' (index of the
+    first command of the failed step; both 0 if the trace is malformed).
+    '''
+    src = Cpp.Matrix.parse(src_model_data) if src_model_data else None
+    tgt = Cpp.Matrix.parse(tgt_model_data) if tgt_model_data else None
 
+    return _run(Cpp.Emulator(src, tgt), trace_data)
+
+
+def _run(em, trace_data) -> EmulatorResult:
     try:
+        em.set_trace(trace_bytes(trace_data))
         em.run()
     except Cpp.SimulatorException as e:
-        return EmulatorResult(energy = None, 
-                              extra = {'error message' : str(e)})
+        return EmulatorResult(
+            energy=None,
+            extra=dict(error=str(e), step=em.time_step, command=em.tracepointer))
 
-    return EmulatorResult(energy = em.energy(), extra = {})
+    return EmulatorResult(
+        energy=em.energy(),
+        extra=dict(steps=em.time_step, commands=em.tracepointer))
 
 
-# Usage:
-#   run.py <task_number>
-#   run.py <default_solver_cmd.py> <task_number>
-def main():
-    if len(sys.argv) == 3:
-        (_, solver_cmd, task_number_str) = sys.argv
-    else:
-        solver_cmd = "production.default_solver"
-        (_, task_number_str) = sys.argv
+def run_timeline(
+        src_model_data: Optional[bytes],
+        tgt_model_data: Optional[bytes],
+        trace_data: Union[bytes, TraceSink]) -> Tuple[EmulatorResult, np.ndarray]:
+    '''run_full() plus the per-step timeline (TimelineRow in emulator.h).
+
+    On failure the timeline ends with the last completed step.
+    '''
+    src = Cpp.Matrix.parse(src_model_data) if src_model_data else None
+    tgt = Cpp.Matrix.parse(tgt_model_data) if tgt_model_data else None
+    em = Cpp.Emulator(src, tgt)
+    em.record_timeline = True
+    return _run(em, trace_data), em.timeline()
+
+
+ENERGY_COLUMNS = (
+    'energy_harmonics', 'energy_bots',
+    'energy_move', 'energy_fill', 'energy_void', 'energy_fission_fusion')
+
 
-    task_number = int(task_number_str)
+def summarize_timeline(timeline: np.ndarray) -> dict:
+    '''Where the energy and the time went.'''
+    energy = {c[len('energy_'):]: int(timeline[c].sum()) for c in ENERGY_COLUMNS}
+    total = sum(energy.values())
+    steps = len(timeline)
+    bot_steps = int(timeline['active'].sum())
+    high_steps = int(timeline['high'].sum())
+    waiting = int(timeline['waiting'].sum())
+    return dict(
+        steps=steps,
+        high_steps=high_steps,
+        high_fraction=high_steps / max(steps, 1),
+        bot_steps=bot_steps,
+        waiting_bot_steps=waiting,
+        waiting_fraction=waiting / max(bot_steps, 1),
+        max_bots=int(timeline['active'].max()) if steps else 0,
+        energy=energy,
+        energy_fraction={k: v / total if total else 0.0 for k, v in energy.items()},
+    )
+
+
+def estimate_energy(
+        src_model_data: Optional[bytes],
+        tgt_model_data: Optional[bytes],
+        trace_data: Union[bytes, TraceSink]) -> Optional[int]:
+    '''Energy of the trace without checking it, see estimate.h.
+
+    Much cheaper than run_full(), meant for ranking candidate traces.
+    Returns None for traces that can't even be costed.
+    '''
+    src = Cpp.Matrix.parse(src_model_data) if src_model_data else None
+    tgt = Cpp.Matrix.parse(tgt_model_data) if tgt_model_data else None
+    try:
+        return Cpp.estimate_energy(src, tgt, trace_bytes(trace_data))
+    except Cpp.SimulatorException:
+        return None
+
+
+def run_batch(
+        jobs: List[Tuple[Optional[bytes], Optional[bytes], Union[bytes, TraceSink]]],
+        num_threads: int = 0) -> List[EmulatorResult]:
+    '''run_full() for many (src, tgt, trace) triples at once.
+
+    Traces are decoded natively and run on num_threads threads (0 for
+    one per core) without holding the GIL.
+    '''
+    raw = Cpp.run_batch(
+        [(src, tgt, trace_bytes(trace)) for src, tgt, trace in jobs],
+        num_threads)
+    results = []
+    for energy, error, steps in raw:
+        if error is None:
+            results.append(EmulatorResult(energy=energy, extra=dict(steps=steps)))
+        else:
+            results.append(EmulatorResult(energy=None, extra=dict(error=error, step=steps)))
+    return results
+
+
+def main():
+    task_number = int(sys.argv[1])
 
     (src, tgt) = data_files.full_problem('FR{0:03d}'.format(task_number))
-    # subprocess.call("python -m " + solver_cmd + " " + task_number_str, shell=True, cwd = os.path.join(os.path.dirname(__file__), "../../"))
     trace_data = data_files.full_default_trace("FR{0:03d}".format(task_number))
-    #trace_data = read_trace_data(task_number)
 
     result = run_full(src, tgt, trace_data)
     print(result)
@@ -9,6 +9,8 @@ from production.cpp_mediator import state_to_cpp
 
 from production import utils
 
+import pytest
+
 def set_cpp_state():
     m = Model(5)
     m[Pos(2, 0, 2)] = True
@@ -115,6 +117,21 @@ def test_illegal_lmoves():
     # assert em.steptrace_is_complete()
     # em.run_step()
 
+
+def test_group_region_interference():
+    gfill1 = ctp(pc.GFill(Diff(1, 0, 0), Diff(0, 0, 1)))
+    gfill2 = ctp(pc.GFill(Diff(1, 0, 0), Diff(0, 0, -1)))
+
+    em = Cpp.Emulator(set_cpp_state())
+    em.run_commands([gfill1, gfill2, ctp(pc.Wait())])
+    assert em.get_state()[Pos(1, 0, 1)] and em.get_state()[Pos(1, 0, 2)]
+
+    # bot 40 fills a voxel of the region
+    em = Cpp.Emulator(set_cpp_state())
+    with pytest.raises(Cpp.SimulatorException, match='interferes'):
+        em.run_commands([gfill1, gfill2, ctp(pc.Fill(Diff(0, 0, 1)))])
+
+
 if __name__ == '__main__':
     test_illegal_smoves()
     test_illegal_lmoves()
@@ -100,8 +100,30 @@ bool test_cubicles() {
 }
 
 
+bool test_cubic_mask() {
+	// compare against the plain DFS on pseudo-random neighbourhoods
+	uint32_t x = 12345;
+	for (int i = 0; i < 20000; i++) {
+		x = x * 1103515245 + 12345;
+		uint32_t mask = (x >> 3) & ((1u << 27) - 1);
+		if (i % 2) mask &= x >> 2;  // sparser ones too
+		bool bytes[27];
+		for (int j = 0; j < 27; j++) bytes[j] = mask >> j & 1;
+		int before = cubic_num_components2(bytes);
+		if (cubic_num_components(mask) != before) return false;
+		bytes[13] = false;
+		bool expected = !(mask >> 13 & 1) || cubic_num_components2(bytes) == before;
+		// twice: computed, then cached
+		if (can_safely_remove_center(mask) != expected) return false;
+		if (can_safely_remove_center(mask) != expected) return false;
+	}
+	return true;
+}
+
+
 bool run_tests() {
 	if (!test_cubicles()) return false;
+	if (!test_cubic_mask()) return false;
 
 	return true;
 }
\ No newline at end of file
@@ -81,6 +81,21 @@ def test_pathfinding():
     assert cpp.path_to_nearest_of(m, Pos(0, 0, 1), [Pos(100, 0, 0)]) is None
 
 
+def test_pathfinding_reuses_scratch():
+    # BFS scratch space is kept between calls, of whatever R
+    for R in [20, 3, 20, 7]:
+        m = Matrix(R)
+        far = Pos(R - 1, R - 1, R - 1)
+        dst, path = cpp.path_to_nearest_of(m, Pos(0, 0, 0), [far])
+        assert dst == far
+        pos = Pos(0, 0, 0)
+        for cmd in path:
+            pos = pos + cmd.move_offset()
+        assert pos == far
+        # one LMove covers at most 10 of the 3 * (R - 1)
+        assert len(path) <= (3 * (R - 1) + 9) // 10 + 1
+
+
 def test_safe_to_change():
     matrix = [
         #   z
@@ -119,3 +134,95 @@ def test_safe_to_change():
     assert m == m0
     assert not cpp.safe_to_change(m, Pos(2, 2, 2))
     assert m == m0
+
+
+def test_connectivity_index():
+    import random
+    random.seed(3)
+    R = 5
+    m = Matrix(R)
+    index = cpp.ConnectivityIndex(m)
+    for _ in range(3000):
+        p = Pos(random.randrange(R), random.randrange(R), random.randrange(R))
+        value = random.random() < 0.6
+        index[p] = value
+        m[p] = value
+
+        assert index.matrix == m
+        assert index.num_grounded() == m.num_grounded_voxels()
+        grounded = set(m.grounded_voxels())
+        for q in [p, Pos(random.randrange(R), random.randrange(R), random.randrange(R))]:
+            assert index.is_grounded(q) == (q in grounded)
+            assert index.safe_to_change(q) == cpp.safe_to_change(m, q)
+            if m[q]:
+                m2 = Matrix(m)
+                m2[q] = False
+                assert index.can_remove(q) == (m2.num_grounded_voxels() == m2.num_full)
+
+
+
+def test_work_index():
+    import random
+    random.seed(4)
+    R = 5
+    tgt = Matrix(R)
+    for _ in range(40):
+        tgt[Pos(random.randrange(R), random.randrange(R), random.randrange(R))] = True
+    m = Matrix(R)
+    work = cpp.WorkIndex(m, tgt)
+    nds = cpp.enum_near_diffs()
+    for _ in range(1000):
+        p = Pos(random.randrange(R), random.randrange(R), random.randrange(R))
+        value = random.random() < 0.6
+        work[p] = value
+        m[p] = value
+
+        assert work.matrix == m
+        assert work.num_diff() == m.count_diff(tgt)
+        assert work.done() == (m == tgt)
+        for q in [p, Pos(random.randrange(R), random.randrange(R), random.randrange(R))]:
+            assert work.is_workable(q) == (m[q] != tgt[q] and cpp.safe_to_change(m, q))
+            expected = None
+            for nd in nds:
+                if (q + nd).is_inside(R) and work.is_workable(q + nd):
+                    expected = nd
+                    break
+            assert work.work_near(q) == expected
+
+    if not m[Pos(0, 0, 0)]:
+        p = cpp.path_to_nearest_work(work, Pos(0, 0, 0))
+        expected = cpp.path_to_nearest_safe_change_point(m, Pos(0, 0, 0), m, tgt)
+        assert (p is None) == (expected is None)
+        if p is not None:
+            assert p[0] == expected[0]
+
+
+def test_matrix_bulk_ops():
+    import random
+    from production.model import Model
+    random.seed(5)
+
+    data = data_files.lightning_problem('LA004_tgt.mdl')
+    m = Matrix.parse(list(data))
+    assert m.compose() == data
+    model = Model.parse(data)
+
+    for _ in range(50):
+        p1 = Pos(random.randrange(20), random.randrange(20), random.randrange(20))
+        p2 = Pos(random.randrange(20), random.randrange(20), random.randrange(20))
+        box = tuple(slice(min(a, b), max(a, b) + 1)
+                    for a, b in [(p1.x, p2.x), (p1.y, p2.y), (p1.z, p2.z)])
+        expected = int(model.voxels[box].sum())
+        assert m.count_inside_region(p1, p2) == expected
+        assert m.is_void_region(p1, p2) == (expected == 0)
+
+        m2 = Matrix(m)
+        value = random.random() < 0.5
+        changed = m2.set_region(p1, p2, value)
+        model2 = model.copy()
+        model2.voxels[box] = value
+        assert changed == int((model2.voxels != model.voxels).sum())
+        assert m2.compose() == model2.compose()
+        assert m2.num_full == model2.num_full
+        assert m2.count_diff(m) == changed
+        assert (m2 ^ m).num_full == changed
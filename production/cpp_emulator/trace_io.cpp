@@ -0,0 +1,94 @@
+#include "trace_io.h"
+#include "logger.h"
+
+#include <string>
+#include <unordered_map>
+
+using std::shared_ptr;
+using std::make_shared;
+using std::string;
+using std::vector;
+
+
+int command_size(uint8_t b) {
+    if (b == 0b11111111 || b == 0b11111110 || b == 0b11111101) return 1;
+    if ((b & 0b1111) == 0b0100 || (b & 0b1111) == 0b1100) return 2;
+    switch (b & 0b111) {
+        case 0b101: return 2;
+        case 0b001: case 0b000: return 4;
+        default: return 1;
+    }
+}
+
+
+static Diff nd(uint8_t b) {
+    if ((b >> 3) >= 27) throw parser_error("invalid nd");
+    return Command::get_nd(b);
+}
+
+
+// Same precedence as commands.parse_command().
+static shared_ptr<Command> make_command(const uint8_t *p) {
+    uint8_t b = p[0];
+    switch (b) {
+        case 0b11111111: return make_shared<Halt>();
+        case 0b11111110: return make_shared<Wait>();
+        case 0b11111101: return make_shared<Flip>();
+    }
+    switch (b & 0b1111) {
+        case 0b0100:
+            return make_shared<SMove>(Command::get_lld(b >> 4, p[1]));
+        case 0b1100:
+            return make_shared<LMove>(
+                Command::get_sld(b >> 4, p[1]),
+                Command::get_sld(b >> 6, p[1] >> 4));
+    }
+    switch (b & 0b111) {
+        case 0b101: return make_shared<Fission>(nd(b), p[1]);
+        case 0b011: return make_shared<Fill>(nd(b));
+        case 0b010: return make_shared<Void>(nd(b));
+        case 0b111: return make_shared<FusionP>(nd(b));
+        case 0b110: return make_shared<FusionS>(nd(b));
+        case 0b001: return make_shared<GFill>(nd(b), Command::get_fd(p[1], p[2], p[3]));
+        default:    return make_shared<GVoid>(nd(b), Command::get_fd(p[1], p[2], p[3]));
+    }
+}
+
+
+vector<shared_ptr<Command>> decode_trace(const uint8_t *data, size_t size) {
+    vector<shared_ptr<Command>> result;
+    // key: the bytes of the command, which are at most 4
+    std::unordered_map<uint32_t, shared_ptr<Command>> cache;
+    size_t pos = 0;
+    while (pos < size) {
+        int n = command_size(data[pos]);
+        if (pos + n > size)
+            throw parser_error("unexpected end of trace at byte " + std::to_string(pos));
+        uint32_t key = 0;
+        for (int i = 0; i < n; i++)
+            key |= uint32_t(data[pos + i]) << (8 * i);
+        auto it = cache.find(key);
+        if (it == cache.end()) {
+            shared_ptr<Command> cmd;
+            try {
+                cmd = make_command(data + pos);
+            } catch (const base_error &e) {
+                throw parser_error(
+                    "invalid command at byte " + std::to_string(pos) + " (" + e.what() + ")");
+            }
+            it = cache.emplace(key, cmd).first;
+        }
+        result.push_back(it->second);
+        pos += n;
+    }
+    return result;
+}
+
+
+vector<uint8_t> encode_trace(const vector<shared_ptr<Command>> &trace) {
+    vector<uint8_t> result;
+    result.reserve(trace.size() * 2);
+    for (const auto &cmd : trace)
+        cmd->encode(result);
+    return result;
+}
@@ -0,0 +1,18 @@
+#pragma once
+
+#include "commands.h"
+
+#include <memory>
+#include <vector>
+#include <stdint.h>
+
+// Size of the .nbt command starting with byte b, as far as it can be
+// told from this byte alone.
+int command_size(uint8_t b);
+
+// Decodes a .nbt trace. Equal commands share one object, so a trace
+// costs a pointer per command plus the handful of distinct commands.
+// Throws parser_error on malformed data.
+std::vector<std::shared_ptr<Command>> decode_trace(const uint8_t *data, size_t size);
+
+std::vector<uint8_t> encode_trace(const std::vector<std::shared_ptr<Command>> &trace);
@@ -0,0 +1,121 @@
+#include "work_index.h"
+
+#include "algo.h"
+
+#include <vector>
+#include <optional>
+#include <algorithm>
+
+using namespace std;
+
+WorkIndex::WorkIndex(const Matrix &src, const Matrix &tgt)
+    : cur(src), tgt(tgt) {
+    assert(src.R == tgt.R);
+    int R = src.R;
+    for (Diff nd : enum_near_diffs()) {
+        if (find(nds.begin(), nds.end(), nd) == nds.end()) {
+            nds.push_back(nd);
+        }
+    }
+    diff_near.assign(R * R * R, 0);
+    safe.assign(R * R * R, UNKNOWN);
+    safe_epoch.assign(R * R * R, 0);
+    for (int x = 0; x < R; x++) {
+        for (int y = 0; y < R; y++) {
+            for (int z = 0; z < R; z++) {
+                Pos p(x, y, z);
+                if (src.get(p) != tgt.get(p)) {
+                    n_diff++;
+                    count_near(p, 1);
+                }
+            }
+        }
+    }
+}
+
+// Cells c with c + nd == p for some nd are the ones near p.
+void WorkIndex::count_near(Pos p, int delta) {
+    int R = tgt.R;
+    for (Diff nd : nds) {
+        Pos c = p - nd;
+        if (c.is_inside(R)) {
+            diff_near[c.pack(R)] += delta;
+        }
+    }
+}
+
+void WorkIndex::set(Pos p, bool value) {
+    if (matrix().get(p) == value) {
+        return;
+    }
+    cur.set(p, value);
+    epoch++;
+    if (value == tgt.get(p)) {
+        n_diff--;
+        count_near(p, -1);
+    } else {
+        n_diff++;
+        count_near(p, 1);
+    }
+
+    int R = tgt.R;
+    for (int dx = -1; dx <= 1; dx++) {
+        for (int dy = -1; dy <= 1; dy++) {
+            for (int dz = -1; dz <= 1; dz++) {
+                Pos q = p + Diff(dx, dy, dz);
+                if (q.is_inside(R)) {
+                    safe[q.pack(R)] = UNKNOWN;
+                }
+            }
+        }
+    }
+}
+
+bool WorkIndex::is_workable(Pos p) const {
+    const Matrix &m = matrix();
+    if (m.get(p) == tgt.get(p)) {
+        return false;
+    }
+    int idx = p.pack(m.R);
+    if (safe[idx] != UNKNOWN && (safe_epoch[idx] == 0 || safe_epoch[idx] == epoch)) {
+        return safe[idx] == SAFE;
+    }
+
+    // the same checks as ConnectivityIndex::safe_to_change(),
+    // split by whether the answer is local
+    bool result;
+    bool local = true;
+    if (!m.get(p)) {
+        result = p.y == 0;
+        for (Diff d : DIRS) {
+            Pos q = p + d;
+            result = result || (q.is_inside(m.R) && m.get(q));
+        }
+    } else if (can_safely_remove_center(neighbourhood_mask(m, p))) {
+        result = true;
+    } else {
+        result = cur.can_remove(p);
+        local = false;
+    }
+    safe[idx] = result ? SAFE : UNSAFE;
+    safe_epoch[idx] = local ? 0 : epoch;
+    return result;
+}
+
+bool WorkIndex::has_work_near(Pos p) const {
+    return work_near(p).has_value();
+}
+
+optional<Diff> WorkIndex::work_near(Pos p) const {
+    int R = tgt.R;
+    if (diff_near[p.pack(R)] == 0) {
+        return nullopt;
+    }
+    for (Diff nd : nds) {
+        Pos q = p + nd;
+        if (q.is_inside(R) && is_workable(q)) {
+            return nd;
+        }
+    }
+    return nullopt;
+}
@@ -0,0 +1,54 @@
+#pragma once
+
+#include "coordinates.h"
+#include "matrix.h"
+#include "connectivity.h"
+
+#include <vector>
+#include <optional>
+#include <stdint.h>
+
+// The voxels that still differ between the current model and the target,
+// kept up to date as the current model is edited, so that a solver doesn't
+// have to compare or rescan whole matrices to find the next thing to do.
+//
+// A voxel is workable if it differs from the target and safe_to_change()
+// holds for it. Near every cell we count the differing voxels a bot there
+// could reach with a near diff, so most cells are rejected without looking
+// at any voxel. Safety answers are cached: those that only depend on the
+// 3x3x3 neighbourhood are dropped when something in it changes, those that
+// needed the connectivity index are only good until the next edit.
+class WorkIndex {
+public:
+    WorkIndex(const Matrix &src, const Matrix &tgt);
+
+    const Matrix& matrix() const { return cur.matrix(); }
+    const Matrix& target() const { return tgt; }
+    const ConnectivityIndex& connectivity() const { return cur; }
+
+    int num_diff() const { return n_diff; }
+    bool done() const { return n_diff == 0; }
+
+    void set(Pos p, bool value);
+
+    bool is_workable(Pos p) const;
+    // Could a bot at p do anything?
+    bool has_work_near(Pos p) const;
+    // First near diff (in enum_near_diffs() order) to a workable voxel.
+    std::optional<Diff> work_near(Pos p) const;
+
+private:
+    enum : uint8_t { UNKNOWN, SAFE, UNSAFE };
+
+    ConnectivityIndex cur;
+    Matrix tgt;
+    int n_diff = 0;
+    std::vector<Diff> nds;
+    std::vector<uint8_t> diff_near;  // per cell
+    mutable std::vector<uint8_t> safe;
+    // edit count when a non-local answer was cached, 0 for local ones
+    mutable std::vector<uint32_t> safe_epoch;
+    uint32_t epoch = 1;
+
+    void count_near(Pos p, int delta);
+};
@@ -4,8 +4,6 @@ from production.basics import Pos, Diff
 from production.model import Model
 import production.commands as commands
 
-from bitarray import bitarray
-
 MAXBOTNUMBER = 40
 
 
@@ -19,7 +17,7 @@ def bot_from_cpp(b):
 
 
 def state_to_cpp(s):
-    rawdata = bytes([s.R]) + s.matrix._data.tobytes()
+    rawdata = s.matrix.compose()
     cbots = list(Cpp.Bot(i) for i in range(MAXBOTNUMBER + 1))
     for b in s.bots:
         cb = Cpp.Bot(b.bid, b.pos, b.seeds, True)
@@ -58,6 +56,10 @@ def cmd_from_cpp(ccmd):
         return commands.SMove(ccmd.lld)
     if isinstance(ccmd, Cpp.LMove):
         return commands.LMove(ccmd.sld1, ccmd.sld2)
+    if isinstance(ccmd, Cpp.FusionP):
+        return commands.FusionP(ccmd.nd)
+    if isinstance(ccmd, Cpp.FusionS):
+        return commands.FusionS(ccmd.nd)
     if isinstance(ccmd, Cpp.Fission):
         return commands.Fission(ccmd.nd, ccmd.m)
     if isinstance(ccmd, Cpp.Fill):
@@ -83,6 +85,10 @@ def cmd_to_cpp(cmd):
     if isinstance(cmd, commands.LMove):
         return Cpp.LMove(cmd.sld1,
                          cmd.sld2)
+    if isinstance(cmd, commands.FusionP):
+        return Cpp.FusionP(cmd.nd)
+    if isinstance(cmd, commands.FusionS):
+        return Cpp.FusionS(cmd.nd)
     if isinstance(cmd, commands.Fission):
         return Cpp.Fission(cmd.nd, cmd.m)
     if isinstance(cmd, commands.Fill):
@@ -95,6 +101,7 @@ def cmd_to_cpp(cmd):
         return Cpp.GVoid(cmd.nd, cmd.fd)
     assert False, cmd
 
+
 #----------- examples --------------#
 
 def main_run_interactive():
@@ -204,12 +211,9 @@ def main_run_file():
 
     em = Cpp.Emulator(None, m)      # (source, target)
 
-    error = ""
     tf = open(tracefile, 'rb')
-    cmds = commands.parse_commands(tf.read(), error)
+    em.set_trace(tf.read())     # decoded natively
     tf.close()
-    cmdlist = list(map(cmd_to_cpp, cmds))
-    em.set_trace(cmdlist)
 
     em.setlogfile(logfile)
     em.run()
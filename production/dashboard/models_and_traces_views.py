@@ -3,6 +3,7 @@ import zlib
 from collections import defaultdict
 
 import flask
+import numpy as np
 
 from production.dashboard import app, get_conn
 from production.dashboard.flask_utils import memoized_render_template_string
@@ -84,7 +85,7 @@ LIST_PROBLEMS_TEMPLATE = '''\
             <td>{{ ('/inv/%s' % trace_inv_id) | linkify }}</td>
             <td>
                 {{ trace_extra.get('solver_time', 0) | int }}s+{{
-                    trace_extra.get('pyjs_time', 0) | int }}s
+                    trace_extra.get('pyjs_time', trace_extra.get('cpp_time', 0)) | int }}s
             </td>
         {% endif %}
     </tr>
@@ -206,6 +207,7 @@ Extra:
 {% endif %}
 
 <a href="{{ url_for('visualize_trace', id=id) }}">visualize</a>
+<a href="{{ url_for('trace_timeline', id=id) }}">timeline</a>
 {% endblock %}
 '''
 
@@ -264,3 +266,72 @@ def visualize_trace(id):
         src_data=src_data,
         tgt_data=tgt_data,
         trace_data=trace_data)
+
+
+@app.route('/trace_timeline/<int:id>')
+def trace_timeline(id):
+    from production.cpp_emulator.run import run_timeline, summarize_timeline, ENERGY_COLUMNS
+
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        'SELECT traces.data, problems.src_data, problems.tgt_data '
+        'FROM traces JOIN problems ON traces.problem_id = problems.id '
+        'WHERE traces.id = %s',
+        [id])
+    [trace_data, src_data, tgt_data] = cur.fetchone()
+    if trace_data is None:
+        return 'no trace data', 404
+    er, timeline = run_timeline(
+        src_data and zlib.decompress(src_data),
+        tgt_data and zlib.decompress(tgt_data),
+        zlib.decompress(trace_data))
+    summary = summarize_timeline(timeline)
+
+    # one sparkline per column, steps summed into at most `width` buckets
+    width, height = 800, 60
+    charts = []
+    for column in ('active', 'waiting', 'high') + ENERGY_COLUMNS:
+        values = timeline[column].astype(np.int64)
+        if len(values):
+            buckets = np.array_split(values, min(width, len(values)))
+            values = np.array([b.sum() for b in buckets])
+        lo, hi = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+        span = max(hi - lo, 1)
+        points = ' '.join(
+            f'{i * width / max(len(values) - 1, 1):.1f},{height - (v - lo) * height / span:.1f}'
+            for i, v in enumerate(values.tolist()))
+        charts.append((column, lo, hi, points))
+    steps_per_bucket = -(-len(timeline) // width) if len(timeline) else 1
+
+    return memoized_render_template_string(TRACE_TIMELINE_TEMPLATE, **locals())
+
+TRACE_TIMELINE_TEMPLATE = '''\
+{% extends "base.html" %}
+{% block body %}
+<h3>Timeline of {{ url_for('view_trace', id=id) | linkify }}</h3>
+Energy: {{ er.energy }} {% if er.energy is none %}({{ er.extra.error }}){% endif %} <br>
+Steps: {{ summary.steps }}, in high harmonics: {{ summary.high_steps }}
+({{ '%.1f' % (100 * summary.high_fraction) }}%) <br>
+Bot steps: {{ summary.bot_steps }}, waiting: {{ summary.waiting_bot_steps }}
+({{ '%.1f' % (100 * summary.waiting_fraction) }}%), max bots: {{ summary.max_bots }} <br>
+
+<table>
+<tr><th>energy</th><th></th><th></th></tr>
+{% for k, v in summary.energy.items() %}
+<tr><td>{{ k }}</td><td>{{ v }}</td>
+    <td>{{ '%.2f' % (100 * summary.energy_fraction[k]) }}%</td></tr>
+{% endfor %}
+</table>
+
+<p>Per {{ steps_per_bucket }} step(s):</p>
+{% for column, lo, hi, points in charts %}
+<div>
+{{ column }} ({{ lo }}..{{ hi }})<br>
+<svg width="{{ width }}" height="{{ height }}" style="border: 1px solid #ccc">
+    <polyline points="{{ points }}" fill="none" stroke="steelblue"/>
+</svg>
+</div>
+{% endfor %}
+{% endblock %}
+'''
@@ -61,7 +61,7 @@ class CubicalDeconstructor(Solver):
         assert tgt_model is None
         m = Model.parse(src_model)
         trace = cubical(m, high=self.high)
-        trace_data = compose_commands(trace)
+        trace_data = trace.compose()
         return SolverResult(trace_data, extra={})
 
 
@@ -13,8 +13,13 @@ from production.data_files import *
 from production.pyjs_emulator.run import run
 
 from production.deconstruct.lib2 import clear_all_squads, set_gdist
+from production.cpp_emulator.run import estimate_energy, run_full
 from production.group_programs import move_x, move_y, move_z, single
 from production.solver_utils import bounding_box
+from production.volume_index import VolumeIndex
+
+GDIST_CANDIDATES = (10, 15, 20, 25, 30)
+
 
 def cubical(model, high=False):
     (pos1, pos2) = bounding_box(model)
@@ -33,7 +38,8 @@ def cubical(model, high=False):
     if high:
         prog += single(Flip())
 
-    prog += clear_all_squads(model, pos1.x, 0, pos1.z - 1, width, height, depth)
+    index = VolumeIndex.from_model(model)
+    prog += clear_all_squads(index, pos1.x, 0, pos1.z - 1, width, height, depth)
 
     if high:
         prog += single(Flip())
@@ -48,10 +54,13 @@ class CubicalDeconstructor(Solver):
     def __init__(self, args):
         self.high = 'high' in args
         self.gdist = 30
-        try:
-            self.gdist = int(args[0])
-        except:
-            pass
+        if args and args[0] == 'auto':
+            self.gdist = 'auto'
+        else:
+            try:
+                self.gdist = int(args[0])
+            except:
+                pass
 
     def scent(self) -> str:
         return 'Cubical 2.2 @ ' + str(self.gdist) + (' (high)' if self.high else '')
@@ -65,10 +74,27 @@ class CubicalDeconstructor(Solver):
             tgt_model: Optional[bytes]) -> SolverResult:
         assert tgt_model is None
         m = Model.parse(src_model)
-        set_gdist(self.gdist)
-        trace = cubical(m, high=self.high)
-        trace_data = compose_commands(trace)
-        return SolverResult(trace_data, extra={})
+        if self.gdist != 'auto':
+            set_gdist(self.gdist)
+            trace = cubical(m, high=self.high)
+            trace_data = trace.compose()
+            return SolverResult(trace_data, extra={})
+
+        # Costing a trace is much cheaper than making it, try them all.
+        # Not every gdist works for every model, so the best-looking ones
+        # are then checked until one passes.
+        candidates = []
+        for gdist in GDIST_CANDIDATES:
+            set_gdist(gdist)
+            trace_data = cubical(m, high=self.high).compose()
+            energy = estimate_energy(src_model, None, trace_data)
+            logger.info(f'gdist {gdist}: estimated energy {energy}')
+            if energy is not None:
+                candidates.append((energy, gdist, trace_data))
+        for energy, gdist, trace_data in sorted(candidates):
+            if run_full(src_model, None, trace_data).energy is not None:
+                return SolverResult(trace_data, extra=dict(gdist=gdist))
+        return SolverResult(Fail())
 
 
 def write_solution(bytetrace, number): # -> IO ()
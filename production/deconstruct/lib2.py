@@ -187,7 +187,8 @@ def spawn_down(model, x, y, z):
     return prog
 
 # Program for 1 bot. Makes it go down to given depth, drilling
-# the path where necessary.
+# the path where necessary. model is a VolumeIndex, so finding
+# the next full voxel below doesn't scan the column.
 def drill_down(model, x, y, z, depth) -> GroupProgram:
     prog = single()
 
@@ -195,12 +196,11 @@ def drill_down(model, x, y, z, depth) -> GroupProgram:
         if model[Pos(x, y - 1, z)]:
             prog += single(Void(Diff(0,-1,0)))
 
-        step = 1
-        for i in range(2, depth + 1):
-            if model[Pos(x, y - i, z)]:
-                break
-            else:
-                step += 1
+        step = depth
+        if depth >= 2:
+            top = model.top(Pos(x, y - depth, z), Pos(x, y - 2, z))
+            if top is not None:
+                step = y - 1 - top
         prog += move_y(-step)
         y -= step
         depth -= step
@@ -13,9 +13,10 @@ import sys
 from production.model import Model
 from production.basics import (Diff, Pos)
 from production import data_files
-from production.solver_interface import ProblemType, Solver, SolverResult, Fail
+from production.solver_interface import ProblemType, Solver, SolverResult, Fail, TraceSink
 from production.solver_utils import *
 from production.solver_utils import bounding_box
+from production.trace_builder import TraceBuilder
 
 
 def direction(diff) -> 'Diff':
@@ -175,50 +176,6 @@ def navigate(f: 'Pos', t: 'Pos'):
     if dy < 0:
         for x in split_linear_move(Diff(0, dy, 0)): yield x
 
-def navigate_pos(f: 'Pos', t: 'Pos'):
-    return add_pos(t, navigate(f, t))
-
-def merge(gens):
-    saw_pos = False
-    iters = [iter(x) for x in gens]
-    pos   = [None for x in gens]
-    ok    = True
-    buff  = []
-    while ok:
-        ok = False
-        for i in range(len(iters)):
-            x = next(iters[i], None)
-            if not x:
-                buff.append( Cmd.Wait() )
-            else:
-                ok = True
-                if type(x) == Pos:
-                    saw_pos = True
-                    pos[i] = x
-                    buff.append( Cmd.Wait() )
-                else:
-                    ok = True
-                    buff.append( x )
-        if ok:
-            for x in buff: yield x
-            buff = []
-    if saw_pos:
-        yield pos
-
-def append(a, b):
-    for x in a: yield x
-    for x in b: yield x
-
-def sequence(a, nxt):
-    pos = None
-    for x in a:
-        if type(x) == Pos:
-            pos = x
-        else:
-            yield x
-    b = nxt(pos)
-    for x in b: yield x
-
 def rm_pos(g):
     for x in g:
         if type(x) == Pos or type(x) == list or type(x) == dict:
@@ -231,10 +188,6 @@ def print_gen(g):
         print(x)
         yield x
 
-def add_pos(pos, g):
-    for x in rm_pos(g): yield x
-    yield pos
-
 def agent_gen(m: 'Model', start: 'Pos', a: 'Pos', b: 'Pos'):
     for x in navigate(start, a):
         yield x
@@ -242,102 +195,23 @@ def agent_gen(m: 'Model', start: 'Pos', a: 'Pos', b: 'Pos'):
     for x in snake_fill_gen(m, a, b):
         yield x
 
-def go_to_start(a, b):
-    def go(src):
-        return navigate_pos(src, Pos(a.x, b.y + 1, a.z))
-
-    return go
-
-def auto_str(cls):
-    def __str__(self):
-        return '%s(%s)' % (
-            type(self).__name__,
-            ', '.join('%s=%s' % item for item in vars(self).items())
-        )
-    cls.__str__ = __str__
-    return cls
-
-@auto_str
-class Bot():
-    def __init__(self, id, pos, seeds):
-        self.state = None
-        self.id = id
-        self.seeds = seeds
-        self.pos = pos
-
-    def spawn_keep(self, diff, give_seeds):
-        x = len(self.seeds) - give_seeds - 1
-        return self.spawn(diff, x)
-
-    def spawn(self, diff, give_seeds):
-        bot = Bot(self.seeds.pop(0), self.pos + diff, self.seeds[:give_seeds])
-        self.seeds = self.seeds[give_seeds:]
-        cmd = Fission(diff, len(bot.seeds))
-
-        self.state.add_move(self, cmd)
-        self.state.add_bot(bot)
-
-        return bot.id
-
-    def cmd(self, cmd):
-        self.state.add_move(self, cmd)
-
-@auto_str
-class State():
-    def __init__(self, bots):
-        self.bots = {}
-        self.next_bots = {}
-        for x in bots:
-            self.bots[x.id] = x
-            x.state = self
-        self._clear()
-
-    def __getitem__(self, id) -> bool:
-        return self.bots.get(id) or self.next_bots.get(id)
-
-    def add_bot(self, bot):
-        bot.state = self
-        self.next_bots[bot.id] = bot
-
-    def add_move(self, bot, cmd):
-        assert(type(self.moves[bot.id]) == Cmd.Wait)
-        self.moves[bot.id] = cmd
-
-    def _clear(self):
-        self.moves = {}
-        for i in self.next_bots:
-            x = self.next_bots[i]
-            self.bots[x.id] = x
-        self.next_bots = {}
-        for i in self.bots:
-            self.moves[i] = Cmd.Wait()
-
-    def step(self):
-        for k in sorted( self.moves.keys() ):
-            yield self.moves[k]
-        self._clear()
-
-    @staticmethod
-    def initial_state(total_seeds):
-        bots = [Bot(1, Pos(0, 0, 0), [x + 2 for x in range(total_seeds)])]
-        return State(bots)
-
-    # assuming initial state
-    def spawn_bots(self, x, y):
-        row = [1]
-        p = 1
-        for i in range(x - 1):
-            p = self[p].spawn_keep(Diff(1, 0, 0), y - 1)
-            row.append(p)
-            yield from self.step()
-
-        all_rows = [row]
-        for j in range(y - 1):
-            row = [self[i].spawn_keep(Diff(0, 1, 0), 0) for i in row]
-            all_rows.append(row)
-            yield from self.step()
-
-        self.grid = all_rows
+# assuming initial state
+def spawn_bots(tb: TraceBuilder, x, y):
+    row = [1]
+    p = 1
+    for i in range(x - 1):
+        # keep y - 1 seeds for the column
+        p = tb.fission(p, Diff(1, 0, 0), len(tb[p].seeds) - y)
+        row.append(p)
+    tb.sync()
+
+    all_rows = [row]
+    for j in range(y - 1):
+        row = [tb.fission(i, Diff(0, 1, 0), len(tb[i].seeds) - 1) for i in row]
+        all_rows.append(row)
+        tb.sync()
+
+    return all_rows
 
 # This is potential source of bugs since floating point number aren't good when
 # you are tired
@@ -365,63 +239,22 @@ def partition_space(a, b, x_cnt, z_cnt):
 
     return res
 
-def with_delay(n, x):
-    return append([Cmd.Wait() for x in range(n)], x)
-
-def merge_tasks(tasks):
-    keys = sorted( tasks.keys() )
-    pos = None
-    for x in merge([tasks[x] for x in keys]):
-        if type(x) == list or type(x) == Pos:
-            pos = x
-        else:
-            yield x
-    if not pos:
-        return
-
-    res = {}
-    for (id, pos) in zip(keys, pos):
-        res[id] = pos
-    yield res
-
-def merge_line(bots, pos, delta):
-    tasks1 = {}
-    for i in bots:
-        tasks1[i] = []
-
+# Fuses a line of bots into its first one, pairwise.
+# Yields after queueing each phase, so that lines can go in parallel.
+def merge_line(tb: TraceBuilder, bots, delta):
     for i in range(0, len(bots) - 1, 2):
         a = bots[i]
         b = bots[i + 1]
-        tasks1[b] = navigate(pos[b], pos[a] + delta)
+        tb.extend(b, navigate(tb.pos(b), tb.pos(a) + delta))
+    yield
 
-    yield tasks1
-
-    # Issue fussion commands
-    tasks = {}
-    for i in bots:
-        tasks[i] = []
-
-    new_bots = []
     for i in range(0, len(bots) - 1, 2):
-        a = bots[i]
-        b = bots[i + 1]
-        tasks[a] = [Cmd.FusionP(delta)]
-        tasks[b] = [Cmd.FusionS(delta * (-1))]
-
-        new_bots.append(a)
-        del pos[b]
-
-    if len(bots) % 2:
-        new_bots.append(bots[-1])
-        tasks[bots[-1]] = [Cmd.Wait()]
-    yield tasks
+        tb.fuse(bots[i], bots[i + 1])
+    yield
 
+    new_bots = bots[::2]
     if len(new_bots) > 1:
-        yield from merge_line(new_bots, pos, delta)
-
-
-def merge_bots(bots, pos):
-    pass
+        yield from merge_line(tb, new_bots, delta)
 
 
 def solve_gen(m: 'Model', x_cnt: 'int', z_cnt: 'int', low):
@@ -431,61 +264,46 @@ def solve_gen(m: 'Model', x_cnt: 'int', z_cnt: 'int', low):
     x_cnt = min(x_cnt, (bb_b.x - bb_a.x + 1) // 2)
     z_cnt = min(z_cnt, (bb_b.z - bb_a.z + 1) // 2)
 
+    tb = TraceBuilder(m.R)
     if not low:
-        yield Cmd.Flip()
+        tb.add(1, Cmd.Flip())
 
     zones = partition_space(bb_a, bb_b, x_cnt, z_cnt)
 
-    # Spawn bots
-    #
-    # State is used to spawn bots and to provide initial coords and ids
-    st = State.initial_state(39)
-    yield from st.spawn_bots(x_cnt, z_cnt)
-    bots = st.grid
+    bots = spawn_bots(tb, x_cnt, z_cnt)
 
     # Navigate solve, and go to safe position for merging
-    tasks = {}
     for z in range(z_cnt):
         for x in range(x_cnt):
             id     = bots[z][x]
-            bot    = st[ bots[z][x] ]
+            pos    = tb.pos(id)
             (a, b) = zones[z][x]
-            d = (x_cnt + z_cnt) - (bot.pos.x + bot.pos.y)
-            tasks[id] = sequence( with_delay(d, agent_gen(m, bot.pos, a, b))
-                                , go_to_start(a, bb_b))
-
-    for x in merge_tasks(tasks):
-        if type(x) == dict:
-            pos = x
-        else:
-            yield x
+            d = (x_cnt + z_cnt) - (pos.x + pos.y)
+            tb.wait(id, d)
+            tb.extend(id, rm_pos(agent_gen(m, pos, a, b)))
+            tb.extend(id, navigate(tb.pos(id), Pos(a.x, bb_b.y + 1, a.z)))
+    tb.sync()
 
     #
     # Merging
     #
 
     # Combine rows
-    t = []
-    for i in range(len(bots)):
-        t.append( [x for x in merge_line(bots[i], pos, Diff(1, 0, 0))] )
-
-    for i in range(len(t[0])):
-        tasks = {}
-        for j in range(len(bots)):
-            tasks.update(t[j][i])
-        yield from merge_tasks(tasks)
+    for _ in zip(*[merge_line(tb, row, Diff(1, 0, 0)) for row in bots]):
+        tb.sync()
 
     # Combine col
-    col = [x[0] for x in bots]
-    for t in merge_line(col, pos, Diff(0, 0, 1)):
-        yield from merge_tasks(t)
+    for _ in merge_line(tb, [row[0] for row in bots], Diff(0, 0, 1)):
+        tb.sync()
 
     # Return home
-    for x in navigate(pos[1], Pos(0, 0, 0)): yield x
+    tb.extend(1, navigate(tb.pos(1), Pos(0, 0, 0)))
 
     if not low:
-        yield Cmd.Flip()
-    yield Cmd.Halt()
+        tb.add(1, Cmd.Flip())
+    tb.add(1, Cmd.Halt())
+
+    return iter(tb)
 
 
 class DefaultSolver2(Solver):
@@ -514,7 +332,8 @@ class DefaultSolver2(Solver):
             tgt_model: Optional[bytes]) -> SolverResult:
         assert src_model is None
         m = Model.parse(tgt_model)
-        trace_data = compose_commands(solve_gen(m, self.w, self.h, low=self.low))
+        with TraceSink() as trace_data:
+            trace_data.extend(solve_gen(m, self.w, self.h, low=self.low))
         return SolverResult(trace_data, extra={})
 
 if __name__ == '__main__':
@@ -13,7 +13,7 @@ import sys
 from production.model import Model
 from production.basics import (Diff, Pos)
 from production import data_files
-from production.solver_interface import ProblemType, Solver, SolverResult, Fail
+from production.solver_interface import ProblemType, Solver, SolverResult, Fail, TraceSink
 from production.solver_utils import *
 from production.solver_utils import bounding_box
 
@@ -530,7 +530,8 @@ class DefaultSolver2Dec(Solver):
             tgt_model: Optional[bytes]) -> SolverResult:
         assert tgt_model is None
         m = Model.parse(src_model)
-        trace_data = compose_commands(solve_gen(m, self.w, self.h))
+        with TraceSink() as trace_data:
+            trace_data.extend(solve_gen(m, self.w, self.h))
         return SolverResult(trace_data, extra={})
 
 if __name__ == '__main__':
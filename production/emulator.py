@@ -4,6 +4,7 @@ from dataclasses import dataclass
 from production.cpp_emulator.emulator import Pos, Diff
 from production.commands import *
 from production.model import Model
+from production.grounded import GroundedTracker
 
 
 LOW = "LOW"
@@ -34,20 +35,31 @@ class State:
         self.harmonics = LOW
         self.energy = 0
         self.bots = [Bot(1, Pos(0, 0, 0), list(range(39)))]  # TODO
+        self._grounded = None
+
+    @property
+    def grounded(self) -> GroundedTracker:
+        '''Groundedness of self.matrix, kept up to date by __setitem__.'''
+        if self._grounded is None or self._grounded_matrix is not self.matrix:
+            self._grounded = GroundedTracker.from_model(self.matrix)
+            self._grounded_matrix = self.matrix
+        return self._grounded
 
     def __setitem__(self, pos: Pos, value):
         assert value == 0 or value == 1
         self.matrix[pos] = bool(value)
+        if self._grounded is not None and self._grounded_matrix is self.matrix:
+            if value:
+                self._grounded.fill(pos)
+            else:
+                self._grounded.void(pos)
 
     def __getitem__(self, pos: Pos):
         return self.matrix[pos]
         
     def assert_well_formed(self):
         if self.harmonics == LOW:
-            grounded = self.matrix.grounded_voxels()
-            for p in self.enum_voxels():
-                if self[p] == 1:
-                    assert p in grounded
+            assert self.grounded.all_grounded(), 'ungrounded voxels'
 
         bids = {bot.bid for bot in self.bots}
         assert len(bids) == len(self.bots), 'bids not unique'
@@ -56,7 +68,7 @@ class State:
         assert len(poss) == len(self.bots), 'positions not unique'
 
         for bot in self.bots:
-            assert matrix[bot.pos.x][bot.pos.y][bot.pos.z] == 0, 'bot in Full voxel'
+            assert self[bot.pos] == 0, 'bot in Full voxel'
 
         all_seeds = {seed for bot in self.bots for seed in bot.seeds}
         assert len(all_seeds) == sum(len(bot.seeds) for bot in self.bots)
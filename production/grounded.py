@@ -0,0 +1,212 @@
+'''Groundedness analysis for voxel matrices.
+
+grounded_mask() labels a whole matrix at once: voxels are grouped into
+runs along z, runs touching across x and y are merged with a vectorized
+union-find, and every component containing a y = 0 run is grounded.
+
+GroundedTracker keeps the answer up to date while single voxels are
+filled or voided, so "is everything still grounded?" is O(1).
+'''
+
+import heapq
+from typing import List, Tuple
+
+import numpy as np
+
+from production.basics import Pos
+
+
+def _label_runs(voxels: np.ndarray) -> Tuple[np.ndarray, int]:
+    '''Give every maximal run of full voxels along z its own id.
+
+    Returns (run_id, num_runs); run_id is -1 for empty voxels.
+    '''
+    starts = voxels.copy()
+    starts[:, :, 1:] &= ~voxels[:, :, :-1]
+    run_id = np.cumsum(starts.ravel(), dtype=np.int64).reshape(voxels.shape) - 1
+    run_id[~voxels] = -1
+    return run_id, int(run_id.max(initial=-1)) + 1
+
+
+def _run_edges(voxels: np.ndarray, run_id: np.ndarray):
+    '''Pairs of run ids that touch across the x or y axis (deduplicated).'''
+    n = int(run_id.max(initial=-1)) + 1
+    keys = []
+    for axis in (0, 1):
+        lo = [slice(None)] * 3
+        hi = [slice(None)] * 3
+        lo[axis] = slice(None, -1)
+        hi[axis] = slice(1, None)
+        lo, hi = tuple(lo), tuple(hi)
+        both = voxels[lo] & voxels[hi]
+        keys.append(run_id[lo][both] * n + run_id[hi][both])
+    keys = np.unique(np.concatenate(keys))
+    return keys // max(n, 1), keys % max(n, 1)
+
+
+def _union_find(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    '''Component representative of each of n nodes, given edges a[i]-b[i].
+
+    Vectorized hook-and-compress: roots are always hooked under
+    smaller roots, so parent[i] <= i and no cycles can appear.
+    '''
+    parent = np.arange(n)
+    while True:
+        ra = parent[a]
+        rb = parent[b]
+        differ = ra != rb
+        if not differ.any():
+            return parent
+        ra = ra[differ]
+        rb = rb[differ]
+        np.minimum.at(parent, np.maximum(ra, rb), np.minimum(ra, rb))
+        while True:
+            pp = parent[parent]
+            if np.array_equal(pp, parent):
+                break
+            parent = pp
+
+
+def grounded_mask(voxels: np.ndarray) -> np.ndarray:
+    '''Boolean array marking full voxels connected to the floor (y = 0).'''
+    result = np.zeros(voxels.shape, dtype=bool)
+    if not voxels[:, 0, :].any():
+        return result
+
+    # everything outside the bounding box is empty, don't bother with it
+    from production.model import array_bounds
+    lo, hi = array_bounds(voxels)
+    box = tuple(slice(l, h + 1) for l, h in zip(lo, hi))
+    v = voxels[box]
+
+    run_id, n = _label_runs(v)
+    a, b = _run_edges(v, run_id)
+    root = _union_find(n, a, b)
+
+    grounded_root = np.zeros(n, dtype=bool)
+    if lo[1] == 0:
+        floor_runs = run_id[:, 0, :]
+        grounded_root[root[floor_runs[floor_runs >= 0]]] = True
+    run_grounded = grounded_root[root]
+
+    result[box] = (run_id >= 0) & run_grounded[run_id]
+    return result
+
+
+class GroundedTracker:
+    '''Incrementally maintained groundedness of a voxel matrix.
+
+    fill() and void() keep a per-voxel grounded flag current.
+    Filling costs O(size of the floating parts it connects to the ground).
+    Voiding a grounded voxel searches from its neighbours towards the
+    floor, lowest voxels first, and only walks a whole component
+    when that component really lost its support.
+    '''
+
+    def __init__(self, R: int, voxels: np.ndarray = None):
+        self.R = R
+        if voxels is None:
+            voxels = np.zeros((R, R, R), dtype=bool)
+        assert voxels.shape == (R, R, R), voxels.shape
+        self.full = bytearray(voxels.astype(np.uint8).tobytes())
+        self.grounded = bytearray(grounded_mask(voxels).astype(np.uint8).tobytes())
+        self.num_full = int(np.count_nonzero(voxels))
+        self.num_grounded = sum(self.grounded)
+
+    @staticmethod
+    def from_model(model) -> 'GroundedTracker':
+        return GroundedTracker(model.R, model.voxels)
+
+    def _index(self, pos: Pos) -> int:
+        assert pos.is_inside_matrix(self.R), pos
+        return (pos.x * self.R + pos.y) * self.R + pos.z
+
+    def _neighbours(self, i: int) -> List[int]:
+        R = self.R
+        x, yz = divmod(i, R * R)
+        y, z = divmod(yz, R)
+        result = []
+        if x > 0: result.append(i - R * R)
+        if x < R - 1: result.append(i + R * R)
+        if y > 0: result.append(i - R)
+        if y < R - 1: result.append(i + R)
+        if z > 0: result.append(i - 1)
+        if z < R - 1: result.append(i + 1)
+        return result
+
+    def is_full(self, pos: Pos) -> bool:
+        return bool(self.full[self._index(pos)])
+
+    def is_grounded(self, pos: Pos) -> bool:
+        return bool(self.grounded[self._index(pos)])
+
+    def all_grounded(self) -> bool:
+        return self.num_grounded == self.num_full
+
+    def fill(self, pos: Pos):
+        i = self._index(pos)
+        if self.full[i]:
+            return
+        self.full[i] = 1
+        self.num_full += 1
+        if pos.y == 0 or any(self.grounded[j] for j in self._neighbours(i)):
+            self._ground_from(i)
+
+    def _ground_from(self, i: int):
+        '''Mark i and every floating voxel connected to it as grounded.'''
+        self.grounded[i] = 1
+        self.num_grounded += 1
+        stack = [i]
+        while stack:
+            for j in self._neighbours(stack.pop()):
+                if self.full[j] and not self.grounded[j]:
+                    self.grounded[j] = 1
+                    self.num_grounded += 1
+                    stack.append(j)
+
+    def void(self, pos: Pos):
+        i = self._index(pos)
+        if not self.full[i]:
+            return
+        self.full[i] = 0
+        self.num_full -= 1
+        if not self.grounded[i]:
+            return
+        self.grounded[i] = 0
+        self.num_grounded -= 1
+
+        still_grounded = set()
+        for j in self._neighbours(i):
+            if not self.grounded[j] or j in still_grounded:
+                continue
+            reached, component = self._search_floor(j)
+            if reached:
+                still_grounded.update(component)
+            else:
+                for k in component:
+                    self.grounded[k] = 0
+                self.num_grounded -= len(component)
+
+    def _search_floor(self, start: int):
+        '''Best-first search from start towards y = 0 over grounded voxels.
+
+        Returns (reached_floor, visited). When the floor is not reached,
+        visited is the whole component of start.
+        '''
+        R = self.R
+        visited = {start}
+        queue = [((start // R) % R, start)]
+        while queue:
+            y, k = heapq.heappop(queue)
+            if y == 0:
+                return True, visited
+            for j in self._neighbours(k):
+                if self.grounded[j] and j not in visited:
+                    visited.add(j)
+                    heapq.heappush(queue, ((j // R) % R, j))
+        return False, visited
+
+    def grounded_mask(self) -> np.ndarray:
+        R = self.R
+        return np.frombuffer(bytes(self.grounded), dtype=np.uint8)\
+            .astype(bool).reshape(R, R, R)
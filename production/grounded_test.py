@@ -0,0 +1,72 @@
+import random
+from collections import deque
+
+import numpy as np
+
+from production.basics import Pos
+from production.model import Model
+from production.grounded import grounded_mask, GroundedTracker
+from production import data_files
+
+
+def naive_grounded_mask(voxels):
+    R = voxels.shape[0]
+    result = np.zeros_like(voxels)
+    queue = deque()
+    for x in range(R):
+        for z in range(R):
+            if voxels[x, 0, z]:
+                result[x, 0, z] = True
+                queue.append((x, 0, z))
+    while queue:
+        x, y, z = queue.popleft()
+        for dx, dy, dz in [(1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)]:
+            p = (x + dx, y + dy, z + dz)
+            if all(0 <= c < R for c in p) and voxels[p] and not result[p]:
+                result[p] = True
+                queue.append(p)
+    return result
+
+
+def test_grounded_mask_random():
+    rng = np.random.RandomState(42)
+    for density in [0.1, 0.3, 0.5, 0.7]:
+        voxels = rng.random_sample((9, 9, 9)) < density
+        assert np.array_equal(grounded_mask(voxels), naive_grounded_mask(voxels))
+
+
+def test_grounded_mask_model():
+    m = Model.parse(data_files.lightning_problem('LA004_tgt.mdl'))
+    mask = m.grounded_mask()
+    assert np.array_equal(mask, m.voxels)
+
+    m[Pos(0, 19, 0)] = True
+    assert not m.grounded_mask()[0, 19, 0]
+
+
+def test_large_component():
+    # used to blow the recursion limit
+    m = Model(20)
+    m.voxels[1:19, :, 1:19] = True
+    assert m.grounded_mask().sum() == 18 * 20 * 18
+    assert len(m.grounded_voxels()) == 18 * 20 * 18
+
+
+def test_tracker():
+    R = 6
+    random.seed(1)
+    tracker = GroundedTracker(R)
+    voxels = np.zeros((R, R, R), dtype=bool)
+    for _ in range(2000):
+        p = Pos(random.randrange(R), random.randrange(R), random.randrange(R))
+        if random.random() < 0.6:
+            tracker.fill(p)
+            voxels[p.x, p.y, p.z] = True
+        else:
+            tracker.void(p)
+            voxels[p.x, p.y, p.z] = False
+
+        expected = naive_grounded_mask(voxels)
+        assert np.array_equal(tracker.grounded_mask(), expected)
+        assert tracker.all_grounded() == np.array_equal(expected, voxels)
+        assert tracker.is_grounded(p) == expected[p.x, p.y, p.z]
@@ -1,86 +1,118 @@
-from typing import Optional, Set
-from bitarray import bitarray
+from typing import Optional, Set, Tuple
+
+import numpy as np
 
 from production.basics import Pos, Region
+from production.grounded import grounded_mask
+
+
+Bounds = Tuple[Tuple[int, int, int], Tuple[int, int, int]]
+
+
+def array_bounds(a: np.ndarray) -> Optional[Bounds]:
+    '''Inclusive (min, max) corners of the nonzero cells of a 3-D array.
+
+    Returns None if there are no such cells.
+    '''
+    lo = []
+    hi = []
+    for axis in range(3):
+        others = tuple(i for i in range(3) if i != axis)
+        nz = np.flatnonzero(a.any(axis=others))
+        if not len(nz):
+            return None
+        lo.append(int(nz[0]))
+        hi.append(int(nz[-1]))
+    return tuple(lo), tuple(hi)
 
 
 class Model:
+    '''Voxel matrix of size R x R x R.
+
+    Voxels are kept in `self.voxels`, a 3-D numpy array of bools
+    indexed as [x, y, z]. Prefer working with it directly
+    over iterating through __getitem__ when touching more than
+    a handful of voxels.
+    '''
+
     def __init__(self, R: int, data: Optional[bytes] = None):
-        if data is None:
-            data = b'\0' * ((R**3 - 1) // 8 + 1)
         self.R = R
-        assert len(data) == (R**3 - 1) // 8 + 1
-        self._data = bitarray(0, endian='little')
-        self._data.frombytes(data)
+        if data is None:
+            self.voxels = np.zeros((R, R, R), dtype=bool)
+        else:
+            assert len(data) == (R**3 - 1) // 8 + 1
+            bits = np.unpackbits(
+                np.frombuffer(data, dtype=np.uint8),
+                count=R**3, bitorder='little')
+            self.voxels = bits.view(bool).reshape(R, R, R)
+
+    @staticmethod
+    def from_voxels(voxels: np.ndarray) -> 'Model':
+        R = voxels.shape[0]
+        assert voxels.shape == (R, R, R), voxels.shape
+        m = Model(R)
+        m.voxels[...] = voxels
+        return m
+
+    def copy(self) -> 'Model':
+        return Model.from_voxels(self.voxels)
 
     def __getitem__(self, pos: Pos) -> bool:
-        R = self.R
-        assert pos.is_inside_matrix(R), pos
-        return self._data[pos.x * R * R + pos.y * R + pos.z]
+        assert pos.is_inside_matrix(self.R), pos
+        return bool(self.voxels[pos.x, pos.y, pos.z])
 
     def __setitem__(self, pos: Pos, value: bool):
-        R = self.R
-        assert pos.is_inside_matrix(R)
-        self._data[pos.x * R * R + pos.y * R + pos.z] = value
+        assert pos.is_inside_matrix(self.R)
+        self.voxels[pos.x, pos.y, pos.z] = value
 
     def __eq__(self, other):
         return self.R == other.R\
-           and self.filled_voxels() == other.filled_voxels()
+           and np.array_equal(self.voxels, other.voxels)
 
     @staticmethod
     def parse(data: bytes) -> 'Model':
         return Model(R=data[0], data=data[1:])
 
+    def compose(self) -> bytes:
+        '''Inverse of parse().'''
+        packed = np.packbits(self.voxels.ravel(), bitorder='little')
+        return bytes([self.R]) + packed.tobytes()
+
+    @property
+    def num_full(self) -> int:
+        return int(np.count_nonzero(self.voxels))
+
     def enum_voxels(self):
         for x in range(self.R):
             for y in range(self.R):
                 for z in range(self.R):
                     yield Pos(x, y, z)
 
+    def filled_coords(self) -> np.ndarray:
+        '''Coordinates of all full voxels as an (N, 3) array, in x-y-z order.'''
+        return np.argwhere(self.voxels)
 
     def filled_voxels(self) -> Set[Pos]:
-        filled = set()
-        for x in range(self.R):
-            for y in range(self.R):
-                for z in range(self.R):
-                    if self[Pos(x,y,z)]:
-                        filled.add(Pos(x,y,z))
-        return filled
-    
+        return {Pos(x, y, z) for x, y, z in self.filled_coords().tolist()}
+
     def is_filled(self, voxel):
         return self[voxel]
 
     def is_empty(self, voxel):
         return not self.is_filled(voxel)
-    
-    def grounded_voxels(self) -> Set[Pos]:
-        visited = set()
 
-        def visit(pos):
-            if pos in visited:
-                return
-            if self[pos] == 0:
-                return
-            visited.add(pos)
-            for p in pos.enum_adjacent(self.R):
-                visit(p)
+    def grounded_mask(self) -> np.ndarray:
+        return grounded_mask(self.voxels)
 
-        for x in range(self.R):
-            for z in range(self.R):
-                visit(Pos(x, 0, z))
-
-        return visited
+    def grounded_voxels(self) -> Set[Pos]:
+        return {Pos(x, y, z) for x, y, z in np.argwhere(self.grounded_mask()).tolist()}
 
     def bounding_box(self) -> Optional[Region]:
-        end = Pos(self.R - 1, self.R - 1, self.R - 1)
-        box = None
-        for pos in Region(Pos(0, 0, 0), end):
-            if self[pos]:
-                if not box:
-                    box = Region(pos, pos)
-                else:
-                    box.expand(pos)
-        return box
+        bounds = array_bounds(self.voxels)
+        if bounds is None:
+            return None
+        lo, hi = bounds
+        return Region(Pos(*lo), Pos(*hi))
 
 
 def main():
@@ -2,6 +2,7 @@ import unittest
 
 from production.model import Model
 from production.basics import *
+from production import data_files
 
 from production.cpp_emulator import emulator as cppe
 
@@ -48,3 +49,33 @@ class CppMatrixTests(unittest.TestCase, CommonTests):
     def setUp(self):
         self.Pos = cppe.Pos
         self.Model = cppe.Matrix
+
+
+def test_parse_compose():
+    data = data_files.lightning_problem('LA004_tgt.mdl')
+    m = Model.parse(data)
+    assert m.R == 20
+    assert m.num_full == 559
+    assert m.compose() == data
+    assert Model.parse(m.compose()) == m
+
+    m2 = m.copy()
+    m2[Pos(10, 1, 1)] = True
+    assert m2 != m
+    assert m2.num_full == 560
+
+
+def test_vectorized_queries():
+    m = Model(4)
+    assert m.bounding_box() is None
+    assert m.filled_voxels() == set()
+
+    cells = [Pos(1, 0, 2), Pos(1, 1, 2), Pos(3, 2, 0)]
+    for p in cells:
+        m[p] = True
+
+    box = m.bounding_box()
+    assert (box.pos_min, box.pos_max) == (Pos(1, 0, 0), Pos(3, 2, 2))
+    assert m.filled_coords().tolist() == [[1, 0, 2], [1, 1, 2], [3, 2, 0]]
+    assert m.filled_voxels() == set(cells)
+    assert m.filled_voxels() == {p for p in m.enum_voxels() if m[p]}
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from itertools import chain
 
 import production.commands as Cmd
@@ -74,3 +74,35 @@ def nearby_voxel(voxel: 'Pos'):
 
 def navigate_near_voxel(current_position: 'Pos', voxel: 'Pos'):
     return navigate(current_position, nearby_voxel(voxel))
+
+
+def navigate_many(
+        model: 'Model', starts: List['Pos'], goals: List['Pos'],
+        max_steps: Optional[int] = None) -> Optional[List[List[Cmd.Command]]]:
+    '''
+    Routes for several bots at once that don't run into each other or into
+    full voxels of the model (see plan_routes in cpp_emulator/planner.h).
+    Bots listed first get priority.
+
+    Returns a list of commands per bot, all of the same length, or None if
+    some bot can't get to its goal in max_steps steps. Step i of every list
+    together is a valid time step; see interleave().
+    '''
+    import production.cpp_emulator.emulator as Cpp
+    from production.cpp_mediator import cmd_from_cpp
+
+    if max_steps is None:
+        max_steps = 3 * model.R + len(starts)
+    routes = Cpp.plan_routes(
+        Cpp.Matrix.parse(model.compose()),
+        [Cpp.Pos(p.x, p.y, p.z) for p in starts],
+        [Cpp.Pos(p.x, p.y, p.z) for p in goals],
+        max_steps)
+    if routes is None:
+        return None
+    return [[cmd_from_cpp(cmd) for cmd in route] for route in routes]
+
+
+def interleave(routes: List[List[Cmd.Command]]) -> List[Cmd.Command]:
+    '''Trace of parallel routes; they must be in the order of bot ids.'''
+    return [cmd for step in zip(*routes) for cmd in step]
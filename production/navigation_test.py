@@ -0,0 +1,80 @@
+from production.model import Model
+from production.basics import Pos, Diff
+from production.emulator import Bot, State, LOW
+from production.navigation import navigate_many, interleave
+from production.cpp_mediator import state_to_cpp
+import production.cpp_emulator.emulator as Cpp
+
+
+def run_routes(model, bots, routes):
+    s = State(model.R)
+    s.matrix = model
+    s.harmonics = LOW
+    s.energy = 0
+    s.bots = bots
+    em = Cpp.Emulator(state_to_cpp(s))
+    em.run_commands(Cpp.decode_trace(bytes(b for cmd in interleave(routes) for b in cmd.compose())))
+    return sorted((b.bid, (b.pos.x, b.pos.y, b.pos.z)) for b in em.get_state().bots if b.active)
+
+
+def test_navigate_many_swaps():
+    R = 12
+    m = Model(R)
+    # a wall with a hole in the middle
+    for y in range(R):
+        for z in range(R):
+            if (y, z) != (5, 5):
+                m[Pos(6, y, z)] = True
+
+    starts = [Pos(1, 0, z) for z in range(0, 10, 2)]
+    goals = [Pos(10, 0, z) for z in range(8, -1, -2)]
+    # everybody has to squeeze through the hole and cross the others' way
+    bots = [Bot(bid=i + 1, pos=p, seeds=[]) for i, p in enumerate(starts)]
+    routes = navigate_many(m, starts, goals)
+    assert routes is not None
+    assert len({len(r) for r in routes}) == 1
+
+    final = run_routes(m, bots, routes)
+    assert final == [(i + 1, (p.x, p.y, p.z)) for i, p in enumerate(goals)]
+
+
+def test_navigate_many_swap_in_corridor():
+    R = 5
+    m = Model(R)
+    for x in range(R):
+        for y in range(R):
+            for z in range(R):
+                if not (y == 0 and z in (0, 1)):
+                    m[Pos(x, y, z)] = True
+    # two lanes, bots at the ends of one of them trade places
+    starts = [Pos(0, 0, 0), Pos(4, 0, 0)]
+    goals = [Pos(4, 0, 0), Pos(0, 0, 0)]
+    bots = [Bot(bid=1, pos=starts[0], seeds=[]), Bot(bid=2, pos=starts[1], seeds=[])]
+    routes = navigate_many(m, starts, goals)
+    assert routes is not None
+    assert run_routes(m, bots, routes) == [(1, (4, 0, 0)), (2, (0, 0, 0))]
+
+
+def test_navigate_many_impossible():
+    m = Model(3)
+    for x in range(3):
+        for z in range(3):
+            m[Pos(x, 1, z)] = True
+    assert navigate_many(m, [Pos(0, 0, 0)], [Pos(0, 2, 0)]) is None
+
+
+def test_navigate_many_rejected_early():
+    R = 60
+    m = Model(R)
+    # the goal is walled in
+    for d in Diff(1, 0, 0), Diff(-1, 0, 0), Diff(0, 1, 0), Diff(0, 0, 1), Diff(0, 0, -1):
+        m[Pos(30, 0, 30) + d] = True
+    assert navigate_many(m, [Pos(0, 0, 0)], [Pos(30, 0, 30)], max_steps=10000) is None
+    # two bots can't stay at the same goal
+    assert navigate_many(m, [Pos(0, 0, 0), Pos(0, 0, 5)], [Pos(9, 0, 9)] * 2, max_steps=10000) is None
+
+    # too much searching
+    cpp_m = Cpp.Matrix.parse(Model(10).compose())
+    start, goal = Cpp.Pos(0, 0, 0), Cpp.Pos(9, 9, 9)
+    assert Cpp.plan_routes(cpp_m, [start], [goal], 1000) is not None
+    assert Cpp.plan_routes(cpp_m, [start], [goal], 1000, max_expansions=2) is None
@@ -1,86 +1,188 @@
 import logging
 logger = logging.getLogger(__name__)
 
-from dataclasses import dataclass
-from typing import Iterable, Union
+from array import array
+from typing import Dict, Iterable, Iterator, List
 import itertools as it
 
 from production.commands import *
 
 
-@dataclass(frozen=True)
+# Commands in programs are stored as small ints, one per distinct command
+# (by encoding), so that steps are compact arrays and composing them is
+# array arithmetic.
+_commands: List[Command] = []
+_encoded: List[bytes] = []
+_codes: Dict[bytes, int] = {}
+
+
+def intern_command(cmd: Command) -> int:
+    data = cmd.encoded()
+    code = _codes.get(data)
+    if code is None:
+        code = _codes[data] = len(_commands)
+        _commands.append(cmd)
+        _encoded.append(data)
+    return code
+
+
+WAIT = intern_command(Wait())
+
+_wait_steps: Dict[int, array] = {}
+
+def _waits(n: int) -> array:
+    step = _wait_steps.get(n)
+    if step is None:
+        step = _wait_steps[n] = array('i', [WAIT]) * n
+    return step
+
+
+# Kinds of program nodes. Programs are never modified, so composing them
+# only makes a new node on top; steps are produced when the program is
+# iterated or composed.
+_STEPS, _CAT, _PAR, _POW, _SEQ = range(5)
+
+
 class GroupProgram:
-    startSize: int
-    endSize: int
-    stepsSequence: Iterable[Iterable[Command]]
+    '''
+    Steps of a group of bots that starts with startSize bots and ends with
+    endSize. duration is the number of steps.
+
+    Programs are immutable and can be used any number of times.
+    '''
+    __slots__ = ('startSize', 'endSize', 'duration', '_kind', '_a', '_b')
+
+    def __init__(self, startSize: int, endSize: int,
+            stepsSequence: Iterable[Iterable[Command]] = ()):
+        steps = [array('i', map(intern_command, step)) for step in stepsSequence]
+        self._init(startSize, endSize, len(steps), _STEPS, steps, None)
+
+    def _init(self, startSize, endSize, duration, kind, a, b):
+        self.startSize = startSize
+        self.endSize = endSize
+        self.duration = duration
+        self._kind = kind
+        self._a = a
+        self._b = b
+        return self
+
+    @staticmethod
+    def _node(startSize, endSize, duration, kind, a, b=None) -> "GroupProgram":
+        return object.__new__(GroupProgram)._init(startSize, endSize, duration, kind, a, b)
 
     # Compose two groups into a larger one (>>).
     # Make the two original groups act sequentially.
     def __rshift__(self: "GroupProgram", other: "GroupProgram") -> "GroupProgram":
-        seq1 = map(lambda step: it.chain(step, it.repeat(Wait(), other.startSize)), self.stepsSequence)
-        seq1 = map(lambda step: it.chain(it.repeat(Wait(), self.endSize), step), other.stepsSequence)
-        newSeq = it.chain(seq1, seq2)
-        return GroupProgram(self.startSize + other.startSize,
+        return GroupProgram._node(self.startSize + other.startSize,
                 self.endSize + other.endSize,
-                newSeq)
+                self.duration + other.duration, _SEQ, self, other)
 
     # Compose two groups into a larger one (//).
-    # Run their actions in parallel
+    # Run their actions in parallel, the one that finishes first waits.
     def __floordiv__(self: "GroupProgram", other: "GroupProgram") -> "GroupProgram":
-        def combine(step1: Iterable[Command], step2: Iterable[Command]) -> Iterable[Command]:
-            if step1 is None:
-                step1 = it.repeat(Wait(), self.endSize)
-            if step2 is None:
-                step2 = it.repeat(Wait(), other.endSize)
-            return it.chain(step1, step2)
-
-        newSeq = it.starmap(combine, it.zip_longest(self.stepsSequence, other.stepsSequence))
-        return GroupProgram(self.startSize + other.startSize,
+        return GroupProgram._node(self.startSize + other.startSize,
                 self.endSize + other.endSize,
-                newSeq)
+                max(self.duration, other.duration), _PAR, self, other)
 
     # Repeat the same program for a number of groups (**).
     def __pow__(self: "GroupProgram", times: int) -> "GroupProgram":
-        newSeq = map(lambda step: it.chain(*it.repeat(list(step), times)), self.stepsSequence)
-        return GroupProgram(self.startSize * times, self.endSize * times, newSeq)
-
+        return GroupProgram._node(self.startSize * times, self.endSize * times,
+                self.duration, _POW, self, times)
 
     # Concatenate two sequences of steps by the same group (+).
     def __add__(self: "GroupProgram", other: "GroupProgram") -> "GroupProgram":
         assert self.endSize == other.startSize, '{} != {}'.format(self.endSize, other.startSize)
-        newSeq = it.chain(self.stepsSequence, other.stepsSequence)
-        return GroupProgram(self.startSize, other.endSize, newSeq)
-
+        if not other.duration:
+            return GroupProgram._node(self.startSize, other.endSize,
+                    self.duration, self._kind, self._a, self._b)
+        if not self.duration:
+            return GroupProgram._node(self.startSize, other.endSize,
+                    other.duration, other._kind, other._a, other._b)
+        return GroupProgram._node(self.startSize, other.endSize,
+                self.duration + other.duration, _CAT, self, other)
 
     # Indicates that during the sequence the group grows by one (unary +).
     def __pos__(self: "GroupProgram") -> "GroupProgram":
-        return GroupProgram(self.startSize, self.endSize + 1, self.stepsSequence)
+        return GroupProgram._node(self.startSize, self.endSize + 1,
+                self.duration, self._kind, self._a, self._b)
 
     # Indicates that during the sequence the group shrinks by one (unary -).
     def __neg__(self: "GroupProgram") -> "GroupProgram":
-        return GroupProgram(self.startSize, self.endSize - 1, self.stepsSequence)
+        return GroupProgram._node(self.startSize, self.endSize - 1,
+                self.duration, self._kind, self._a, self._b)
 
 
     # Turn a sequence of moves of a single bot into a group program.
     @staticmethod
     def singleton(*moves: Iterable[Command], endSize=1) -> "GroupProgram":
-        return GroupProgram(1, endSize, map(lambda move: [move], moves))
+        steps = [array('i', [intern_command(move)]) for move in moves]
+        return GroupProgram._node(1, endSize, len(steps), _STEPS, steps)
 
     # Turn a sequence of moves of an empty group into a group program.
     @staticmethod
     def empty(*moves: Iterable[Command]) -> "GroupProgram":
-        return GroupProgram(0, 0, [])
+        return GroupProgram._node(0, 0, 0, _STEPS, [])
 
 
-    # Turns the iterable inside the program into a list which makes it safe
-    # to refer to this program multiple times.
+    # Programs are immutable, there's nothing to freeze.
     def frozen(self):
-        return GroupProgram(self.startSize, self.endSize,
-                list(map(list, self.stepsSequence)))
-
+        return self
+
+
+    def steps(self) -> Iterator[array]:
+        '''Command codes of every step (see intern_command).'''
+        # Concatenations are unrolled with an explicit stack, since
+        # programs built with += are as deep as they are long; only
+        # the other kinds nest generators.
+        stack = [self]
+        while stack:
+            p = stack.pop()
+            kind = p._kind
+            if kind == _STEPS:
+                yield from p._a
+            elif kind == _CAT:
+                stack.append(p._b)
+                stack.append(p._a)
+            elif kind == _PAR:
+                a, b = p._a, p._b
+                pad_a = _waits(a.endSize)
+                pad_b = _waits(b.endSize)
+                for step_a, step_b in it.zip_longest(a.steps(), b.steps()):
+                    yield (pad_a if step_a is None else step_a) + (pad_b if step_b is None else step_b)
+            elif kind == _POW:
+                times = p._b
+                for step in p._a.steps():
+                    yield step * times
+            elif kind == _SEQ:
+                a, b = p._a, p._b
+                pad_a = _waits(a.endSize)
+                pad_b = _waits(b.startSize)
+                for step in a.steps():
+                    yield step + pad_b
+                for step in b.steps():
+                    yield pad_a + step
+            else:
+                assert False, kind
+
+    @property
+    def stepsSequence(self) -> Iterator[List[Command]]:
+        commands = _commands
+        return ([commands[c] for c in step] for step in self.steps())
+
+    def compose(self) -> bytearray:
+        '''Same as compose_commands(self), without making command objects.'''
+        encoded = _encoded
+        res = bytearray()
+        for step in self.steps():
+            for c in step:
+                res += encoded[c]
+        return res
 
     def __iter__(self):
-        return it.chain(*self.stepsSequence)
+        commands = _commands
+        for step in self.steps():
+            for c in step:
+                yield commands[c]
 
 
 single = GroupProgram.singleton
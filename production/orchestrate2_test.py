@@ -0,0 +1,52 @@
+from production.basics import Diff
+from production.commands import *
+from production.orchestrate2 import GroupProgram, single, singles, empty
+
+
+def steps(prog):
+    return list(map(list, prog.stepsSequence))
+
+
+A = SMove(Diff(1, 0, 0))
+B = SMove(Diff(0, 1, 0))
+C = Fill(Diff(0, -1, 0))
+
+
+def test_composition():
+    p = single(A, B)
+    q = single(C)
+
+    assert steps(p + q) == [[A], [B], [C]]
+    assert steps(p // q) == [[A, C], [B, Wait()]]
+    assert steps(q // p) == [[C, A], [Wait(), B]]
+    assert steps(p ** 3) == [[A, A, A], [B, B, B]]
+    assert steps(p >> q) == [[A, Wait()], [B, Wait()], [Wait(), C]]
+    assert (p >> q).startSize == 2
+
+    fork = +single(Fission(Diff(1, 0, 0), 0))
+    prog = fork + (q // p)
+    assert (prog.startSize, prog.endSize, prog.duration) == (1, 2, 3)
+    assert steps(prog) == [[Fission(Diff(1, 0, 0), 0)], [C, A], [Wait(), B]]
+    # a shrinking group waits with the bots it ends with
+    assert steps(-single(A) // single(B, C)) == [[A, B], [C]]
+
+    assert steps(empty() // p) == steps(p)
+    assert steps(single() + p + single()) == steps(p)
+    assert steps(GroupProgram(2, 2, [[A, B], [C, C]])) == [[A, B], [C, C]]
+
+
+def test_reuse_and_compose():
+    p = singles([A, B, C])
+    prog = (p // p) + (p ** 2)
+    assert list(prog) == [A, A, B, B, C, C] * 2
+    assert list(prog) == list(prog)
+    assert prog.compose() == compose_commands(list(prog))
+
+
+def test_deep_concatenation():
+    prog = single()
+    for _ in range(100000):
+        prog += single(A)
+    prog = prog // prog
+    assert prog.duration == 100000
+    assert len(prog.compose()) == 2 * 2 * 100000
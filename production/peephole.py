@@ -0,0 +1,167 @@
+'''Peephole optimization of traces.
+
+peephole() looks at what each bot does in consecutive steps and does
+it with fewer commands:
+
+- moves are merged as in solver_utils.coalesce_moves(): moves along the
+  same axis first, then short moves into LMoves; the merged move happens
+  in the step of the first one, and the bot waits in the steps of the rest;
+- a Flip to high harmonics and the Flip back are dropped if nothing is
+  filled or voided from one to the other;
+- steps where every bot waits are dropped.
+
+A merged move crosses some cells earlier than before and leaves the bot at
+its destination for longer, so it is only done if no other bot touches
+those cells from then until the original move. The result is checked with
+the emulator and only used if it is better.
+'''
+
+import logging
+from typing import Dict, List, Optional
+
+from production.basics import Pos, Diff
+from production.commands import *
+from production.compaction import replay, MATRIX_COMMANDS
+from production.solver_utils import merge_moves
+from production.cpp_emulator.run import run_full
+
+logger = logging.getLogger(__name__)
+
+SHARED = 0  # owner of cells claimed by several bots in the same step
+
+
+def _claims(step: Dict[int, Command], starts: Dict[int, Pos]) -> Dict[Pos, int]:
+    owners = {}
+    for bid, cmd in step.items():
+        for p in cmd.volatile(starts[bid]):
+            if owners.setdefault(p, bid) != bid:
+                owners[p] = SHARED
+    return owners
+
+
+def _displacement(cmd: Command) -> Diff:
+    if isinstance(cmd, SMove):
+        return cmd.lld
+    if isinstance(cmd, LMove):
+        return cmd.sld1 + cmd.sld2
+    return Diff(0, 0, 0)
+
+
+class _Trace:
+    def __init__(self, trace_data: bytes):
+        # commands and positions before the step, by bid
+        self.steps: List[Dict[int, Command]] = []
+        self.starts: List[Dict[int, Pos]] = []
+        self.bids = set()
+        for active, positions, step, _ in replay(trace_data):
+            self.steps.append(dict(zip(active, step)))
+            self.starts.append({bid: positions[bid] for bid in active})
+            self.bids.update(active)
+        self.claims = [_claims(step, starts) for step, starts in zip(self.steps, self.starts)]
+
+    def merge_moves(self, bid: int, lmoves: bool):
+        anchor = None  # the step of the bot's last move, if it only waited since
+        for k, step in enumerate(self.steps):
+            cmd = step.get(bid)
+            if cmd is None:
+                anchor = None
+                continue
+            if isinstance(cmd, Wait):
+                continue
+            if anchor is not None:
+                merged = merge_moves(self.steps[anchor][bid], cmd, lmoves)
+                if merged is not None and self._move_earlier(bid, anchor, k, merged):
+                    if isinstance(merged, Wait):
+                        anchor = None
+                    continue
+            anchor = k if isinstance(cmd, SMove) else None
+
+    def _move_earlier(self, bid: int, anchor: int, k: int, merged: Command) -> bool:
+        '''Do merged in step anchor, and wait in step k, if it's safe.'''
+        start = self.starts[anchor][bid]
+        end = start + _displacement(merged)
+        route = merged.volatile(start)
+        # the bot now goes through the cells of the later move early, so no
+        # one else may touch them in between (they could be filled then)
+        added = route - self.steps[anchor][bid].volatile(start)
+        cells = [(anchor, route)]
+        cells.extend((s, added | {end}) for s in range(anchor + 1, k + 1))
+        for s, ps in cells:
+            claims = self.claims[s]
+            if any(claims.get(p, bid) != bid for p in ps):
+                return False
+
+        self.steps[anchor][bid] = merged
+        self.steps[k][bid] = Wait()
+        for s, ps in cells:
+            for p in ps:
+                self.claims[s][p] = bid
+        for s in range(anchor + 1, k + 1):
+            self.starts[s][bid] = end
+        return True
+
+    def drop_flips(self):
+        high = False
+        flip_on = None  # (step, bid) of the Flip to high harmonics
+        for k, step in enumerate(self.steps):
+            changes = any(isinstance(cmd, MATRIX_COMMANDS) for cmd in step.values())
+            flips = [bid for bid, cmd in step.items() if isinstance(cmd, Flip)]
+            if len(flips) == 1 and not changes:
+                if not high:
+                    flip_on = (k, flips[0])
+                elif flip_on is not None:
+                    j, bid = flip_on
+                    self.steps[j][bid] = Wait()
+                    step[flips[0]] = Wait()
+                    flip_on = None
+            elif flips or changes:
+                flip_on = None
+            if len(flips) % 2:
+                high = not high
+
+    def compose(self) -> bytes:
+        res = bytearray()
+        for step in self.steps:
+            if all(isinstance(cmd, Wait) for cmd in step.values()):
+                continue
+            for cmd in step.values():
+                res += cmd.encoded()
+        return bytes(res)
+
+
+def peephole(trace_data: bytes) -> bytes:
+    '''
+    The rewritten trace. Expects a valid trace; see optimize_trace() for the
+    checked version.
+    '''
+    trace = _Trace(trace_data)
+    for lmoves in False, True:
+        for bid in sorted(trace.bids):
+            trace.merge_moves(bid, lmoves)
+    trace.drop_flips()
+    return trace.compose()
+
+
+def optimize_trace(
+        src_model: Optional[bytes],
+        tgt_model: Optional[bytes],
+        trace_data: bytes) -> bytes:
+    '''peephole() if the emulator agrees the result is cheaper.'''
+    before = run_full(src_model, tgt_model, trace_data)
+    if before.energy is None:
+        return trace_data
+    try:
+        optimized = peephole(trace_data)
+    except Exception:
+        logger.exception('peephole optimization failed')
+        return trace_data
+    after = run_full(src_model, tgt_model, optimized)
+    logger.info(
+        f'{before.extra["steps"]} steps, energy {before.energy} -> '
+        f'{after.extra.get("steps")} steps, energy {after.energy}')
+    if after.energy is None:
+        logger.warning(f'optimized trace is broken: {after.extra}')
+        return trace_data
+    if after.energy >= before.energy:
+        return trace_data
+    return optimized
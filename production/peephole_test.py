@@ -0,0 +1,104 @@
+from production.basics import Pos, Diff
+from production.commands import *
+from production.model import Model
+from production.trace_builder import TraceBuilder
+from production.trace_decoder import decode_trace
+from production.peephole import peephole, optimize_trace
+from production.compaction import compact_trace
+from production.cpp_emulator.run import run_full
+from production.default_solver2 import solve_gen
+from production import data_files
+
+
+def test_single_bot():
+    x = Diff(1, 0, 0)
+    y = Diff(0, 1, 0)
+    z = Diff(0, 0, 1)
+    cmds = [
+        Flip(), SMove(y), Flip(),
+        SMove(x * 3), SMove(x * 3), SMove(z * 2), Fill(y * -1),
+        Flip(), SMove(z), Fill(y * -1), Flip(),
+        SMove(x * -6), SMove(z * -3), SMove(y * -1), Halt()]
+    trace_data = compose_commands(cmds)
+    tgt = Model(8)
+    tgt[Pos(6, 0, 2)] = tgt[Pos(6, 0, 3)] = True
+
+    steps = list(decode_trace(peephole(trace_data)).steps())
+    assert steps == [[cmd] for cmd in [
+        SMove(y), SMove(x * 6), SMove(z * 2), Fill(y * -1),
+        Flip(), SMove(z), Fill(y * -1), Flip(),
+        SMove(x * -6), LMove(z * -3, y * -1), Halt()]]
+    before = run_full(None, tgt.compose(), trace_data).energy
+    after = run_full(None, tgt.compose(), peephole(trace_data)).energy
+    assert after < before
+
+
+def test_other_bots_in_the_way():
+    x = Diff(1, 0, 0)
+    z = Diff(0, 0, 1)
+    tb = TraceBuilder(6)
+    tb.fission(1, z, 0)
+    tb.add(2, SMove(z))
+    tb.add(1, Wait(), SMove(z))
+    tb.add(2, Wait(), SMove(x))
+    # bot 2 is still there the step before
+    tb.add(1, Wait(), SMove(z))
+    tb.fuse(1, 2)
+    tb.add(1, SMove(z * -2), Halt())
+    trace_data = bytes(tb.compose())
+    assert len(list(tb.steps())) == 8
+
+    optimized = peephole(trace_data)
+    assert list(decode_trace(optimized).steps()) == [
+        [Fission(z, 0)],
+        [Wait(), LMove(z, x)],
+        [SMove(z), Wait()],
+        [SMove(z), Wait()],
+        [FusionP(x), FusionS(x * -1)],
+        [SMove(z * -2)],
+        [Halt()],
+    ]
+    assert run_full(None, Model(6).compose(), optimized).energy is not None
+
+
+def test_cell_changed_before_the_move():
+    x = Diff(1, 0, 0)
+    z = Diff(0, 0, 1)
+    tb = TraceBuilder(5)
+    b2 = tb.fission(1, x, 0)
+    tb.add(1, SMove(z), Wait(), SMove(z * 2))
+    # bot 1 can't go through (0, 0, 2) before this
+    tb.add(b2, SMove(z * 2), Void(x * -1), SMove(z))
+    tb.fuse(1, b2)
+    tb.add(1, SMove(z * -3), Halt())
+    trace_data = bytes(tb.compose())
+
+    src = Model(5)
+    src[Pos(0, 0, 2)] = True
+    src_data = src.compose()
+    tgt_data = Model(5).compose()
+    assert run_full(src_data, tgt_data, trace_data).energy is not None
+
+    optimized = peephole(trace_data)
+    assert SMove(z * 3) not in decode_trace(optimized)
+    assert run_full(src_data, tgt_data, optimized).energy is not None
+    assert run_full(src_data, tgt_data, optimize_trace(src_data, tgt_data, trace_data)).energy is not None
+
+
+def test_default2_then_compaction():
+    src, tgt = data_files.full_problem('FA011')
+    m = Model.parse(tgt)
+    trace_data = bytearray()
+    for cmd in solve_gen(m, 3, 3, low=False):
+        trace_data.extend(cmd.compose())
+    trace_data = bytes(trace_data)
+
+    before = run_full(src, tgt, trace_data)
+    optimized = optimize_trace(src, tgt, trace_data)
+    after = run_full(src, tgt, optimized)
+    assert after.energy < before.energy
+    assert after.extra['steps'] < before.extra['steps']
+
+    compacted = run_full(src, tgt, compact_trace(src, tgt, optimized))
+    assert compacted.energy < after.energy
+    assert compacted.extra['steps'] < after.extra['steps']
@@ -3,6 +3,7 @@ from production.basics import Pos, Diff
 from production.solver_interface import *
 from production.solver_utils import *
 from production.commands import *
+from production.volume_index import VolumeIndex
 
 
 class PillarSolver(Solver):
@@ -95,24 +96,28 @@ def get_model_height(model):
 
 def create_plots(model):
   pos0, pos1 = bounding_box_footprint(model)
+  index = VolumeIndex.from_model(model)
   plots = []
   for x in range(pos0.x + 1, min(pos1.x + 2, model.R), 3):
     for z in range(pos0.z + 1, min(pos1.z + 2, model.R), 3):
       plot_pos = Pos(x, 0, z)
-      plot_height = get_plot_height(model, plot_pos)
+      plot_height = get_plot_height(index, plot_pos)
       if plot_height > 0:
         plots.append((plot_pos, plot_height))
   return plots
 
 
-def get_plot_height(model, plot_pos):
+def get_plot_height(index: VolumeIndex, plot_pos):
   x_z = [(plot_pos.x + dx, plot_pos.z + dz) \
-    for (dx, dz) in dx_dz_3x3(plot_pos.x, plot_pos.z, model.R)]
-  for y in range(model.R - 2, -1, -1):
-    for x, z in x_z:
-      if model[Pos(x, y, z)]:
-        return y + 1
-  return 0
+    for (dx, dz) in dx_dz_3x3(plot_pos.x, plot_pos.z, index.R)]
+  if index.R < 2:
+    return 0
+  xs = [x for x, _ in x_z]
+  zs = [z for _, z in x_z]
+  top = index.top(Pos(min(xs), 0, min(zs)), Pos(max(xs), index.R - 2, max(zs)))
+  if top is None:
+    return 0
+  return top + 1
 
 
 def long_distances(d):
@@ -2,12 +2,19 @@ import subprocess
 import os
 import os.path
 import sys
+import json
+import struct
+import select
+import time
+import atexit
+import threading
 import tempfile
 from tempfile import NamedTemporaryFile
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Union
 
 from production import data_files
+from production.trace_sink import TraceSink
 
 
 def dictify(result):
@@ -57,7 +64,7 @@ def do_run(*args) -> EmulatorResult:
 def run_full(
         src_model_data: Optional[bytes],
         tgt_model_data: Optional[bytes],
-        trace_data: bytes) -> EmulatorResult:
+        trace_data: Union[bytes, TraceSink]) -> EmulatorResult:
 
     src_name, tgt_name = "None", "None"
     if src_model_data:
@@ -69,14 +76,19 @@ def run_full(
             tgt_mdl.write(tgt_model_data)
             tgt_name = tgt_mdl.name
 
-    with NamedTemporaryFile(delete=False, suffix=".nbt") as trace:
-         trace.write(trace_data)
-    
-    result = do_run("full", src_name, tgt_name, trace.name)
+    if isinstance(trace_data, TraceSink):
+        # already on disk
+        trace_name = trace_data.close().path
+    else:
+        with NamedTemporaryFile(delete=False, suffix=".nbt") as trace:
+            trace.write(trace_data)
+        trace_name = trace.name
+
+    result = do_run("full", src_name, tgt_name, trace_name)
 
     if src_model_data: os.remove(src_name)
     if tgt_model_data: os.remove(tgt_name)
-    os.remove(trace.name)
+    if not isinstance(trace_data, TraceSink): os.remove(trace_name)
 
     return result
 
@@ -96,6 +108,163 @@ def run(model_data: bytes, trace_data: bytes) -> EmulatorResult:
     return result
 
 
+class PyjsServer:
+    '''A node process running server.js that checks traces one after another.
+
+    Saves the node startup and simulator load per trace, and the temp
+    files. Restarted automatically if it dies; a trace that kills it
+    twice in a row raises SimulatorException, and so does a trace that
+    takes longer than timeout seconds (the process is killed then).
+    '''
+
+    NONE = 0xffffffff
+    SCRIPT = os.path.join(os.path.dirname(__file__), "server.js")
+
+    def __init__(self, timeout: Optional[float] = 600):
+        self.proc = None
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # what node wrote to stderr and we haven't looked at, in chunks
+        self.stderr_chunks = []
+        self.stderr_thread = None
+
+    def start(self):
+        # unbuffered, so that select() sees everything that's not read yet
+        self.proc = subprocess.Popen(
+            ("node", self.SCRIPT, "full"),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0)
+        self.stderr_chunks = []
+        # the simulator logs to stderr, node must not block on a full pipe
+        self.stderr_thread = threading.Thread(
+            target=self._drain_stderr, args=(self.proc, self.stderr_chunks), daemon=True)
+        self.stderr_thread.start()
+
+    @staticmethod
+    def _drain_stderr(proc, chunks):
+        fd = proc.stderr.fileno()
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    def _take_stderr(self) -> str:
+        n = len(self.stderr_chunks)
+        data = b''.join(self.stderr_chunks[:n])
+        del self.stderr_chunks[:n]
+        return data.decode('utf-8', 'replace')
+
+    def _stop(self, kill: bool) -> str:
+        '''Stops the process, returns the rest of its stderr.'''
+        if kill:
+            self.proc.kill()
+        else:
+            self.proc.stdin.close()
+        self.proc.wait()
+        self.stderr_thread.join(5)
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+        self.proc = None
+        return self._take_stderr()
+
+    def close(self):
+        if self.proc is not None:
+            self._stop(kill=False)
+
+    def _send(self, data):
+        out = self.proc.stdin
+        if data is None:
+            out.write(struct.pack('<I', self.NONE))
+        elif isinstance(data, TraceSink):
+            out.write(struct.pack('<I', len(data.close())))
+            for chunk in data.iter_chunks():
+                out.write(chunk)
+        else:
+            out.write(struct.pack('<I', len(data)))
+            out.write(data)
+
+    def _read_exactly(self, n, deadline: Optional[float]):
+        fd = self.proc.stdout.fileno()
+        data = bytearray()
+        while len(data) < n:
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0 or not select.select([fd], [], [], left)[0]:
+                    raise TimeoutError()
+            chunk = os.read(fd, n - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return bytes(data)
+
+    def _request(self, src_model_data, tgt_model_data, trace_data) -> dict:
+        if self.proc is None or self.proc.poll() is not None:
+            if self.proc is not None:
+                self._stop(kill=True)
+            self.start()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        for data in (src_model_data, tgt_model_data, trace_data):
+            self._send(data)
+        self.proc.stdin.flush()
+        [length] = struct.unpack('<I', self._read_exactly(4, deadline))
+        return json.loads(self._read_exactly(length, deadline))
+
+    def run_full(
+            self,
+            src_model_data: Optional[bytes],
+            tgt_model_data: Optional[bytes],
+            trace_data: Union[bytes, TraceSink]) -> EmulatorResult:
+        with self.lock:
+            # left over from earlier requests
+            self._take_stderr()
+            for attempt in range(2):
+                try:
+                    result = self._request(src_model_data, tgt_model_data, trace_data)
+                    break
+                except (EOFError, BrokenPipeError):
+                    stderr = self._stop(kill=True)
+                except TimeoutError:
+                    stderr = self._stop(kill=True)
+                    raise SimulatorException(
+                        f"pyjs server timed out after {self.timeout}s", stderr)
+            else:
+                raise SimulatorException("pyjs server crashed twice on this trace", stderr)
+            stderr = self._take_stderr()
+
+        extra = dict(res=result['res'], etc=result['etc'], stderr=stderr)
+        if result['status'] == 'Success':
+            return EmulatorResult(energy=int(result['res']['Energy']), extra=extra)
+        elif result['status'] == 'Failure':
+            return EmulatorResult(energy=None, extra=extra)
+        else:
+            raise SimulatorException("simulation returned unknown result", result['output'], stderr)
+
+
+_server = None
+_server_pid = None
+
+def server_run_full(
+        src_model_data: Optional[bytes],
+        tgt_model_data: Optional[bytes],
+        trace_data: Union[bytes, TraceSink]) -> EmulatorResult:
+    '''run_full() through a PyjsServer shared by the process.'''
+    global _server
+    if _server is None or _server_pid != os.getpid():
+        _start_server()
+    return _server.run_full(src_model_data, tgt_model_data, trace_data)
+
+
+def _start_server():
+    global _server, _server_pid
+    # after a fork the pipes of the parent's server must not be shared
+    _server = PyjsServer()
+    _server_pid = os.getpid()
+    atexit.register(_server.close)
+
+
 def read_trace_data(task_number):
     fname = 'LA{0:03d}.nbt'.format(task_number)
     with open(fname, 'rb') as f:
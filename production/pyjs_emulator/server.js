@@ -0,0 +1,84 @@
+// Long-lived checker process, see PyjsServer in run.py.
+//
+// Usage: node server.js full
+// ("full" has to be argv[2], exec-trace-wrapped.js looks at it.)
+//
+// Requests on stdin: src, tgt and trace buffers, each as a uint32 LE
+// length followed by the data; length 0xffffffff stands for None.
+// Responses on stdout: uint32 LE length followed by a JSON object
+// {status: "Success" | "Failure" | "Error", res: {...}, etc: [...]}.
+
+// the simulator must not write to stdout, that's our channel
+console.log = console.error
+
+const simulator = require('./exec-trace-wrapped.js')
+
+const NONE = 0xffffffff
+
+function parseOutput(output) {
+    const lines = output.split('\n')
+    const res = {}
+    const etc = []
+    for (const line of lines) {
+        const i = line.indexOf(': ')
+        if (i >= 0) res[line.slice(0, i)] = line.slice(i + 2).trim()
+        else if (line) etc.push(line)
+    }
+    let status = 'Error'
+    if (lines[0].startsWith('Success')) status = 'Success'
+    else if (lines[0].startsWith('Failure')) status = 'Failure'
+    return {status, res, etc, output}
+}
+
+function respond(obj) {
+    const body = Buffer.from(JSON.stringify(obj), 'utf8')
+    const header = Buffer.alloc(4)
+    header.writeUInt32LE(body.length, 0)
+    process.stdout.write(Buffer.concat([header, body]))
+}
+
+const requests = []
+let busy = false
+
+function runNext() {
+    if (busy || !requests.length) return
+    busy = true
+    const [src, tgt, trace] = requests.shift()
+    let output = ''
+    simulator.execTraceFull(src, tgt, trace, {
+        srcEmpty: !src,
+        tgtEmpty: !tgt,
+        stdout: ih => { output = ih },
+        cb: () => {
+            respond(parseOutput(output))
+            busy = false
+            setImmediate(runNext)
+        },
+    })
+}
+
+let pending = Buffer.alloc(0)
+let frames = []
+
+process.stdin.on('data', chunk => {
+    pending = Buffer.concat([pending, chunk])
+    while (pending.length >= 4) {
+        const len = pending.readUInt32LE(0)
+        if (len == NONE) {
+            frames.push(undefined)
+            pending = pending.subarray(4)
+        } else if (pending.length >= 4 + len) {
+            frames.push(Buffer.from(pending.subarray(4, 4 + len)))
+            pending = pending.subarray(4 + len)
+        } else {
+            break
+        }
+        if (frames.length == 3) {
+            requests.push(frames)
+            frames = []
+        }
+    }
+    runNext()
+})
+
+process.stdin.on('end', () => process.exit(0))
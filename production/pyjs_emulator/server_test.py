@@ -0,0 +1,71 @@
+import pytest
+
+from production import data_files
+from production.pyjs_emulator.run import run_full, PyjsServer, SimulatorException
+from production.trace_sink import TraceSink
+
+
+def test_server_matches_run_full():
+    tgt = data_files.lightning_problem('LA001_tgt.mdl')
+    trace = data_files.lightning_default_trace('LA001.nbt')
+    server = PyjsServer()
+    try:
+        for data in [trace, b'\xff', trace]:
+            expected = run_full(None, tgt, data)
+            result = server.run_full(None, tgt, data)
+            assert result.energy == expected.energy
+            expected.extra['res'].pop('ClockTime', None)
+            result.extra['res'].pop('ClockTime', None)
+            assert result.extra['res'] == expected.extra['res']
+            assert result.extra['etc'] == expected.extra['etc']
+
+        with TraceSink() as sink:
+            sink.write(trace)
+        assert server.run_full(None, tgt, sink).energy == expected.energy
+        sink.cleanup()
+
+        # disassembly, to check that src/tgt emptiness is not carried over
+        assert server.run_full(tgt, None, trace).energy is None
+        assert server.run_full(None, tgt, trace).energy == expected.energy
+    finally:
+        server.close()
+
+
+def test_server_restarts():
+    tgt = data_files.lightning_problem('LA001_tgt.mdl')
+    trace = data_files.lightning_default_trace('LA001.nbt')
+    server = PyjsServer()
+    try:
+        energy = server.run_full(None, tgt, trace).energy
+        assert energy is not None
+        server.proc.kill()
+        server.proc.wait()
+        assert server.run_full(None, tgt, trace).energy == energy
+    finally:
+        server.close()
+
+
+def test_server_timeout():
+    tgt = data_files.lightning_problem('LA001_tgt.mdl')
+    trace = data_files.lightning_default_trace('LA001.nbt')
+    server = PyjsServer(timeout=0.001)
+    try:
+        with pytest.raises(SimulatorException, match='timed out'):
+            server.run_full(None, tgt, trace)
+        assert server.proc is None
+        server.timeout = None
+        assert server.run_full(None, tgt, trace).energy is not None
+    finally:
+        server.close()
+
+
+def test_server_stderr(tmp_path):
+    class Broken(PyjsServer):
+        SCRIPT = str(tmp_path / 'broken.js')
+    with open(Broken.SCRIPT, 'w') as f:
+        f.write("console.error('no simulator here'); process.exit(1)\n")
+    server = Broken()
+    with pytest.raises(SimulatorException) as e:
+        server.run_full(None, None, b'\xff')
+    assert 'crashed twice' in e.value.args[0]
+    assert 'no simulator here' in e.value.args[1]
@@ -1,5 +1,10 @@
-from typing import TypeVar, Generic, List, Callable, Iterable, Set
+from typing import TypeVar, Generic, List, Callable, Iterable, Iterator, Set
 from itertools import chain
+from collections import deque
+
+import numpy as np
+
+from production.basics import Pos
 
 T = TypeVar('T')
 
@@ -22,41 +27,64 @@ def depth_first_search(graph: Iterable[T], valid_neighbors: Callable[[T], Iterab
     return order
 
 def breadth_first_search(roots, valid_neighbors):
-    # a FIFO open_set
-    open_set = []
-    
-    # an empty set to maintain visited nodes
-    closed_set = set()
+    # a FIFO of the nodes to expand
+    open_set = deque()
+
+    # everything that was ever enqueued, so nothing gets there twice
+    seen = set()
 
-    # an empty list to store the order in which nodes are visited
+    # the order in which nodes are visited
     traversal = []
-    
-    # initialize
-    for root in roots:
-        open_set.append(root)
 
-    # For each node on the current level expand and process, if no children 
-    # (leaf) then unwind
-    while len(open_set) > 0:
+    for root in roots:
+        if root not in seen:
+            seen.add(root)
+            open_set.append(root)
 
-        # get first item from queue
-        subtree_root = open_set.pop(0)
-    
-        # For each child of the current tree process
+    while open_set:
+        subtree_root = open_set.popleft()
         for child in valid_neighbors(subtree_root):
-      
-            # The node has already been processed, so skip over it
-            if child in closed_set:
-                continue
-      
-            # The child is not enqueued to be processed, so enqueue this level of
-            # children to be expanded
-            if child not in open_set:
-                open_set.append(child)              # enqueue these nodes
-    
-        # We finished processing the root of this subtree, so add it to the closed 
-        # set
-        closed_set.add(subtree_root)
+            if child not in seen:
+                seen.add(child)
+                open_set.append(child)
         traversal.append(subtree_root)
 
     return traversal
+
+
+def grounded_fill_order(model) -> Iterator[Pos]:
+    '''
+    Full voxels of the model in the order of
+    breadth_first_search(floor_contact(model), filled_neighbors(model)),
+    so each one is grounded when it's filled. Unreachable voxels are left out.
+
+    Works on packed indices in a grid padded with an empty layer on every
+    side, which saves the bounds checks; linear in R^3.
+    '''
+    R = model.R
+    S = R + 2
+    padded = np.zeros((S, S, S), dtype=np.uint8)
+    padded[1:-1, 1:-1, 1:-1] = model.voxels
+    # 1 for full voxels that are not enqueued yet
+    todo = bytearray(padded.tobytes())
+    # neighbours in the order of Pos.enum_adjacent()
+    steps = (-S * S, -S, -1, S * S, S, 1)
+
+    queue = deque()
+    for x in range(R):
+        for z in range(R):
+            idx = (x + 1) * S * S + S + z + 1
+            if todo[idx]:
+                todo[idx] = 0
+                queue.append(idx)
+
+    while queue:
+        idx = queue.popleft()
+        for step in steps:
+            n = idx + step
+            if todo[n]:
+                todo[n] = 0
+                queue.append(n)
+        x, yz = divmod(idx, S * S)
+        y, z = divmod(yz, S)
+        yield Pos(x - 1, y - 1, z - 1)
@@ -0,0 +1,24 @@
+from production.basics import Pos
+from production.model import Model
+from production.model_helpers import floor_contact, filled_neighbors
+from production.search import breadth_first_search, grounded_fill_order
+from production import data_files
+
+
+def test_breadth_first_search():
+    graph = {1: [2, 3], 2: [4, 1], 3: [4], 4: [5], 5: [], 6: [1]}
+    assert breadth_first_search([1], graph.__getitem__) == [1, 2, 3, 4, 5]
+    assert breadth_first_search([3, 1, 3], graph.__getitem__) == [3, 1, 4, 2, 5]
+
+
+def test_grounded_fill_order():
+    m = Model.parse(data_files.lightning_problem('LA004_tgt.mdl'))
+    # a floating voxel and one in the far corner
+    m[Pos(m.R - 1, m.R - 1, m.R - 1)] = True
+    m[Pos(m.R - 1, 0, m.R - 1)] = True
+
+    order = list(grounded_fill_order(m))
+    assert order == breadth_first_search(floor_contact(m), filled_neighbors(m))
+    assert Pos(m.R - 1, 0, m.R - 1) in order
+    assert Pos(m.R - 1, m.R - 1, m.R - 1) not in order
+    assert len(order) == m.num_full - 1
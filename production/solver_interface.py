@@ -4,6 +4,7 @@ from enum import Enum
 
 from production import data_files
 from production.model import Model
+from production.trace_sink import TraceSink
 
 
 class ProblemType(Enum):
@@ -32,7 +33,8 @@ class Fail:
 
 @dataclass
 class SolverResult:
-    trace_data: Union[bytes, Pass, Fail]
+    trace_data: Union[bytes, TraceSink, Pass, Fail]
+    # A TraceSink can be used to stream large traces (see trace_sink.py).
 
     extra: dict = field(default_factory=dict)
     # any additional informaion (stats, errors, comments)
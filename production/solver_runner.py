@@ -15,14 +15,19 @@ logger = logging.getLogger(__name__)
 
 from production import db
 from production import solver_interface
-from production.pyjs_emulator.run import run_full as pyjs_run_full
+from production import validators
 from production.all_solvers import ALL_SOLVERS
+from production.trace_sink import TraceSink
 
 
 def main():
-    if len(sys.argv) < 2 :
+    args = sys.argv[1:]
+    validator = 'pyjs'
+    if args and args[0].startswith('--validator='):
+        validator = args.pop(0).split('=', 1)[1]
+    if not args or validator not in validators.VALIDATORS:
         print('Usage:')
-        print('    python -m production.solver_runner <solver> [<solver args>...]')
+        print('    python -m production.solver_runner [--validator=pyjs|cpp] <solver> [<solver args>...]')
         print(f'where <solver> is one of {ALL_SOLVERS.keys()}')
         sys.exit(1)
 
@@ -33,7 +38,7 @@ def main():
     conn = db.get_conn()
     cur = conn.cursor()
 
-    solver = ALL_SOLVERS[sys.argv[1]](sys.argv[2:])
+    solver = ALL_SOLVERS[args[0]](args[1:])
     logger.info(f'Solver scent: {solver.scent()!r}')
 
     cur.execute('''
@@ -67,9 +72,11 @@ def main():
         elif isinstance(sr.trace_data, solver_interface.Fail):
             logging.warning('Solver failed')
         else:
-            logging.info('Solver produced a trace, checking with pyjs...')
-            er = pyjs_run_full(src_data, tgt_data, sr.trace_data)
+            logging.info(f'Solver produced a trace, checking with {validator}...')
+            er = validators.run_full(validator, src_data, tgt_data, sr.trace_data)
             logging.info(er)
+            if isinstance(sr.trace_data, TraceSink):
+                sr.trace_data.cleanup()
 
     logger.info('All done')
 
@@ -1,4 +1,4 @@
-from typing import Tuple, Optional
+from typing import Iterable, List, Tuple, Optional
 
 from math import floor
 
@@ -7,7 +7,7 @@ logger = logging.getLogger(__name__)
 
 from production.basics import JUMP_LONG, Pos, Diff
 from production.commands import *
-from production.model import Model
+from production.model import Model, array_bounds
 from production.orchestrate import parallel, sequential, wait_for
 
 def bounding_box(model) -> Tuple[Optional[Pos], Optional[Pos]]:
@@ -24,6 +24,9 @@ def bounding_box_region(
         else:
             fv = [fv]
         return fv
+    if isinstance(model, Model):
+        return _bounding_box_region_vectorized(model, fx, fy, fz)
+
     fx = rangify(model.R, fx)
     fy = rangify(model.R, fy)
     fz = rangify(model.R, fz)
@@ -42,6 +45,17 @@ def bounding_box_region(
 
     return (pos0,pos1)
 
+def _bounding_box_region_vectorized(model, fx, fy, fz):
+    def select(fv):
+        return slice(None) if fv is None else slice(fv, fv + 1)
+
+    bounds = array_bounds(model.voxels[select(fx), select(fy), select(fz)])
+    if bounds is None:
+        return (None, None)
+    offset = Diff(fx or 0, fy or 0, fz or 0)
+    lo, hi = bounds
+    return (Pos(*lo) + offset, Pos(*hi) + offset)
+
 def bounding_box_footprint(model):
     pos0, pos1 = bounding_box_region(model)
     pos0 = Pos(pos0.x, 0, pos0.z)
@@ -65,10 +79,14 @@ def is_inside_region(pt : Pos, ref_pt0 : Pos, ref_pt1 : Pos) -> bool:
 
 # Orthographic (orthogonal) projection from the top
 def projection_top(m):
+    if isinstance(m, Model):
+        return m.voxels.any(axis=1).tolist()
     return [ [any([m[Pos(x,y,z)] for y in range(m.R)]) for z in range(m.R)] for x in range(m.R) ]
 
 # Orthographic (orthogonal) projection from front
 def projection_front(m):
+    if isinstance(m, Model):
+        return m.voxels.any(axis=2).tolist()
     return [ [any([m[Pos(x,y,z)] for z in range(m.R)]) for y in range(m.R)] for x in range(m.R) ]
 
 
@@ -112,6 +130,50 @@ def split_linear_move(diff):
         l -= c
         yield SMove(norm * c)
 
+def merge_moves(a: Command, b: Command, lmoves=True) -> Optional[Command]:
+    '''One command that does what a and then b do, without touching any
+    cells they don't, or None.
+
+    Moves along the same axis add up (to a Wait if they cancel out), short
+    moves along different axes make an LMove.
+    '''
+    if not isinstance(a, SMove) or not isinstance(b, SMove):
+        return None
+    if direction(a.lld) in (direction(b.lld), direction(b.lld) * (-1)):
+        d = a.lld + b.lld
+        if d.mlen() == 0:
+            return Wait()
+        if d.mlen() <= 15:
+            return SMove(d)
+        return None
+    if lmoves and a.lld.is_short_linear() and b.lld.is_short_linear():
+        return LMove(a.lld, b.lld)
+    return None
+
+def coalesce_moves(cmds: Iterable[Command]) -> List[Command]:
+    '''Fewer commands for a single bot, see merge_moves().'''
+    res = list(cmds)
+    # long straight moves first, then LMoves from what's left
+    for lmoves in False, True:
+        merged = []
+        for cmd in res:
+            prev = merged[-1] if merged else None
+            m = merge_moves(prev, cmd, lmoves) if prev is not None else None
+            if m is None and isinstance(prev, SMove) and isinstance(cmd, SMove) \
+                    and direction(prev.lld) == direction(cmd.lld):
+                # too long for one move, the first one goes as far as it can
+                norm = direction(cmd.lld)
+                merged[-1] = SMove(norm * 15)
+                cmd = SMove(prev.lld + cmd.lld + norm * (-15))
+            if m is None:
+                merged.append(cmd)
+            elif isinstance(m, Wait):
+                merged.pop()
+            else:
+                merged[-1] = m
+        res = merged
+    return res
+
 ####
 # Fission / fusion
 ####
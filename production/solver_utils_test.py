@@ -150,3 +150,15 @@ def test_projection_front():
         [0, 1, 0],
         [0, 1, 0]
     ]
+
+
+def test_coalesce_moves():
+    x = Diff(1, 0, 0)
+    z = Diff(0, 0, 1)
+    cmds = list(split_linear_move(x * 4)) + [SMove(x * 3)] * 5 + [SMove(z * 2), SMove(z * 3)]
+    assert coalesce_moves(cmds) == [SMove(x * 15), LMove(x * 4, z * 5)]
+
+    assert coalesce_moves([SMove(x * 2), SMove(z * 3), Fill(x), SMove(z * 6)]) == \
+        [LMove(x * 2, z * 3), Fill(x), SMove(z * 6)]
+    assert coalesce_moves([SMove(x * 4), SMove(x * -2), SMove(z), SMove(z * -1)]) == [SMove(x * 2)]
+    assert coalesce_moves([SMove(z), SMove(x * 3), SMove(x * -3), SMove(z)]) == [SMove(z * 2)]
@@ -10,7 +10,7 @@ import random
 import time
 import json
 import zlib
-from typing import Optional, Any, List, Dict
+from typing import Optional, Any, List, Dict, Union
 from dataclasses import dataclass
 import multiprocessing
 import argparse
@@ -23,9 +23,11 @@ logger = logging.getLogger(__name__)
 from production import db
 from production import utils
 from production import solver_interface
-from production.pyjs_emulator.run import run_full as pyjs_run_full, EmulatorResult
+from production import validators
+from production.pyjs_emulator.run import EmulatorResult
 from production.all_solvers import ALL_SOLVERS
 from production.combiner import Combiner
+from production.trace_sink import TraceSink
 
 Json = dict
 
@@ -36,14 +38,20 @@ class Result:
     status: str  # see db.py for explanation
     scent: str
     energy: Optional[int]
-    trace: Optional[bytes]
+    trace: Union[bytes, TraceSink, None]  # sinks are already compressed
     extra: Json
 
+    def discard_trace(self):
+        if isinstance(self.trace, TraceSink):
+            self.trace.cleanup()
+
 
 def put_trace(conn, problem_id: int, result: Result):
     assert result.status in ('DONE', 'PASS', 'FAIL', 'CHECK_FAIL'), result.status
 
-    if result.trace is not None:
+    if isinstance(result.trace, TraceSink):
+        trace_data = result.trace.compressed()
+    elif result.trace is not None:
         trace_data = zlib.compress(result.trace)
     else:
         trace_data = None
@@ -66,7 +74,9 @@ def put_trace(conn, problem_id: int, result: Result):
 def solve(
         solver: solver_interface.Solver, name: str,
         src_data: Optional[bytes], tgt_data: Optional[bytes],
-        pyjs_validate: bool = False) -> Result:
+        pyjs_validate: bool = False,
+        validator: str = 'pyjs',
+        cross_check: float = 0.0) -> Result:
 
     # check again to simplify things for users
     if not solver.supports(solver_interface.ProblemType.from_name(name)):
@@ -96,7 +106,7 @@ def solve(
         return Result(
             scent=solver.scent(), status='FAIL', energy=None, trace=None,
             extra=dict(solver=sr.extra, solver_time=solver_time))
-    elif isinstance(sr.trace_data, (bytes, bytearray)):
+    elif isinstance(sr.trace_data, (bytes, bytearray, TraceSink)):
         if isinstance(solver, Combiner):
             # With the combiner we already know that the solution is correct
             # and what it's energy is supposed to be.
@@ -106,32 +116,34 @@ def solve(
             # assert er.energy == sr.extra['expected_energy'], (
             #     er.energy, sr.extra['expected_energy'])
 
-            logging.info('Skip pyjs check for Combiner')
-            pyjs_time = 0
+            logging.info(f'Skip {validator} check for Combiner')
+            check_time = 0
             er = EmulatorResult(energy=sr.extra['expected_energy'], extra={})
         else:
-            logging.info('Checking with pyjs...')
+            # sinks are checked straight from their file
+            logging.info(f'Checking with {validator}...')
             start = time.time()
-            er = pyjs_run_full(src_data, tgt_data, sr.trace_data)
-            pyjs_time = time.time() - start
-            logging.info(f'It took {pyjs_time}')
-
+            er = validators.run_full(
+                validator, src_data, tgt_data, sr.trace_data, cross_check=cross_check)
+            check_time = time.time() - start
+            logging.info(f'It took {check_time}')
+
+        # extra['pyjs'], extra['pyjs_time'] or the same for cpp
+        extra = {
+            'solver': sr.extra, validator: er.extra,
+            'solver_time': solver_time, f'{validator}_time': check_time}
         if er.energy is None:
             logging.info(f'Check failed: {er.extra}')
             return Result(
                 scent=solver.scent(), status='CHECK_FAIL', energy=None, trace=sr.trace_data,
-                extra=dict(
-                    solver=sr.extra, pyjs=er.extra,
-                    solver_time=solver_time, pyjs_time=pyjs_time))
+                extra=extra)
         else:
             logging.info(f'Solution verified, energy={er.energy}')
             return Result(
                 scent=solver.scent(), status='DONE', energy=er.energy, trace=sr.trace_data,
-                extra=dict(
-                    solver=sr.extra, pyjs=er.extra,
-                    solver_time=solver_time, pyjs_time=pyjs_time))
+                extra=extra)
     else:
-        assert False, sr.energy
+        assert False, sr.trace_data
 
 
 @dataclass
@@ -154,7 +166,9 @@ def work(
         index,
         log_path,
         input_queue: multiprocessing.queues.SimpleQueue,
-        output_queue: multiprocessing.queues.SimpleQueue):
+        output_queue: multiprocessing.queues.SimpleQueue,
+        validator: str = 'pyjs',
+        cross_check: float = 0.0):
     logging.basicConfig(
         filename=log_path,
         filemode='w',
@@ -168,7 +182,8 @@ def work(
         logging.info(f'Solving problem/{input_entry.problem_id}...')
         result = solve(
             input_entry.solver, input_entry.problem_name,
-            input_entry.src_data, input_entry.tgt_data)
+            input_entry.src_data, input_entry.tgt_data,
+            validator=validator, cross_check=cross_check)
         logging.info(f'Done, energy={result.energy}')
         output_entry = OutputEntry(
             worker_index=index,
@@ -187,6 +202,10 @@ def parse_args():
             type=int, default=999)
     parser.add_argument('-n', '--dry-run', help='Do not submit solutions to the database',
             action='store_true')
+    parser.add_argument('--validator', help='emulator to check traces with (default: pyjs)',
+            choices=validators.VALIDATORS.keys(), default='pyjs')
+    parser.add_argument('--cross-check', metavar='P', help='fraction of traces to also check with the other emulator',
+            type=float, default=0.0)
     # positional
     parser.add_argument('solver', help='solver to use', choices=ALL_SOLVERS.keys())
     parser.add_argument('solver_args', metavar='ARG', help='argument for the solver', nargs='*')
@@ -235,7 +254,9 @@ def main():
     for i, iq in enumerate(input_queues):
         log_path = utils.project_root() / 'outputs' / f'solver_worker_{i:02}.log'
         logging.info(f'Worker logging to {log_path}')
-        w = multiprocessing.Process(target=work, args=(i, log_path, iq, output_queue))
+        w = multiprocessing.Process(
+            target=work,
+            args=(i, log_path, iq, output_queue, args.validator, args.cross_check))
         w.start()
     available_workers = set(range(num_workers))
 
@@ -282,6 +303,7 @@ def main():
             else:
                 put_trace(conn, output_entry.problem_id, output_entry.result)
                 conn.commit()
+            output_entry.result.discard_trace()
 
     logging.info('All done, joining workers...')
     for iq in input_queues:
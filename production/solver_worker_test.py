@@ -17,6 +17,16 @@ def test_successful_solve():
         assert r.extra['pyjs']['res']['Energy'] == str(energy)
 
 
+def test_cpp_validator():
+    from production.pillar_solver import PillarSolver
+    name = 'FA011'
+    src_model, tgt_model = data_files.full_problem(name)
+    r = solve(PillarSolver([]), name, src_model, tgt_model, validator='cpp', cross_check=1.0)
+    assert r.status == 'DONE'
+    assert r.energy == 98796608
+    assert 'cross_check' not in r.extra['cpp']
+
+
 def test_errors():
     name = f'FR011'
     src_model, tgt_model = data_files.full_problem(name)
@@ -36,34 +36,28 @@ class SwarmSolver(Solver):
 
         R = src_model.R
 
-        cur_model = Matrix(src_model)
+        # knows what still differs and what is safe to change,
+        # so neither the loop condition nor the search rescan the matrix
+        work = cpp.WorkIndex(src_model, tgt_model)
+        cur_model = work.matrix
 
         trace = []
         bot_pos = Pos(0, 0, 0)
         logger.info(f'R = {R}')
 
-        while cur_model != tgt_model:
-            changed = False
-            for nd in cpp.enum_near_diffs():
+        while not work.done():
+            nd = work.work_near(bot_pos)
+            if nd is not None:
                 p = bot_pos + nd
-                if not p.is_inside(R):
-                    continue
-                if cur_model[p] == tgt_model[p]:
-                    continue
-                if not cpp.safe_to_change(cur_model, p):
-                    continue
                 if cur_model[p]:
                     trace.append(cpp.Void(nd))
-                    cur_model[p] = False
+                    work[p] = False
                 else:
                     trace.append(cpp.Fill(nd))
-                    cur_model[p] = True
-                changed = True
-                break
-            if changed:
+                    work[p] = True
                 continue
 
-            p = cpp.path_to_nearest_safe_change_point(cur_model, bot_pos, cur_model, tgt_model)
+            p = cpp.path_to_nearest_work(work, bot_pos)
             if p is None:
                 return SolverResult(Pass(), extra=dict(msg='no reachable targets'))
 
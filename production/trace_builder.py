@@ -0,0 +1,173 @@
+'''Multi-bot traces from per-bot command queues.
+
+Every bot gets its own list of commands. The builder keeps track of where
+each bot will be and what seeds it will have once its queue is done, and
+of the steps during which it exists (from the Fission that makes it to the
+FusionS that ends it). The trace comes out as time steps in bid order, with
+Waits for bots that have nothing left to do.
+
+With check=True the volatile cells of every step are checked as the trace
+is produced, so interfering bots show up right away and not when the trace
+gets to the checker.
+'''
+
+import bisect
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from production.basics import Pos, Diff, Region
+from production.commands import *
+from production.emulator import PreconditionError
+
+
+@dataclass
+class BotPlan:
+    bid: int
+    start: Pos
+    birth: int  # first step it acts in
+    pos: Pos    # after all queued commands
+    seeds: List[int]
+    commands: List[Command] = field(default_factory=list)
+    death: Optional[int] = None  # the step of its FusionS
+
+    @property
+    def time(self) -> int:
+        '''The step its next command will be in.'''
+        return self.birth + len(self.commands)
+
+
+class TraceBuilder:
+    def __init__(self, R: int, seeds: Iterable[int] = range(2, 41), check=False):
+        self.R = R
+        self.check = check
+        self.bots: Dict[int, BotPlan] = {}
+        self.bots[1] = BotPlan(1, Pos(0, 0, 0), 0, Pos(0, 0, 0), list(seeds))
+
+    def __getitem__(self, bid: int) -> BotPlan:
+        return self.bots[bid]
+
+    def pos(self, bid: int) -> Pos:
+        return self.bots[bid].pos
+
+    def alive(self) -> List[int]:
+        '''Bids of the bots that exist once all the queues are done.'''
+        return sorted(bid for bid, bot in self.bots.items() if bot.death is None)
+
+    def add(self, bid: int, *cmds: Command):
+        self.extend(bid, cmds)
+
+    def extend(self, bid: int, cmds: Iterable[Command]):
+        bot = self.bots[bid]
+        assert bot.death is None, f'bot {bid} is gone'
+        for cmd in cmds:
+            if isinstance(cmd, SMove):
+                bot.pos += cmd.lld
+            elif isinstance(cmd, LMove):
+                bot.pos += cmd.sld1 + cmd.sld2
+            elif isinstance(cmd, Fission):
+                assert len(bot.seeds) > cmd.m, (bot.seeds, cmd)
+                child = bot.seeds[0]
+                self.bots[child] = BotPlan(
+                    child, bot.pos + cmd.nd, bot.time + 1, bot.pos + cmd.nd,
+                    bot.seeds[1 : cmd.m + 1])
+                bot.seeds = bot.seeds[cmd.m + 1:]
+            else:
+                assert not isinstance(cmd, (FusionP, FusionS)), 'use fuse()'
+            bot.commands.append(cmd)
+
+    def wait(self, bid: int, n: int = 1):
+        self.bots[bid].commands.extend([Wait()] * n)
+
+    def fission(self, bid: int, nd: Diff, m: int) -> int:
+        '''Queue a Fission, returns the bid of the new bot.'''
+        child = self.bots[bid].seeds[0]
+        self.add(bid, Fission(nd, m))
+        return child
+
+    def sync(self, *bids: int):
+        '''Make the bots (all living ones by default) wait for each other.'''
+        bots = [self.bots[bid] for bid in bids or self.alive()]
+        t = max(bot.time for bot in bots)
+        for bot in bots:
+            assert bot.death is None, f'bot {bot.bid} is gone'
+            self.wait(bot.bid, t - bot.time)
+
+    def fuse(self, primary: int, secondary: int):
+        p = self.bots[primary]
+        s = self.bots[secondary]
+        self.sync(primary, secondary)
+        nd = s.pos - p.pos
+        assert nd.is_near(), (p.pos, s.pos)
+        s.death = s.time
+        p.commands.append(FusionP(nd))
+        s.commands.append(FusionS(nd * (-1)))
+        p.seeds = sorted(p.seeds + [secondary] + s.seeds)
+        s.seeds = []
+
+    def steps(self) -> Iterator[List[Command]]:
+        births: Dict[int, List[BotPlan]] = {}
+        for bot in self.bots.values():
+            births.setdefault(bot.birth, []).append(bot)
+        end = max(bot.time for bot in self.bots.values())
+
+        active: List[int] = []
+        positions: Dict[int, Pos] = {}
+        for t in range(end):
+            for bot in births.get(t, []):
+                bisect.insort(active, bot.bid)
+                positions[bot.bid] = bot.start
+            step = []
+            for bid in active:
+                bot = self.bots[bid]
+                i = t - bot.birth
+                step.append(bot.commands[i] if i < len(bot.commands) else Wait())
+            if self.check:
+                self._check_step(t, active, positions, step)
+            yield step
+            active = [bid for bid in active if self.bots[bid].death != t]
+
+    def __iter__(self) -> Iterator[Command]:
+        for step in self.steps():
+            yield from step
+
+    def compose(self) -> bytearray:
+        res = bytearray()
+        for step in self.steps():
+            for cmd in step:
+                res += cmd.encoded()
+        return res
+
+    def _check_step(self, t: int, active: List[int], positions: Dict[int, Pos], step: List[Command]):
+        owner: Dict[Pos, object] = {}
+
+        def claim(cells, who):
+            for p in cells:
+                if not p.is_inside_matrix(self.R):
+                    raise PreconditionError(f'step {t}: {who} goes outside at {p}')
+                other = owner.setdefault(p, who)
+                if other != who:
+                    raise PreconditionError(f'step {t}: {other} and {who} interfere at {p}')
+
+        regions = set()
+        for bid, cmd in zip(active, step):
+            c = positions[bid]
+            if isinstance(cmd, (GFill, GVoid)):
+                # the whole group shares one region
+                claim([c], f'bot {bid}')
+                region = Region(c + cmd.nd, c + cmd.nd + cmd.fd)
+                key = (region.pos_min, region.pos_max)
+                if key not in regions:
+                    regions.add(key)
+                    claim(region, f'region {key}')
+            elif isinstance(cmd, (FusionP, FusionS)):
+                # the pair shares both cells
+                claim([c], f'bot {bid}')
+            else:
+                claim(cmd.volatile(c), f'bot {bid}')
+
+            if isinstance(cmd, SMove):
+                positions[bid] = c + cmd.lld
+            elif isinstance(cmd, LMove):
+                positions[bid] = c + cmd.sld1 + cmd.sld2
+            elif isinstance(cmd, Halt) and len(active) > 1:
+                raise PreconditionError(f'step {t}: Halt with bots {active}')
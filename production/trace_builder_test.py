@@ -0,0 +1,75 @@
+import pytest
+
+from production.basics import Pos, Diff
+from production.commands import *
+from production.emulator import PreconditionError
+from production.model import Model
+from production.trace_builder import TraceBuilder
+from production.cpp_emulator.run import run_full
+
+
+def test_fission_fusion_bookkeeping():
+    tb = TraceBuilder(5)
+    child = tb.fission(1, Diff(1, 0, 0), 3)
+    assert child == 2
+    assert tb[2].seeds == [3, 4, 5]
+    assert tb[1].seeds == list(range(6, 41))
+    assert tb.pos(2) == Pos(1, 0, 0)
+
+    # queued before bot 2 exists, so it starts right after its birth
+    tb.add(2, SMove(Diff(0, 1, 0)), Fill(Diff(0, -1, 0)), SMove(Diff(0, 0, 1)))
+    tb.add(1, Fill(Diff(0, 0, 1)))
+    assert tb.alive() == [1, 2]
+
+    tb.add(2, SMove(Diff(0, 0, -1)))
+    tb.add(1, SMove(Diff(0, 1, 0)))
+    tb.fuse(1, 2)
+    assert tb.alive() == [1]
+    assert tb[1].seeds == list(range(2, 41))
+    tb.add(1, SMove(Diff(0, -1, 0)), Halt())
+
+    steps = list(tb.steps())
+    assert steps == [
+        [Fission(Diff(1, 0, 0), 3)],
+        [Fill(Diff(0, 0, 1)), SMove(Diff(0, 1, 0))],
+        [SMove(Diff(0, 1, 0)), Fill(Diff(0, -1, 0))],
+        [Wait(), SMove(Diff(0, 0, 1))],
+        [Wait(), SMove(Diff(0, 0, -1))],
+        [FusionP(Diff(1, 0, 0)), FusionS(Diff(-1, 0, 0))],
+        [SMove(Diff(0, -1, 0))],
+        [Halt()],
+    ]
+
+    tgt = Model(5)
+    tgt[Pos(0, 0, 1)] = True
+    tgt[Pos(1, 0, 0)] = True
+    trace = tb.compose()
+    assert trace == compose_commands(tb)
+    assert run_full(None, tgt.compose(), bytes(trace)).energy is not None
+
+
+def test_collision_check():
+    tb = TraceBuilder(5, check=True)
+    tb.fission(1, Diff(0, 0, 1), 0)
+    tb.add(1, SMove(Diff(2, 0, 0)))
+    tb.add(2, SMove(Diff(1, 0, 0)), SMove(Diff(0, 0, -1)))
+    tb.sync()
+    assert len(list(tb.steps())) == 3
+
+    # now bot 1 is where bot 2 wants to go
+    tb.add(2, SMove(Diff(1, 0, 0)))
+    with pytest.raises(PreconditionError):
+        list(tb.steps())
+
+    tb = TraceBuilder(5, check=True)
+    tb.add(1, SMove(Diff(-1, 0, 0)))
+    with pytest.raises(PreconditionError):
+        list(tb.steps())
+
+    # group members share their region
+    tb = TraceBuilder(5, check=True)
+    tb.fission(1, Diff(2, 0, 0), 0)
+    tb.sync()
+    tb.add(1, GFill(Diff(0, 1, 0), Diff(2, 0, 0)))
+    tb.add(2, GFill(Diff(0, 1, 0), Diff(-2, 0, 0)))
+    assert len(list(tb.steps())) == 2
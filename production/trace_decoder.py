@@ -0,0 +1,226 @@
+'''Fast columnar decoding of traces.
+
+decode_trace() turns trace bytes into a DecodedTrace: numpy arrays with
+one entry per command (opcode, byte offset, operands) plus the command
+ranges of time steps. No command objects are created unless asked for
+through indexing or iteration, and equal commands share one object.
+
+Errors are the same ValueErrors parse_commands() would raise.
+'''
+
+import bisect
+from typing import Iterator, List
+
+import numpy as np
+
+from production import commands
+from production.commands import ParserState, parse_command
+
+
+# Opcodes, in the order of OP_CLASSES.
+HALT, WAIT, FLIP, SMOVE, LMOVE, FISSION, FILL, VOID, FUSIONP, FUSIONS, GFILL, GVOID = range(12)
+OP_CLASSES = (
+    commands.Halt, commands.Wait, commands.Flip, commands.SMove, commands.LMove,
+    commands.Fission, commands.Fill, commands.Void, commands.FusionP, commands.FusionS,
+    commands.GFill, commands.GVoid)
+
+NO_OP = 255
+
+
+def _build_tables():
+    # first byte -> opcode, with the same precedence as parse_command()
+    op_by_byte = np.full(256, NO_OP, dtype=np.uint8)
+    size_by_byte = np.ones(256, dtype=np.int64)
+    for b in range(256):
+        cls = (commands.commands_by_id.get(b)
+               or commands.commands_by_id.get(b & 0b1111)
+               or commands.commands_by_id.get(b & 0b111))
+        if cls is not None:
+            op_by_byte[b] = OP_CLASSES.index(cls)
+            size_by_byte[b] = cls.bsize
+    return op_by_byte, size_by_byte
+
+
+def _diff_table(table, size):
+    diffs = np.zeros((size, 3), dtype=np.int8)
+    valid = np.zeros(size, dtype=bool)
+    for code, d in table.items():
+        diffs[code] = d.dx, d.dy, d.dz
+        valid[code] = True
+    return diffs, valid
+
+
+OP_BY_BYTE, SIZE_BY_BYTE = _build_tables()
+ND_DIFFS, ND_VALID = _diff_table(commands.nd_table, 32)
+LLD_DIFFS, LLD_VALID = _diff_table(commands.lld_table, 128)
+SLD_DIFFS, SLD_VALID = _diff_table(commands.sld_table, 64)
+
+# change in the number of bots caused by a command
+BOT_DELTA = np.zeros(len(OP_CLASSES), dtype=np.int64)
+BOT_DELTA[FISSION] = 1
+BOT_DELTA[FUSIONS] = -1
+
+
+class DecodedTrace:
+    '''Columnar form of a trace.
+
+    ops[i], offsets[i] - opcode and byte offset of the i-th command
+    a[i], b[i]         - (dx, dy, dz) operands: nd, lld or sld1 go to a,
+                         sld2 or fd to b; zeros when not applicable
+    m[i]               - Fission seed count
+    step_starts        - index of the first command of every time step,
+                         followed by len(ops); the last step may be
+                         incomplete, see `complete`
+    '''
+
+    def __init__(self, buf, ops, offsets, a, b, m, source):
+        self.buf = buf
+        self.ops = ops
+        self.offsets = offsets
+        self.a = a
+        self.b = b
+        self.m = m
+        self.source = source
+        self._cache = {}
+        self._find_steps()
+
+    def _find_steps(self):
+        n = len(self.ops)
+        delta = [0] + np.cumsum(BOT_DELTA[self.ops]).tolist()
+        # with a single bot every command is a step until the next of these
+        events = np.flatnonzero((self.ops == FISSION) | (self.ops == HALT)).tolist()
+        halts = np.flatnonzero(self.ops == HALT)
+        first_halt = int(halts[0]) if len(halts) else n
+        starts = [0]
+        i = 0
+        bots = 1
+        while i < n and bots > 0:
+            if bots == 1:
+                k = bisect.bisect_left(events, i)
+                e = events[k] if k < len(events) else n
+                if e > i:
+                    starts.extend(range(i + 1, e + 1))
+                    i = e
+                    continue
+            j = min(i + bots, n)
+            if i <= first_halt < j:
+                bots = 0
+            else:
+                bots += delta[j] - delta[i]
+            i = j
+            starts.append(i)
+        if starts[-1] != n:
+            starts.append(n)  # commands after Halt
+        self.step_starts = np.array(starts, dtype=np.int64)
+        self.complete = bots == 0 and i == n
+
+    def __len__(self):
+        return len(self.ops)
+
+    @property
+    def num_steps(self) -> int:
+        return len(self.step_starts) - 1
+
+    def __getitem__(self, i: int) -> commands.Command:
+        start = int(self.offsets[i])
+        raw = bytes(self.buf[start : start + OP_CLASSES[self.ops[i]].bsize])
+        cmd = self._cache.get(raw)
+        if cmd is None:
+            cmd = parse_command(ParserState(raw, self.source))
+            self._cache[raw] = cmd
+        return cmd
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def step(self, k: int) -> List[commands.Command]:
+        return [self[i] for i in range(self.step_starts[k], self.step_starts[k + 1])]
+
+    def steps(self) -> Iterator[List[commands.Command]]:
+        for k in range(self.num_steps):
+            yield self.step(k)
+
+    def count(self, cls) -> int:
+        return int(np.count_nonzero(self.ops == OP_CLASSES.index(cls)))
+
+
+def _fail_at(buf, offset: int, source: str):
+    '''Let the reference parser produce the error message.'''
+    input = ParserState(bytes(buf), source, offset)
+    parse_command(input)
+    assert False, 'parse_command was expected to fail'
+
+
+def decode_trace(buf, source: str = '') -> DecodedTrace:
+    '''Decode bytes (or anything supporting the buffer protocol).
+
+    source is used for error reporting.
+    '''
+    data = np.frombuffer(buf, dtype=np.uint8)
+    n = len(data)
+
+    # Command starts are the positions reachable from 0 by jumping over
+    # commands. Find them by pointer doubling: after k rounds `offsets`
+    # holds those less than 2^k commands away and jump[p] is 2^k commands
+    # further than p (clamped to n).
+    index_type = np.int32 if n < 2**31 - 4 else np.int64
+    jump = np.arange(n + 1, dtype=index_type)
+    jump[:n] += SIZE_BY_BYTE[data].astype(index_type)
+    np.minimum(jump, n, out=jump)
+    offsets = np.zeros(min(n, 1), dtype=index_type)
+    while True:
+        further = jump[offsets]
+        further = further[further < n]
+        if not len(further):
+            break
+        offsets = np.concatenate([offsets, further])
+        jump = jump[jump]
+    offsets.sort()
+    offsets = offsets.astype(np.int64)
+    truncated = n > 0 and offsets[-1] + SIZE_BY_BYTE[data[offsets[-1]]] > n
+
+    b0 = data[offsets]
+    ops = OP_BY_BYTE[b0]
+
+    padded = np.concatenate([data, np.zeros(3, dtype=np.uint8)])
+    b1 = padded[offsets + 1].astype(np.int64)
+    b2 = padded[offsets + 2].astype(np.int64)
+    b3 = padded[offsets + 3].astype(np.int64)
+    b0 = b0.astype(np.int64)
+
+    a = np.zeros((len(ops), 3), dtype=np.int16)
+    b = np.zeros((len(ops), 3), dtype=np.int16)
+    m = np.zeros(len(ops), dtype=np.uint8)
+    bad = ops == NO_OP
+    if truncated:
+        bad[-1] = True
+
+    nd_ops = np.isin(ops, [FISSION, FILL, VOID, FUSIONP, FUSIONS, GFILL, GVOID])
+    nd = b0[nd_ops] >> 3
+    a[nd_ops] = ND_DIFFS[nd]
+    bad[nd_ops] |= ~ND_VALID[nd]
+
+    sel = ops == SMOVE
+    lld = ((b0[sel] & 0b0011_0000) << 1) + (b1[sel] & 0b11111)
+    a[sel] = LLD_DIFFS[lld]
+    bad[sel] |= ~LLD_VALID[lld]
+
+    sel = ops == LMOVE
+    sld1 = (b0[sel] & 0b0011_0000) + (b1[sel] & 0b1111)
+    sld2 = ((b0[sel] & 0b1100_0000) >> 2) + ((b1[sel] >> 4) & 0b1111)
+    a[sel] = SLD_DIFFS[sld1]
+    b[sel] = SLD_DIFFS[sld2]
+    bad[sel] |= ~SLD_VALID[sld1] | ~SLD_VALID[sld2]
+
+    sel = ops == FISSION
+    m[sel] = b1[sel]
+
+    sel = (ops == GFILL) | (ops == GVOID)
+    b[sel] = np.stack([b1[sel], b2[sel], b3[sel]], axis=1) - 30
+
+    if bad.any():
+        # report the first problem, as parse_commands() would
+        _fail_at(buf, int(offsets[np.argmax(bad)]), source)
+
+    return DecodedTrace(buf, ops, offsets, a, b, m, source)
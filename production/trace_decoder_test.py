@@ -0,0 +1,94 @@
+import pytest
+import numpy as np
+
+from production import commands, data_files
+from production.commands import parse_commands, compose_commands, Diff, \
+    Halt, Wait, Flip, SMove, LMove, FusionP, FusionS, Fission, Fill, GFill
+from production.trace_decoder import decode_trace, OP_CLASSES
+
+
+def all_commands():
+    far_distances = (Diff(10, 20, 30), Diff(-30, -20, -10))
+    cmds = [Halt(), Wait(), Flip()]
+    cmds.extend(SMove(v) for v in commands.lld_table.values())
+    cmds.extend(LMove(v1, v2) for v1 in commands.sld_table.values() for v2 in commands.sld_table.values())
+    for n in commands.nd_table.values():
+        cmds.extend([FusionP(n), FusionS(n), Fill(n), commands.Void(n)])
+        cmds.extend(Fission(n, m) for m in range(0, 256, 7))
+        cmds.extend(cls(n, d) for cls in [GFill, commands.GVoid] for d in far_distances)
+    return cmds
+
+
+def check_same_as_parser(data):
+    expected = parse_commands(data, 'test')
+    decoded = decode_trace(data, 'test')
+    assert len(decoded) == len(expected)
+    assert list(decoded) == expected
+    for i, cmd in enumerate(expected):
+        assert OP_CLASSES[decoded.ops[i]] is type(cmd)
+    return decoded
+
+
+def test_all_commands_roundtrip():
+    cmds = all_commands()
+    decoded = check_same_as_parser(bytes(compose_commands(cmds)))
+    assert compose_commands(decoded) == compose_commands(cmds)
+
+    lmoves = [i for i, c in enumerate(cmds) if isinstance(c, LMove)]
+    for i in lmoves[:50]:
+        c = cmds[i]
+        assert tuple(decoded.a[i]) == (c.sld1.dx, c.sld1.dy, c.sld1.dz)
+        assert tuple(decoded.b[i]) == (c.sld2.dx, c.sld2.dy, c.sld2.dz)
+    gfills = [i for i, c in enumerate(cmds) if isinstance(c, GFill)]
+    assert tuple(decoded.b[gfills[0]]) == (10, 20, 30)
+
+
+def test_default_traces():
+    for name in data_files.lightning_default_trace_names()[:5]:
+        data = data_files.lightning_default_trace(name)
+        decoded = check_same_as_parser(data)
+        assert decoded.complete
+        assert decoded.count(Halt) == 1
+        # materialized commands are shared
+        assert len(decoded._cache) < len(decoded)
+
+
+def test_steps():
+    trace = [
+        Fission(Diff(1, 0, 0), 5),
+        Wait(), Fission(Diff(0, 1, 0), 1),
+        Wait(), Flip(), Wait(),
+        FusionP(Diff(0, 1, 0)), Wait(), FusionS(Diff(0, -1, 0)),
+        FusionP(Diff(1, 0, 0)), FusionS(Diff(-1, 0, 0)),
+        Halt(),
+    ]
+    decoded = decode_trace(bytes(compose_commands(trace)))
+    assert decoded.step_starts.tolist() == [0, 1, 3, 6, 9, 11, 12]
+    assert decoded.num_steps == 6
+    assert decoded.complete
+    assert decoded.step(1) == [Wait(), Fission(Diff(0, 1, 0), 1)]
+    assert sum(decoded.steps(), []) == trace
+
+    partial = decode_trace(bytes(compose_commands(trace[:4])))
+    assert partial.step_starts.tolist() == [0, 1, 3, 4]
+    assert not partial.complete
+
+
+@pytest.mark.parametrize('data', [
+    bytes([0b00010100]),
+    bytes([0b11111110, 0b11111100, 0b11111100]),
+    bytes([0b11111110, 0b11110110, 0b00010100]),
+])
+def test_errors(data):
+    with pytest.raises(ValueError) as expected:
+        parse_commands(data, 'testsource')
+    with pytest.raises(ValueError) as actual:
+        decode_trace(data, 'testsource')
+    assert str(actual.value) == str(expected.value)
+
+
+def test_empty():
+    decoded = decode_trace(b'')
+    assert len(decoded) == 0
+    assert decoded.num_steps == 0
+    assert not decoded.complete
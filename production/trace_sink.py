@@ -0,0 +1,122 @@
+'''Streaming trace output.
+
+A solver can feed commands (or already composed bytes) into a TraceSink
+as it produces them instead of collecting the whole trace first. The
+sink encodes them into a temporary .nbt file and, if asked, compresses
+them on the fly, so the zlib blob for the DB is ready when the solver
+is done and the file can go to the checker as is.
+'''
+
+import os
+import zlib
+import tempfile
+from typing import Iterable, Iterator, Union
+
+from production.commands import Command
+
+
+class TraceSink:
+    def __init__(self, compress=True, buffer_size=1 << 16):
+        f = tempfile.NamedTemporaryFile(delete=False, suffix='.nbt')
+        self.path = f.name
+        self._file = f
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        self.compress = compress
+        self._compressor = zlib.compressobj() if compress else None
+        self._compressed = []
+        self.size = 0
+        self.closed = False
+
+    def add(self, cmd: Command):
+        self._buffer += cmd.encoded()
+        if len(self._buffer) >= self._buffer_size:
+            self._flush()
+
+    def write(self, data: Union[bytes, bytearray]):
+        '''Append already composed commands.'''
+        self._buffer += data
+        if len(self._buffer) >= self._buffer_size:
+            self._flush()
+
+    def extend(self, commands: Iterable[Command]):
+        buffer = self._buffer
+        for cmd in commands:
+            buffer += cmd.encoded()
+            if len(buffer) >= self._buffer_size:
+                self._flush()
+
+    def _flush(self):
+        assert not self.closed
+        if not self._buffer:
+            return
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        self._file.write(chunk)
+        if self._compressor is not None:
+            self._compressed.append(self._compressor.compress(chunk))
+        self.size += len(chunk)
+
+    def close(self) -> 'TraceSink':
+        if not self.closed:
+            self._flush()
+            self._file.close()
+            self._file = None
+            if self._compressor is not None:
+                self._compressed.append(self._compressor.flush())
+                self._compressed = [b''.join(self._compressed)]
+                self._compressor = None
+            self.closed = True
+        return self
+
+    def compressed(self) -> bytes:
+        '''zlib.compress() of the trace, like put_trace() stores it.'''
+        self.close()
+        if not self.compress:
+            return zlib.compress(self.getvalue())
+        return self._compressed[0]
+
+    def iter_chunks(self, chunk_size=1 << 20) -> Iterator[bytes]:
+        self.close()
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def getvalue(self) -> bytes:
+        '''The whole trace. Defeats the purpose, use for small traces and tests.'''
+        self.close()
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def cleanup(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __len__(self):
+        return self.size + len(self._buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        # a half-written trace is of no use to anybody
+        if exc_type is None:
+            self.close()
+        else:
+            self.cleanup()
+
+    # Sinks travel between solver_worker processes; pickling closes
+    # them, the receiving side gets the file path and the compressed data.
+    def __getstate__(self):
+        self.close()
+        return self.__dict__
+
+
+def trace_bytes(trace_data: Union[bytes, bytearray, TraceSink]) -> bytes:
+    if isinstance(trace_data, TraceSink):
+        return trace_data.getvalue()
+    return trace_data
@@ -0,0 +1,47 @@
+import os
+import pickle
+import zlib
+
+from production.basics import Diff
+from production.commands import *
+from production.trace_sink import TraceSink
+
+
+def test_trace_sink():
+    cmds = [Flip(), SMove(Diff(0, 5, 0)), Fill(Diff(1, 0, 0)), Fission(Diff(0, 0, 1), 3), Halt()]
+    expected = bytes(compose_commands(cmds * 1000))
+
+    with TraceSink(buffer_size=100) as sink:
+        sink.extend(cmds * 500)
+        sink.write(compose_commands(cmds * 250))
+        for cmd in cmds * 250:
+            sink.add(cmd)
+    assert sink.closed
+    assert len(sink) == len(expected)
+    assert sink.getvalue() == expected
+    assert b''.join(sink.iter_chunks(chunk_size=77)) == expected
+    assert zlib.decompress(sink.compressed()) == expected
+
+    sink2 = pickle.loads(pickle.dumps(sink))
+    assert zlib.decompress(sink2.compressed()) == expected
+    assert sink2.getvalue() == expected
+
+    sink.cleanup()
+    assert not os.path.exists(sink.path)
+
+
+def test_trace_sink_uncompressed():
+    with TraceSink(compress=False) as sink:
+        sink.add(Halt())
+    assert zlib.decompress(sink.compressed()) == bytes(compose_commands([Halt()]))
+    sink.cleanup()
+
+
+def test_trace_sink_failure():
+    try:
+        with TraceSink() as sink:
+            sink.add(Flip())
+            raise ZeroDivisionError()
+    except ZeroDivisionError:
+        pass
+    assert not os.path.exists(sink.path)
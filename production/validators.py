@@ -0,0 +1,54 @@
+'''Running traces through one of the emulators to check them.
+
+'pyjs' is the reference implementation (the official checker, run by a
+persistent node process per worker), 'cpp' runs in-process and is much
+cheaper. With cross_check > 0 that fraction of traces also goes through
+the other one, and any disagreement is logged and recorded in the result.
+'''
+
+import random
+import logging
+from typing import Optional, Union
+
+from production.pyjs_emulator.run import server_run_full as pyjs_run_full
+from production.cpp_emulator.run import run_full as cpp_run_full
+from production.trace_sink import TraceSink
+
+logger = logging.getLogger(__name__)
+
+VALIDATORS = {
+    'pyjs': pyjs_run_full,
+    'cpp': cpp_run_full,
+}
+
+
+def run_full(
+        validator: str,
+        src_model_data: Optional[bytes],
+        tgt_model_data: Optional[bytes],
+        trace_data: Union[bytes, TraceSink],
+        cross_check: float = 0.0):
+    '''Returns EmulatorResult of the chosen validator.
+
+    If a cross-check disagrees, the pyjs result is returned, with
+    extra['cross_check'] describing the other one.
+    '''
+    er = VALIDATORS[validator](src_model_data, tgt_model_data, trace_data)
+    if cross_check <= 0 or random.random() >= cross_check:
+        return er
+
+    other = 'cpp' if validator == 'pyjs' else 'pyjs'
+    er2 = VALIDATORS[other](src_model_data, tgt_model_data, trace_data)
+    if er.energy == er2.energy:
+        logger.info(f'{other} agrees with {validator}, energy={er.energy}')
+        return er
+
+    logger.warning(
+        f'Validators disagree: {validator} {er.energy} {er.extra}, '
+        f'{other} {er2.energy} {er2.extra}')
+    if validator != 'pyjs':
+        er, er2 = er2, er
+        other = validator
+    er.extra = dict(er.extra, cross_check=dict(
+        validator=other, energy=er2.energy, extra=er2.extra))
+    return er
@@ -0,0 +1,57 @@
+import pytest
+
+from production.basics import Pos, Diff
+from production.model import Model
+from production.commands import *
+from production import validators
+
+
+def group_trace():
+    d = Diff
+    return [
+        Fission(d(1, 0, 0), 0),
+        Wait(), SMove(d(2, 0, 0)),
+        GFill(d(1, 0, 1), d(2, 0, 0)), GFill(d(0, 0, 1), d(-2, 0, 0)),
+        GVoid(d(1, 0, 1), d(2, 0, 0)), GVoid(d(0, 0, 1), d(-2, 0, 0)),
+        GFill(d(1, 0, 1), d(2, 0, 0)), GFill(d(0, 0, 1), d(-2, 0, 0)),
+        Void(d(1, 0, 1)), SMove(d(-2, 0, 0)),
+        FusionP(d(1, 0, 0)), FusionS(d(-1, 0, 0)),
+        Halt(),
+    ]
+
+
+def target():
+    m = Model(5)
+    m[Pos(2, 0, 1)] = 1
+    m[Pos(3, 0, 1)] = 1
+    return m.compose()
+
+
+@pytest.mark.parametrize('validator', validators.VALIDATORS.keys())
+def test_groups(validator):
+    trace = compose_commands(group_trace())
+    er = validators.run_full(validator, None, target(), trace, cross_check=1.0)
+    assert er.energy is not None, er.extra
+    assert 'cross_check' not in er.extra
+
+
+@pytest.mark.parametrize('validator', validators.VALIDATORS.keys())
+def test_incomplete_group(validator):
+    trace = group_trace()
+    trace[4] = Wait()
+    er = validators.run_full(validator, None, target(), compose_commands(trace), cross_check=1.0)
+    assert er.energy is None
+    assert 'cross_check' not in er.extra
+
+
+def test_structured_errors():
+    trace = group_trace()
+    trace[12] = Wait()
+    er = validators.run_full('cpp', None, target(), compose_commands(trace))
+    assert er.energy is None
+    assert er.extra['step'] == 7
+    assert 'FusionP' in er.extra['error']
+
+    er = validators.run_full('cpp', None, target(), b'\xff')
+    assert er.energy is None
+    assert 'error' in er.extra
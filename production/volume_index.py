@@ -0,0 +1,110 @@
+'''Summed-volume table for counting full voxels in boxes in O(1).
+
+Boxes are given by two inclusive corners in any order, like Region and
+Matrix.count_inside_region.
+'''
+
+from typing import Optional
+
+import numpy as np
+
+from production.basics import Pos
+
+
+class VolumeIndex:
+    '''Prefix sums over a voxel array, with cheap single-voxel edits.
+
+    Edits are applied to the voxel copy right away and remembered as
+    pending corrections; queries add up the corrections that fall into
+    the box. Once there are more than rebuild_threshold of them the
+    table is rebuilt.
+
+    Can stand in for a read-only Model: supports R and [pos].
+    '''
+
+    def __init__(self, voxels: np.ndarray, rebuild_threshold=64):
+        self.R = voxels.shape[0]
+        assert voxels.shape == (self.R,) * 3, voxels.shape
+        self.voxels = voxels.astype(bool)
+        self.rebuild_threshold = rebuild_threshold
+        self._rebuild()
+
+    @staticmethod
+    def from_model(model, rebuild_threshold=64) -> 'VolumeIndex':
+        return VolumeIndex(model.voxels, rebuild_threshold)
+
+    def _rebuild(self):
+        R = self.R
+        table = np.zeros((R + 1, R + 1, R + 1), dtype=np.int32)
+        table[1:, 1:, 1:] = self.voxels.cumsum(0, dtype=np.int32).cumsum(1).cumsum(2)
+        self.table = table
+        self.pending = {}
+
+    def __getitem__(self, pos: Pos) -> bool:
+        assert pos.is_inside_matrix(self.R), pos
+        return bool(self.voxels[pos.x, pos.y, pos.z])
+
+    def __setitem__(self, pos: Pos, value: bool):
+        assert pos.is_inside_matrix(self.R), pos
+        key = (pos.x, pos.y, pos.z)
+        if self.voxels[key] == value:
+            return
+        self.voxels[key] = value
+        delta = self.pending.get(key, 0) + (1 if value else -1)
+        if delta:
+            self.pending[key] = delta
+        else:
+            del self.pending[key]
+        if len(self.pending) > self.rebuild_threshold:
+            self._rebuild()
+
+    def _count(self, x1, x2, y1, y2, z1, z2) -> int:
+        '''Full voxels in [x1, x2) x [y1, y2) x [z1, z2).'''
+        t = self.table
+        result = int(
+            t[x2, y2, z2] - t[x1, y2, z2] - t[x2, y1, z2] - t[x2, y2, z1]
+            + t[x1, y1, z2] + t[x1, y2, z1] + t[x2, y1, z1] - t[x1, y1, z1])
+        for (x, y, z), delta in self.pending.items():
+            if x1 <= x < x2 and y1 <= y < y2 and z1 <= z < z2:
+                result += delta
+        return result
+
+    def count(self, p1: Pos, p2: Pos) -> int:
+        return self._count(
+            min(p1.x, p2.x), max(p1.x, p2.x) + 1,
+            min(p1.y, p2.y), max(p1.y, p2.y) + 1,
+            min(p1.z, p2.z), max(p1.z, p2.z) + 1)
+
+    def is_empty(self, p1: Pos, p2: Pos) -> bool:
+        return self.count(p1, p2) == 0
+
+    def is_full(self, p1: Pos, p2: Pos) -> bool:
+        volume = (abs(p1.x - p2.x) + 1) * (abs(p1.y - p2.y) + 1) * (abs(p1.z - p2.z) + 1)
+        return self.count(p1, p2) == volume
+
+    def slab_count(self, axis: int, lo: int, hi: int) -> int:
+        '''Full voxels with lo <= coordinate[axis] <= hi.'''
+        bounds = [0, self.R] * 3
+        bounds[2 * axis] = lo
+        bounds[2 * axis + 1] = hi + 1
+        return self._count(*bounds)
+
+    def top(self, p1: Pos, p2: Pos) -> Optional[int]:
+        '''Largest y of a full voxel in the box, None if it's empty.
+
+        Binary search over box counts, O(log R) queries.
+        '''
+        x1, x2 = min(p1.x, p2.x), max(p1.x, p2.x) + 1
+        z1, z2 = min(p1.z, p2.z), max(p1.z, p2.z) + 1
+        lo, end = min(p1.y, p2.y), max(p1.y, p2.y) + 1
+        if self._count(x1, x2, lo, end, z1, z2) == 0:
+            return None
+        # invariant: layers [lo, end) of the box are nonempty, [hi, end) are empty
+        hi = end
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self._count(x1, x2, mid, end, z1, z2):
+                lo = mid
+            else:
+                hi = mid
+        return lo
@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+
+from production.basics import Pos
+from production.model import Model
+from production.volume_index import VolumeIndex
+from production import data_files
+
+
+def random_box(R):
+    return (Pos(random.randrange(R), random.randrange(R), random.randrange(R)),
+            Pos(random.randrange(R), random.randrange(R), random.randrange(R)))
+
+
+def box_slices(p1, p2):
+    return tuple(slice(min(a, b), max(a, b) + 1)
+                 for a, b in [(p1.x, p2.x), (p1.y, p2.y), (p1.z, p2.z)])
+
+
+def check_queries(index, voxels):
+    R = voxels.shape[0]
+    for _ in range(30):
+        p1, p2 = random_box(R)
+        sub = voxels[box_slices(p1, p2)]
+        assert index.count(p1, p2) == sub.sum()
+        assert index.is_empty(p1, p2) == (not sub.any())
+        assert index.is_full(p1, p2) == sub.all()
+        ys = np.flatnonzero(sub.any(axis=(0, 2)))
+        expected_top = int(ys[-1]) + min(p1.y, p2.y) if len(ys) else None
+        assert index.top(p1, p2) == expected_top
+
+    for axis in range(3):
+        lo = random.randrange(R)
+        hi = random.randrange(lo, R)
+        assert index.slab_count(axis, lo, hi) == voxels.take(range(lo, hi + 1), axis=axis).sum()
+
+
+def test_model():
+    random.seed(0)
+    m = Model.parse(data_files.lightning_problem('LA004_tgt.mdl'))
+    index = VolumeIndex.from_model(m)
+    assert index.count(Pos(0, 0, 0), Pos(19, 19, 19)) == m.num_full
+    check_queries(index, m.voxels)
+
+
+def test_edits():
+    random.seed(1)
+    R = 7
+    voxels = np.zeros((R, R, R), dtype=bool)
+    index = VolumeIndex(voxels, rebuild_threshold=10)
+    for _ in range(100):
+        p = Pos(random.randrange(R), random.randrange(R), random.randrange(R))
+        value = random.random() < 0.5
+        index[p] = value
+        voxels[p.x, p.y, p.z] = value
+        assert index[p] == value
+        check_queries(index, voxels)